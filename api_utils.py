@@ -1,19 +1,33 @@
 import json
 import os
-from datetime import datetime, timedelta
-from typing import List, Optional, Tuple, Union
-
-import alpaca.trading.enums as enums
-import pandas_market_calendars as mcal
-import requests
-from alpaca.data.historical.stock import StockHistoricalDataClient
-from alpaca.data.models import Bar, BarSet, RawData
-from alpaca.data.requests import StockBarsRequest
-from alpaca.data.timeframe import TimeFrame
-from alpaca.trading.models import Position
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
 from dotenv import load_dotenv
 
+import metrics
 from bcolors import bcolors
+from lite_client import LatestBarsRequest
+from portfolio import PositionSnapshot, format_money, format_percent, format_position
+from screener_cache import ScreenerCache
+
+if TYPE_CHECKING:
+    # Annotations only; the SDK (and pandas with it) loads when a client is
+    # built, and the numpy-backed modules when a function needs them
+    from alpaca.data.historical.stock import StockHistoricalDataClient
+    from alpaca.data.models import Bar, BarSet, RawData
+    from alpaca.trading.client import TradingClient
+    from alpaca.trading.models import Position
+    from alpaca.trading.requests import OrderRequest
+
+    from bar_fetcher import FetchResult, TokenBucket
+    from bar_store import BarStore
+    from orders import OrderBook
+    from records import TickerRecord
 
 # Load the .env file
 load_dotenv()
@@ -23,18 +37,10 @@ FINANCIAL_MODELING_PREP_API_ENDPOINT = os.getenv(
     "FINANCIAL_MODELING_PREP_API_ENDPOINT")
 FINANCIAL_MODELING_PREP_API_KEY = os.getenv("FINANCIAL_MODELING_PREP_API_KEY")
 
-# Define the market calendar
-nyse = mcal.get_calendar("NYSE")
-
-
-def format_money(amount: float) -> str:
-    amount = float(amount)
-    return "-${0:,.2f}".format(amount) if amount < 0 else "${0:,.2f}".format(amount)
 
-
-def format_percent(decimal: float) -> str:
-    decimal = float(decimal) * 100
-    return "-{0:.2f}%".format(decimal) if decimal < 0 else "{0:.2f}%".format(decimal)
+def as_utc(dt: datetime) -> datetime:
+    # Naive datetimes are sent to Alpaca as UTC
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt.astimezone(timezone.utc)
 
 
 """
@@ -68,170 +74,12 @@ position = {
 """
 
 
-def print_position(position: Position) -> None:
-    print(bcolors.BOLD + bcolors.BRIGHT_WHITE_FG + "Position" + bcolors.ENDC)
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Symbol: "
-        + bcolors.MAGENTA_FG
-        + position.symbol
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Exchange: "
-        + (
-            bcolors.BRIGHT_YELLOW_FG
-            if position.exchange == enums.AssetExchange.NYSE
-            else (
-                bcolors.BRIGHT_CYAN_FG
-                if position.exchange == enums.AssetExchange.NASDAQ
-                else (
-                    bcolors.BRIGHT_BLUE_FG
-                    if position.exchange == enums.AssetExchange.AMEX
-                    else bcolors.BRIGHT_RED_FG
-                )
-            )
-        )
-        + position.exchange
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Asset Class: "
-        + bcolors.WHITE_FG
-        + position.asset_class
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Asset Marginable: "
-        + bcolors.WHITE_FG
-        + str(position.asset_marginable)
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Average Entry Price: "
-        + bcolors.WHITE_FG
-        + format_money(position.avg_entry_price)
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Quantity: "
-        + bcolors.WHITE_FG
-        + str(position.qty)
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Side: "
-        + (
-            (
-                bcolors.BRIGHT_GREEN_FG
-                if position.side == enums.PositionSide.LONG
-                else bcolors.BRIGHT_RED_FG
-            )
-            + position.side
-        )
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Market Value: "
-        + bcolors.WHITE_FG
-        + format_money(position.market_value)
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Cost Basis: "
-        + bcolors.WHITE_FG
-        + format_money(position.cost_basis)
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Unrealized P/L: "
-        + (
-            (
-                bcolors.GREEN_FG + "+"
-                if float(position.unrealized_pl) >= 0
-                else bcolors.RED_FG + "-"
-            )
-        )
-        + format_money(abs(float(position.unrealized_pl)))
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Unrealized P/L Percentage: "
-        + (
-            bcolors.GREEN_FG + "+"
-            if float(position.unrealized_plpc) >= 0
-            else bcolors.RED_FG + "-"
-        )
-        + format_percent(abs(float(position.unrealized_plpc)))
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Unrealized Intraday P/L: "
-        + (
-            (
-                bcolors.GREEN_FG + "+"
-                if float(position.unrealized_intraday_pl) >= 0
-                else bcolors.RED_FG + "-"
-            )
-            + format_money(abs(float(position.unrealized_intraday_pl)))
-            + bcolors.ENDC
-        )
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Unrealized Intraday P/L Percentage: "
-        + (
-            bcolors.GREEN_FG + "+"
-            if float(position.unrealized_intraday_plpc) >= 0
-            else bcolors.RED_FG + "-"
-        )
-        + format_percent(abs(float(position.unrealized_intraday_plpc)))
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Current Price: "
-        + bcolors.WHITE_FG
-        + format_money(position.current_price)
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Last Day Price: "
-        + bcolors.WHITE_FG
-        + format_money(position.lastday_price)
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Change Today: "
-        + (
-            (bcolors.GREEN_FG if float(position.change_today) >= 0 else bcolors.RED_FG)
-            + format_money(position.change_today)
-        )
-        + bcolors.ENDC
-    )
-    print(
-        bcolors.BRIGHT_WHITE_FG
-        + "Quantity Available: "
-        + bcolors.WHITE_FG
-        + str(position.qty_available)
-        + bcolors.ENDC
-    )
-
-
-def convert_Bar_to_dict(bar: Bar) -> dict:
+def print_position(position: "Position") -> None:
+    # Parsed once into a snapshot and written as one block
+    sys.stdout.write(format_position(PositionSnapshot.from_position(position)))
+
+
+def convert_Bar_to_dict(bar: "Bar") -> dict:
     return {
         "symbol": bar.symbol,
         "timestamp": bar.timestamp.isoformat(),
@@ -248,11 +96,13 @@ def convert_Bar_to_dict(bar: Bar) -> dict:
 def parse_response_into_tickers(
     response: List[dict], order_by: Optional[str] = "volume"
 ) -> List[str]:
-    response = sorted(response, key=lambda x: x[order_by], reverse=True)
-    return [stock["symbol"] for stock in response]
+    from universe import UniverseSpec, select_universe
+
+    return select_universe(response, UniverseSpec(excluded_chars="", rank_by=(order_by,) if order_by else ()))
 
 
-def get_stock_tickers(order_by: Optional[str] = "volume") -> List[dict]:
+@metrics.timed("api.fetch_stock_tickers")
+def fetch_stock_tickers() -> List[dict]:
     params = {
         "marketCapLowerThan": "3500000000",  # 3.5 billion
         "priceMoreThan": "1",
@@ -263,42 +113,51 @@ def get_stock_tickers(order_by: Optional[str] = "volume") -> List[dict]:
         "isActivelyTrading": "true",
         "apikey": FINANCIAL_MODELING_PREP_API_KEY,
     }
-    response = requests.get(
-        FINANCIAL_MODELING_PREP_API_ENDPOINT, params=params, timeout=10
+    import http_pool
+
+    metrics.count("api_calls")
+    # The pooled session: a kept-alive connection and the default timeouts
+    response = http_pool.get_session().get(
+        FINANCIAL_MODELING_PREP_API_ENDPOINT, params=params
     )  # type: ignore
+    response.raise_for_status()
+
+    # Kept in screener order; ranking happens on the columnar table
+    return response.json()
+
 
-    response = response.json()
-    # order by
-    response = sorted(response, key=lambda x: x[order_by], reverse=True)
+# Shared by every caller in the process, see screener_cache.py
+screener_cache = ScreenerCache(fetch_stock_tickers)
 
-    if not os.path.exists("output"):
-        os.makedirs("output")
-    with open("output/tickers.json", "w") as f:
-        json.dump(response, f, indent=4)
-    with open("output/tickers.json", "r") as f:
-        return json.load(f)
 
+@metrics.timed("get_stock_tickers")
+def get_stock_tickers(order_by: Optional[str] = "volume", cache: Optional[ScreenerCache] = None) -> List["TickerRecord"]:
+    # Served from output/tickers.json until it is older than the cache TTL
+    response = (cache or screener_cache).get()
+    if order_by is None:
+        return response
+    from universe import table_for
 
+    return [response[i] for i in table_for(response).rank((order_by,))]
+
+
+@metrics.timed("get_stock_bars")
 def get_stock_bars(
-    client: StockHistoricalDataClient,
+    client: "StockHistoricalDataClient",
     tickers: List[str],
     start: datetime,
     end: datetime,
-) -> Union[BarSet, RawData] | None:
-    stocks_req = StockBarsRequest(
-        symbol_or_symbols=tickers, start=start, end=end, timeframe=TimeFrame.Minute  # type: ignore
-    )
-    print(f"Requesting stock bars from {start} to {end}.")
-    try:
-        stocks_bars = client.get_stock_bars(stocks_req)
-        return stocks_bars
-    except Exception as e:
-        print(f"Error fetching stock bars: {e}")
-        return None
+) -> Optional["FetchResult"]:
+    # Chunked and rate limited, tickers that fail are listed in .failed
+    from bar_fetcher import fetch_stock_bars
+
+    result = fetch_stock_bars(client, tickers, start, end)
+    return result if result.data or not result.failed else None
 
 
+@metrics.timed("save_stock_bars_to_json")
 def save_stock_bars_to_json(
-    stocks_bars: Union[BarSet, RawData, None], tickers: List[str]
+    stocks_bars: Union["BarSet", "RawData", "FetchResult", None], tickers: List[str]
 ) -> List[str]:
     bad_tickers = []
     if stocks_bars is None:
@@ -320,29 +179,189 @@ def save_stock_bars_to_json(
             f"output/tickers/{ticker.lower()}/{ticker.lower()}_bars.json", "w"
         ) as f:
             json.dump(data, f, indent=4)
+            metrics.count("bytes_written", f.tell())
+        metrics.count("bars_written", len(data))
+    return [ticker for ticker in tickers if ticker not in bad_tickers]
+
+
+@metrics.timed("save_stock_bars")
+def save_stock_bars(
+    stocks_bars: Union["BarSet", "RawData", "FetchResult", None], tickers: List[str], store: "BarStore"
+) -> List[str]:
+    from bar_store import BarBatchWriter
+
+    bad_tickers = []
+    if stocks_bars is None:
+        print("No stock bars data received.")
+        return bad_tickers
+
+    data = stocks_bars if isinstance(stocks_bars, dict) else stocks_bars.data
+    with BarBatchWriter(store) as writer:
+        for ticker in tickers:
+            if not data.get(ticker):
+                print(f"{bcolors.FAIL}Ticker not found", ticker, bcolors.ENDC)
+                bad_tickers.append(ticker)
+                continue
+            writer.write(ticker, data[ticker])
+    print(f"{bcolors.OKCYAN}Saved {writer.written} bars for {len(tickers) - len(bad_tickers)} tickers.{bcolors.ENDC}")
     return [ticker for ticker in tickers if ticker not in bad_tickers]
 
 
+def plan_sync_windows(
+    store: "BarStore", tickers: List[str], start: datetime, end: datetime
+) -> Tuple[datetime, Dict[datetime, List[str]]]:
+    # Only request the bars after each ticker's last sync (or stored bar);
+    # tickers synced up to the same point are fetched in one request.
+    # Returns the end of the sync and {window start: tickers}
+    windows = {}
+    for ticker, synced_ns in store.synced_until(tickers).items():
+        if synced_ns is None:
+            window_start = as_utc(start)
+        else:
+            window_start = datetime.fromtimestamp(
+                synced_ns // 60_000_000_000 * 60, tz=timezone.utc) + timedelta(minutes=1)
+        windows.setdefault(window_start, []).append(ticker)
+
+    # Stop before the current minute, its bar is still forming
+    end = as_utc(end).replace(second=0, microsecond=0) - timedelta(seconds=1)
+    return end, windows
+
+
+@metrics.timed("sync_stock_bars")
+def sync_stock_bars(
+    client: "StockHistoricalDataClient",
+    store: "BarStore",
+    tickers: List[str],
+    start: datetime,
+    end: datetime,
+) -> List[str]:
+    from bar_fetcher import fetch_stock_bars
+    from bar_store import BarBatchWriter
+
+    end, windows = plan_sync_windows(store, tickers, start, end)
+    for window_start, window_tickers in windows.items():
+        if window_start >= end:
+            continue
+        # Stream each chunk's response into the store as it arrives
+        with BarBatchWriter(store) as writer:
+            stocks_bars = fetch_stock_bars(
+                client, window_tickers, window_start, end, on_bars=writer.write_many)
+        store.mark_synced(
+            [ticker for ticker in window_tickers if ticker not in stocks_bars.failed], end)
+    store.flush()
+    print(f"{bcolors.OKGREEN}Synced {len(tickers)} tickers in {len(windows)} windows.{bcolors.ENDC}")
+    return [ticker for ticker in tickers if ticker in store]
+
+
 def filter_tickers(tickers: List[str]) -> List[str]:
     # return [ticker.replace("-", ".") for ticker in tickers]
-    return [ticker for ticker in tickers if "-" not in ticker and "." not in ticker]
+    from universe import UniverseSpec, select_universe
+
+    return select_universe([{"symbol": ticker} for ticker in tickers], UniverseSpec(excluded_chars="-.", rank_by=()))
 
 
 def adjust_for_market_days(start: datetime, end: datetime) -> Tuple[datetime, datetime]:
-    # Adjust the datetime if it's a weekend or holiday
-    while nyse.valid_days(start.date(), end.date()).empty:
-        start -= timedelta(days=1)
-        end -= timedelta(days=1)
-    return start, end
-
-
-def get_current_price(sdhc_client: StockHistoricalDataClient, ticker: str) -> float:
-    bar = sdhc_client.get_stock_bars(
-        StockBarsRequest(
-            symbol_or_symbols=[ticker],
-            start=datetime.now() - timedelta(days=1),
-            end=datetime.now(),
-            timeframe=TimeFrame.Minute,
+    # Adjust the datetime if it's a weekend or holiday: shift both back by
+    # whole days until the range contains a session
+    from market_calendar import get_session_index
+
+    session = get_session_index().session_on_or_before(end)
+    if session is None or session >= start.date():
+        return start, end
+    shift = timedelta(days=(start.date() - session).days)
+    return start - shift, end - shift
+
+
+@metrics.timed("get_latest_prices")
+def get_latest_prices(
+    sdhc_client: "StockHistoricalDataClient",
+    tickers: List[str],
+    store: Optional["BarStore"] = None,
+    max_age: timedelta = timedelta(minutes=2),
+    market=None,
+    bucket: Optional["TokenBucket"] = None,
+) -> Dict[str, float]:
+    # Latest price per ticker: from the stream's MarketData (streaming.py) when
+    # given, else from the bar store when its last bar is recent enough, the
+    # rest in one latest-bar request per 1000 tickers
+    prices = market.prices(tickers) if market is not None else {}
+    missing = [ticker for ticker in tickers if ticker not in prices]
+    if store is not None:
+        cutoff = int((datetime.now(timezone.utc) - max_age).timestamp() * 1e9)
+        store_missing, missing = missing, []
+        for ticker in store_missing:
+            columns = store.read(ticker, cutoff)
+            if len(columns["close"]):
+                prices[ticker] = float(columns["close"][-1])
+            else:
+                missing.append(ticker)
+    from bar_fetcher import DEFAULT_BUCKET, chunk_symbols
+
+    bucket = bucket or DEFAULT_BUCKET
+    for chunk in chunk_symbols(missing, 1000):
+        bucket.acquire()
+        metrics.count("api_calls")
+        try:
+            with metrics.span("api.get_stock_latest_bar"):
+                latest = sdhc_client.get_stock_latest_bar(
+                    LatestBarsRequest(symbol_or_symbols=chunk))
+        except Exception as e:
+            print(f"{bcolors.FAIL}Error fetching latest bars: {e}{bcolors.ENDC}")
+            continue
+        for ticker, bar in latest.items():
+            prices[ticker] = bar["c"] if isinstance(bar, dict) else bar.close
+    return prices
+
+
+def get_current_price(sdhc_client: "StockHistoricalDataClient", ticker: str, market=None) -> float:
+    return get_latest_prices(sdhc_client, [ticker], market=market).get(ticker, 0.0)
+
+
+@dataclass
+class OrderResult:
+    symbol: str
+    qty: float
+    limit_price: Optional[float]
+    status: str
+    order_id: Optional[str] = None
+    client_order_id: Optional[str] = None
+    error: Optional[str] = None
+    latency: float = 0.0
+
+
+@metrics.timed("submit_orders")
+def submit_orders(
+    client: "TradingClient", order_requests: List["OrderRequest"], max_workers: int = 8, book: Optional["OrderBook"] = None
+) -> List[OrderResult]:
+    # Submits concurrently; results come back in request order. With a book,
+    # orders go through it (tracked, journaled, deduplicated by client_order_id)
+    def submit(request: "OrderRequest") -> OrderResult:
+        started = time.perf_counter()
+        result = OrderResult(
+            symbol=request.symbol,
+            qty=request.qty,
+            limit_price=getattr(request, "limit_price", None),
+            status="error",
         )
-    )
-    return bar[ticker][-1].close if bar is not None else 0.0
+        metrics.count("orders_sent")
+        try:
+            if book is not None:
+                order = book.submit(client, request)
+                result.status, result.order_id = order.status, order.id
+            else:
+                order = client.submit_order(request)
+                status = getattr(order, "status", "submitted")
+                result.status = str(getattr(status, "value", status))
+                result.order_id = str(getattr(order, "id", "")) or None
+            result.client_order_id = getattr(order, "client_order_id", None)
+        except Exception as e:
+            result.error = str(e)
+            metrics.count("order_errors")
+        result.latency = time.perf_counter() - started
+        metrics.observe("api.submit_order", result.latency)
+        return result
+
+    if not order_requests:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(order_requests))) as pool:
+        return list(pool.map(submit, order_requests))
@@ -0,0 +1,340 @@
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from bar_store import BarStore, Columns, TimeLike, open_bar_store
+from bcolors import bcolors
+from indicators import IndicatorParams
+from market_calendar import SessionIndex, get_session_index
+from streaming_indicators import IndicatorState
+
+"""
+Offline event-driven backtester over the bar store.
+
+All stored minute bars of the chosen symbols are merged into one timestamp
+ordered stream (each symbol's bars are already sorted, so this is a k-way
+merge of the per-symbol runs). Bars sharing a timestamp form one step: every
+bar first fills the symbol's open orders, then updates its indicator state,
+and once the whole step is in the strategy gets the same two hooks as bot.py
+(decide_sell for held symbols, decide_buy for the others).
+
+Orders only ever fill on a later bar than the one they were decided on:
+market orders at the next regular-session open (plus slippage), limit orders
+when the bar trades through the limit, at the limit or a better open. DAY
+orders expire at the session close, or at the end of after-hours (20:00 ET)
+with extended_hours, which is also what lets them fill on pre/post-market bars.
+"""
+
+EXTENDED_HOURS_NS = 4 * 3600 * 1_000_000_000  # 16:00 -> 20:00 ET
+
+
+@dataclass
+class SimOrder:
+    symbol: str
+    qty: float
+    side: str  # "buy" or "sell"
+    type: str = "limit"  # "limit" or "market"
+    limit_price: Optional[float] = None
+    extended_hours: bool = False
+    submitted_at: int = 0
+    expires_at: int = 0
+    status: str = "new"
+    filled_at: Optional[int] = None
+    filled_price: Optional[float] = None
+
+
+@dataclass
+class SimPosition:
+    symbol: str
+    qty: float
+    avg_entry_price: float
+    current_price: float
+
+    @property
+    def qty_available(self) -> float:
+        return self.qty
+
+    @property
+    def market_value(self) -> float:
+        return self.qty * self.current_price
+
+    @property
+    def unrealized_pl(self) -> float:
+        return self.qty * (self.current_price - self.avg_entry_price)
+
+    @property
+    def unrealized_plpc(self) -> float:
+        return self.current_price / self.avg_entry_price - 1 if self.avg_entry_price else 0.0
+
+
+class Strategy:
+    """bot.py's decision hooks; return an order to place, or None."""
+
+    def decide_sell(self, bt: "Backtest", position: SimPosition) -> Optional[SimOrder]:
+        return None
+
+    def decide_buy(self, bt: "Backtest", symbol: str) -> Optional[SimOrder]:
+        return None
+
+
+class MacdStrategy(Strategy):
+    """The rules bot.py trades on, with its extended-hours DAY limit orders at the last close."""
+
+    def __init__(self, dollars_per_ticker: float = 100, max_positions: int = 20, stop_loss: float = 0.05, rsi_overbought: float = 70) -> None:
+        self.dollars_per_ticker = dollars_per_ticker
+        self.max_positions = max_positions
+        self.stop_loss = stop_loss
+        self.rsi_overbought = rsi_overbought
+
+    def decide_sell(self, bt: "Backtest", position: SimPosition) -> Optional[SimOrder]:
+        values = bt.values(position.symbol)
+        stopped_out = position.unrealized_plpc <= -self.stop_loss
+        turning_down = values["macdHistDeriv"] < 0 and values["macdHistDeriv2"] < 0
+        if not (stopped_out or turning_down):
+            return None
+        return SimOrder(position.symbol, position.qty_available, "sell", limit_price=round(bt.last_price(position.symbol), 2), extended_hours=True)
+
+    def decide_buy(self, bt: "Backtest", symbol: str) -> Optional[SimOrder]:
+        if len(bt.positions) + len(bt.pending) >= self.max_positions:
+            return None
+        values = bt.values(symbol)
+        turning_up = values["macdHist"] < 0 and values["macdHistDeriv"] > 0 and values["macdHistDeriv2"] > 0
+        if not turning_up or not values["rsi"] < self.rsi_overbought:
+            return None
+        price = round(bt.last_price(symbol), 2)
+        qty = self.dollars_per_ticker // price if price > 0 else 0
+        if qty < 1:
+            return None
+        return SimOrder(symbol, qty, "buy", limit_price=price, extended_hours=True)
+
+
+@dataclass
+class BacktestResult:
+    starting_cash: float
+    cash: float
+    equity: float
+    realized_pl: float
+    unrealized_pl: float
+    max_drawdown: float
+    orders: Dict[str, int]
+    trades: List[SimOrder]
+    equity_curve: np.ndarray = field(repr=False)
+    bars: int = 0
+    seconds: float = 0.0
+
+    @property
+    def total_return(self) -> float:
+        return self.equity / self.starting_cash - 1
+
+    @property
+    def bars_per_second(self) -> float:
+        return self.bars / self.seconds if self.seconds else 0.0
+
+
+def merge_bars(store: BarStore, symbols: List[str], start: TimeLike = None, end: TimeLike = None) -> Columns:
+    # One column set for all symbols, ordered by (timestamp, symbol). The
+    # per-symbol runs are each sorted, so the stable sort is a k-way merge of
+    # them (timsort merges the presorted runs) done in C.
+    parts = [store.read(symbol, start, end) for symbol in symbols]
+    ids = np.repeat(np.arange(len(symbols), dtype=np.int32), [len(part["timestamp"]) for part in parts])
+    columns = {"symbol": ids}
+    for name in ("timestamp", "open", "high", "low", "close", "volume"):
+        columns[name] = np.concatenate([part[name] for part in parts]) if parts else np.empty(0)
+    order = np.argsort(columns["timestamp"], kind="stable")
+    return {name: values[order] for name, values in columns.items()}
+
+
+def regular_session_mask(timestamps: np.ndarray, calendar: SessionIndex) -> np.ndarray:
+    i = np.searchsorted(calendar.opens_array, timestamps, side="right") - 1
+    valid = i >= 0
+    closes = calendar.closes_array[np.clip(i, 0, None)]
+    return valid & (timestamps < closes)
+
+
+class Backtest:
+    def __init__(self, strategy: Strategy, store: Optional[BarStore] = None, symbols: Optional[List[str]] = None, cash: float = 100_000.0, params: IndicatorParams = IndicatorParams(), slippage: float = 0.0, market_hours_only: bool = True) -> None:
+        self.strategy = strategy
+        self.store = store or open_bar_store()
+        self.symbols = list(self.store.symbols() if symbols is None else symbols)
+        self.ids = {symbol: sid for sid, symbol in enumerate(self.symbols)}
+        self.starting_cash = self.cash = cash
+        self.params = params
+        self.slippage = slippage
+        self.market_hours_only = market_hours_only
+        self.calendar = get_session_index()
+        self.states = [IndicatorState(params) for _ in self.symbols]
+        self.prices = [0.0] * len(self.symbols)
+        self.positions: Dict[str, SimPosition] = {}
+        self.pending: Dict[str, SimOrder] = {}
+        self.orders: List[SimOrder] = []
+        self.trades: List[SimOrder] = []
+        self.realized_pl = 0.0
+        self.now = 0
+
+    # What the strategy can look at
+
+    def values(self, symbol: str) -> Dict[str, float]:
+        return self.states[self.ids[symbol]].values
+
+    def last_price(self, symbol: str) -> float:
+        return self.prices[self.ids[symbol]]
+
+    def equity(self) -> float:
+        return self.cash + sum(position.market_value for position in self.positions.values())
+
+    # Orders
+
+    def submit(self, order: SimOrder) -> None:
+        order.submitted_at = self.now
+        closes = self.calendar.closes
+        if order.extended_hours:
+            i = np.searchsorted(self.calendar.closes_array, self.now - EXTENDED_HOURS_NS, side="right")
+            order.expires_at = closes[min(i, len(closes) - 1)] + EXTENDED_HOURS_NS
+        else:
+            i = np.searchsorted(self.calendar.closes_array, self.now, side="right")
+            order.expires_at = closes[min(i, len(closes) - 1)]
+        if order.type == "market" and order.extended_hours:
+            # Alpaca only takes limit orders outside regular hours
+            order.status = "rejected"
+        elif order.symbol in self.pending:
+            order.status = "rejected"
+        else:
+            order.status = "accepted"
+            self.pending[order.symbol] = order
+        self.orders.append(order)
+
+    def try_fill(self, order: SimOrder, timestamp: int, open_: float, high: float, low: float, regular: bool) -> None:
+        if timestamp >= order.expires_at:
+            order.status = "expired"
+            del self.pending[order.symbol]
+            return
+        if not regular and not order.extended_hours:
+            return
+        if order.type == "market":
+            price = open_ * (1 + self.slippage if order.side == "buy" else 1 - self.slippage)
+        elif order.side == "buy" and low <= order.limit_price:
+            price = min(open_, order.limit_price)
+        elif order.side == "sell" and high >= order.limit_price:
+            price = max(open_, order.limit_price)
+        else:
+            return
+        del self.pending[order.symbol]
+        if order.side == "buy":
+            self.fill_buy(order, price)
+        else:
+            self.fill_sell(order, price)
+        if order.status == "filled":
+            order.filled_at = timestamp
+            order.filled_price = price
+            self.trades.append(order)
+
+    def fill_buy(self, order: SimOrder, price: float) -> None:
+        cost = order.qty * price
+        if cost > self.cash:
+            order.status = "rejected"
+            return
+        self.cash -= cost
+        position = self.positions.get(order.symbol)
+        if position is None:
+            self.positions[order.symbol] = SimPosition(order.symbol, order.qty, price, price)
+        else:
+            total = position.qty + order.qty
+            position.avg_entry_price = (position.avg_entry_price * position.qty + price * order.qty) / total
+            position.qty = total
+        order.status = "filled"
+
+    def fill_sell(self, order: SimOrder, price: float) -> None:
+        position = self.positions.get(order.symbol)
+        if position is None or position.qty < order.qty:
+            order.status = "rejected"
+            return
+        self.cash += order.qty * price
+        self.realized_pl += order.qty * (price - position.avg_entry_price)
+        position.qty -= order.qty
+        if position.qty == 0:
+            del self.positions[order.symbol]
+        order.status = "filled"
+
+    # The event loop
+
+    def run(self, start: TimeLike = None, end: TimeLike = None, bars: Optional[Columns] = None) -> BacktestResult:
+        # `bars` may be passed in already merged (for the same symbols) to skip re-reading
+        started = time.perf_counter()
+        if bars is None:
+            bars = merge_bars(self.store, self.symbols, start, end)
+        timestamps = bars["timestamp"]
+        regular = regular_session_mask(timestamps, self.calendar).tolist()
+        # Step boundaries: rows sharing a timestamp
+        bounds = np.flatnonzero(np.diff(timestamps)) + 1
+        bounds = [0, *bounds.tolist(), len(timestamps)]
+        sids = bars["symbol"].tolist()
+        ts_list = timestamps.tolist()
+        opens, highs, lows, closes = (bars[name].tolist() for name in ("open", "high", "low", "close"))
+        equity_curve = np.empty(len(bounds) - 1)
+        for step in range(len(bounds) - 1):
+            lo, hi = bounds[step], bounds[step + 1]
+            self.now = ts_list[lo]
+            for row in range(lo, hi):
+                sid = sids[row]
+                symbol = self.symbols[sid]
+                order = self.pending.get(symbol)
+                if order is not None:
+                    self.try_fill(order, ts_list[row], opens[row], highs[row], lows[row], regular[row])
+                self.states[sid].update(highs[row], lows[row], closes[row], ts_list[row])
+                self.prices[sid] = closes[row]
+                position = self.positions.get(symbol)
+                if position is not None:
+                    position.current_price = closes[row]
+            if self.market_hours_only and not regular[lo]:
+                equity_curve[step] = self.equity()
+                continue
+            for row in range(lo, hi):
+                symbol = self.symbols[sids[row]]
+                if symbol in self.pending:
+                    continue
+                position = self.positions.get(symbol)
+                if position is not None:
+                    order = self.strategy.decide_sell(self, position)
+                else:
+                    order = self.strategy.decide_buy(self, symbol)
+                if order is not None:
+                    self.submit(order)
+            equity_curve[step] = self.equity()
+        for order in self.pending.values():
+            order.status = "expired"
+        self.pending.clear()
+        return self.result(equity_curve, len(timestamps), time.perf_counter() - started)
+
+    def result(self, equity_curve: np.ndarray, bars: int, seconds: float) -> BacktestResult:
+        peaks = np.maximum.accumulate(equity_curve) if len(equity_curve) else equity_curve
+        drawdowns = 1 - equity_curve / peaks if len(equity_curve) else equity_curve
+        counts: Dict[str, int] = {}
+        for order in self.orders:
+            counts[order.status] = counts.get(order.status, 0) + 1
+        return BacktestResult(
+            starting_cash=self.starting_cash,
+            cash=self.cash,
+            equity=self.equity(),
+            realized_pl=self.realized_pl,
+            unrealized_pl=sum(position.unrealized_pl for position in self.positions.values()),
+            max_drawdown=float(drawdowns.max()) if len(drawdowns) else 0.0,
+            orders=counts,
+            trades=self.trades,
+            equity_curve=equity_curve,
+            bars=bars,
+            seconds=seconds,
+        )
+
+
+def print_result(result: BacktestResult) -> None:
+    color = bcolors.OKGREEN if result.equity >= result.starting_cash else bcolors.FAIL
+    print(f"{color}Equity {result.equity:,.2f} ({result.total_return:+.2%}), realized {result.realized_pl:+,.2f}, "
+          f"unrealized {result.unrealized_pl:+,.2f}, max drawdown {result.max_drawdown:.2%}{bcolors.ENDC}")
+    print(f"{bcolors.OKCYAN}{len(result.trades)} fills, orders {result.orders}, "
+          f"{result.bars:,} bars in {result.seconds:.2f}s ({result.bars_per_second:,.0f} bars/sec){bcolors.ENDC}")
+
+
+if __name__ == "__main__":
+    print_result(Backtest(MacdStrategy()).run())
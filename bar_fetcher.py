@@ -0,0 +1,185 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple, Union
+
+import metrics
+from bcolors import bcolors
+from records import BarColumns, decode_bars
+
+if TYPE_CHECKING:
+    from alpaca.data.historical.stock import StockHistoricalDataClient
+    from alpaca.data.models import BarSet, RawData
+    from alpaca.data.timeframe import TimeFrame
+
+# Alpaca's free plan allows 200 data API calls per minute
+ALPACA_REQUESTS_PER_MINUTE = 200
+# Responses that mean the request itself is bad, retrying it unchanged won't help
+REJECTED_STATUS_CODES = (400, 404, 422)
+
+
+class TokenBucket:
+    """Thread-safe token bucket, refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute: float = ALPACA_REQUESTS_PER_MINUTE, capacity: Optional[float] = None) -> None:
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity if capacity is not None else max(1.0, rate_per_minute / 10)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        # Blocks until the tokens are available, returns the time spent waiting
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        # Non-blocking: takes the tokens if they are there right now
+        with self.lock:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True
+            return False
+
+
+# Shared by every data API call in this process (bar fetches, latest-bar
+# requests), so the per-minute limit holds across calls, not just within one
+DEFAULT_BUCKET = TokenBucket(ALPACA_REQUESTS_PER_MINUTE)
+
+
+@dataclass
+class FetchResult:
+    # Quacks like a BarSet (.data and [symbol]); each symbol's bars are one
+    # records.BarColumns, decoded as the responses arrive
+    data: Dict[str, BarColumns] = field(default_factory=dict)
+    failed: Dict[str, str] = field(default_factory=dict)
+    requests: int = 0
+    retries: int = 0
+
+    def __getitem__(self, symbol: str) -> list:
+        return self.data[symbol]
+
+
+def chunk_symbols(tickers: List[str], chunk_size: int) -> List[List[str]]:
+    return [tickers[i: i + chunk_size] for i in range(0, len(tickers), chunk_size)]
+
+
+def slice_window(start: datetime, end: datetime, slice_duration: Optional[timedelta]) -> List[Tuple[datetime, datetime]]:
+    if slice_duration is None or end - start <= slice_duration:
+        return [(start, end)]
+    # Alpaca treats both ends as inclusive, so each slice stops just short of the next
+    slices = []
+    while start + slice_duration < end:
+        slices.append((start, start + slice_duration - timedelta(microseconds=1)))
+        start += slice_duration
+    slices.append((start, end))
+    return slices
+
+
+def fetch_stock_bars(
+    client: "StockHistoricalDataClient",
+    tickers: List[str],
+    start: datetime,
+    end: datetime,
+    chunk_size: int = 200,
+    slice_duration: Optional[timedelta] = None,
+    max_workers: int = 4,
+    max_retries: int = 3,
+    backoff: float = 1.0,
+    bucket: Optional[TokenBucket] = None,
+    timeframe: Optional["TimeFrame"] = None,  # minute bars
+    on_bars: Optional[Callable[[Dict[str, list]], None]] = None,
+) -> FetchResult:
+    # Splits the request into symbol chunks x time slices. Slices are fetched in
+    # time order and the chunks of a slice concurrently. Server/network errors are
+    # retried with exponential backoff; a chunk that is rejected outright (4xx) is
+    # split in half so one bad symbol only fails itself.
+    # With on_bars each response is handed over as soon as it arrives (in this
+    # thread, in time order per symbol) instead of being merged into the result.
+    from alpaca.data.requests import StockBarsRequest
+    from alpaca.data.timeframe import TimeFrame
+
+    bucket = bucket or DEFAULT_BUCKET
+    timeframe = timeframe or TimeFrame.Minute  # type: ignore
+    slices = slice_window(start, end, slice_duration)
+    result = FetchResult()
+    parts: Dict[str, List[BarColumns]] = {}
+
+    def fetch(symbols: List[str], slice_index: int, attempt: int) -> Union["BarSet", "RawData"]:
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        bucket.acquire()
+        slice_start, slice_end = slices[slice_index]
+        metrics.count("api_calls")
+        with metrics.span("api.get_stock_bars"):
+            return client.get_stock_bars(
+                StockBarsRequest(
+                    symbol_or_symbols=symbols, start=slice_start, end=slice_end, timeframe=timeframe
+                )
+            )
+
+    print(f"Requesting stock bars for {len(tickers)} tickers from {start} to {end}.")
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for slice_index in range(len(slices)):
+            pending = {}
+
+            def submit(symbols: List[str], attempt: int) -> None:
+                future = pool.submit(fetch, symbols, slice_index, attempt)
+                pending[future] = (symbols, attempt)
+
+            remaining = [ticker for ticker in tickers if ticker not in result.failed]
+            for symbols in chunk_symbols(remaining, chunk_size):
+                submit(symbols, 0)
+
+            while pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                for future in done:
+                    symbols, attempt = pending.pop(future)
+                    result.requests += 1
+                    try:
+                        bars = future.result()
+                    except Exception as e:
+                        rejected = getattr(e, "status_code", None) in REJECTED_STATUS_CODES
+                        if rejected and len(symbols) > 1:
+                            half = len(symbols) // 2
+                            submit(symbols[:half], 0)
+                            submit(symbols[half:], 0)
+                        elif not rejected and attempt < max_retries:
+                            result.retries += 1
+                            metrics.count("api_retries")
+                            submit(symbols, attempt + 1)
+                        else:
+                            print(f"{bcolors.FAIL}Error fetching stock bars for {len(symbols)} tickers: {e}{bcolors.ENDC}")
+                            result.failed.update((symbol, str(e)) for symbol in symbols)
+                        continue
+                    data = bars if isinstance(bars, dict) else bars.data
+                    if metrics.is_enabled():
+                        metrics.count("bars_fetched", sum(len(symbol_bars) for symbol_bars in data.values()))
+                    if on_bars is not None:
+                        on_bars(data)
+                    else:
+                        for symbol, symbol_bars in decode_bars(data).items():
+                            parts.setdefault(symbol, []).append(symbol_bars)
+
+    for symbol, symbol_parts in parts.items():
+        if symbol not in result.failed:
+            result.data[symbol] = BarColumns.concat(symbol, symbol_parts)
+    if result.failed:
+        print(f"{bcolors.WARNING}{len(result.failed)} of {len(tickers)} tickers failed to fetch.{bcolors.ENDC}")
+    return result
@@ -0,0 +1,605 @@
+import hashlib
+import json
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+import metrics
+from bcolors import bcolors
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+"""
+Bar storage backends.
+
+The columnar store keeps the whole universe in one directory:
+
+output/bars/
+    meta.json       --> symbols (interned to ids), row runs per symbol, row count
+    symbol.i4       --> int32 symbol id per row
+    timestamp.i8    --> int64 epoch-nanosecond bar timestamp per row
+    open.f8 ... vwap.f8 --> float64 value per row
+
+Rows are only ever appended; each append of a symbol records a [start, stop)
+run in meta.json so a symbol can be read back without scanning the files.
+Appends drop any bar at or before the symbol's last stored timestamp, so
+runs of a symbol are always in time order and re-fetched overlap is ignored.
+
+pandas is only imported by the functions that need it (frames, parsing
+timestamp strings), so reading and appending columns works without it.
+"""
+
+DEFAULT_COLUMNAR_ROOT = "output/bars"
+DEFAULT_JSON_ROOT = "output/tickers"
+
+PRICE_FIELDS = ("open", "high", "low", "close", "volume", "trade_count", "vwap")
+COLUMN_DTYPES = {
+    "symbol": np.dtype("<i4"),
+    "timestamp": np.dtype("<i8"),
+    **{field: np.dtype("<f8") for field in PRICE_FIELDS},
+}
+
+ROW_BYTES = sum(dtype.itemsize for dtype in COLUMN_DTYPES.values())
+
+Columns = Dict[str, np.ndarray]
+TimeLike = Union[datetime, "pd.Timestamp", str, int, None]
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def to_epoch_ns(value: TimeLike) -> Optional[int]:
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, datetime) and not hasattr(value, "nanosecond"):
+        # Plain datetimes (naive = UTC) without going through pandas
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        delta = value - EPOCH
+        return (delta.days * 86_400 + delta.seconds) * 1_000_000_000 + delta.microseconds * 1000
+    import pandas as pd
+
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is None:
+        ts = ts.tz_localize(timezone.utc)
+    return int(ts.value)
+
+
+def empty_columns(size: int = 0) -> Columns:
+    return {
+        name: np.empty(size, dtype=dtype)
+        for name, dtype in COLUMN_DTYPES.items()
+        if name != "symbol"
+    }
+
+
+def records_to_columns(records: Iterable[dict]) -> Columns:
+    # Converts the legacy JSON records (see api_utils.convert_Bar_to_dict)
+    import pandas as pd
+
+    records = list(records)
+    columns = empty_columns(len(records))
+    columns["timestamp"][:] = pd.to_datetime(
+        [record["timestamp"] for record in records], utc=True
+    ).as_unit("ns").asi8
+    for field in PRICE_FIELDS:
+        columns[field][:] = [
+            np.nan if record.get(field) is None else record[field]
+            for record in records
+        ]
+    return columns
+
+
+def drop_stored_overlap(columns: Columns, last_ns: Optional[int]) -> Columns:
+    # Sort, drop duplicate timestamps and anything at or before the last stored bar
+    timestamps = np.asarray(columns["timestamp"])
+    if np.any(np.diff(timestamps) <= 0):
+        timestamps, keep = np.unique(timestamps, return_index=True)
+        columns = {name: np.asarray(values)[keep] for name, values in columns.items()}
+    if last_ns is not None and len(timestamps) and timestamps[0] <= last_ns:
+        first = int(np.searchsorted(timestamps, last_ns, "right"))
+        columns = {name: np.asarray(values)[first:] for name, values in columns.items()}
+    return columns
+
+
+def columns_to_frame(columns: Columns) -> "pd.DataFrame":
+    import pandas as pd
+
+    # Same shape stock_analysis.py builds from the legacy JSON files
+    df = pd.DataFrame(
+        {field: np.asarray(columns[field]) for field in PRICE_FIELDS},
+        index=pd.DatetimeIndex(
+            pd.to_datetime(np.asarray(columns["timestamp"]), unit="ns", utc=True),
+            name="timestamp",
+        ),
+    )
+    return df
+
+
+class BarStore(ABC):
+    """Interface shared by the bar storage backends."""
+
+    root: str
+    _watermarks: Optional[Dict[str, int]] = None
+    _watermarks_dirty = False
+
+    @abstractmethod
+    def symbols(self) -> List[str]:
+        ...
+
+    @abstractmethod
+    def append(self, symbol: str, columns: Columns) -> int:
+        ...
+
+    def append_many(self, segments: Iterable[Tuple[str, int, int]], columns: Columns) -> int:
+        # Rows [lo, hi) of `columns` for each (symbol, lo, hi)
+        return sum(
+            self.append(symbol, {name: values[lo:hi] for name, values in columns.items()})
+            for symbol, lo, hi in segments
+        )
+
+    @abstractmethod
+    def read(self, symbol: str, start: TimeLike = None, end: TimeLike = None) -> Columns:
+        ...
+
+    def last_timestamp(self, symbol: str) -> Optional[int]:
+        timestamps = self.read(symbol)["timestamp"]
+        return int(timestamps[-1]) if len(timestamps) else None
+
+    def last_timestamps(self, symbols: Iterable[str]) -> Dict[str, Optional[int]]:
+        return {symbol: self.last_timestamp(symbol) for symbol in symbols}
+
+    def data_version(self) -> str:
+        # Changes whenever bars are added; keys cached results derived from the store
+        symbols = self.symbols()
+        last = self.last_timestamps(symbols)
+        return hashlib.sha1(json.dumps([[symbol, last[symbol]] for symbol in symbols]).encode()).hexdigest()[:16]
+
+    # -- incremental sync watermarks ----------------------------------------
+    # A symbol may not trade for a while, so the last stored bar alone would
+    # keep re-requesting the same quiet window. The watermark records the end
+    # of the last successful fetch per symbol.
+
+    @property
+    def watermarks_path(self) -> str:
+        return os.path.join(self.root, "sync.json")
+
+    def watermarks(self) -> Dict[str, int]:
+        if self._watermarks is None:
+            self._watermarks = {}
+            if os.path.exists(self.watermarks_path):
+                with open(self.watermarks_path, "r") as f:
+                    self._watermarks = json.load(f)
+        return self._watermarks
+
+    def mark_synced(self, symbols: Iterable[str], until: TimeLike) -> None:
+        until_ns = to_epoch_ns(until)
+        watermarks = self.watermarks()
+        for symbol in symbols:
+            symbol = symbol.upper()
+            watermarks[symbol] = max(watermarks.get(symbol, until_ns), until_ns)
+        self._watermarks_dirty = True
+
+    def synced_until(self, symbols: Iterable[str]) -> Dict[str, Optional[int]]:
+        watermarks = self.watermarks()
+        synced = {}
+        for symbol, last_ns in self.last_timestamps(symbols).items():
+            candidates = [ns for ns in (last_ns, watermarks.get(symbol.upper())) if ns is not None]
+            synced[symbol] = max(candidates) if candidates else None
+        return synced
+
+    def flush(self) -> None:
+        if not self._watermarks_dirty:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp_path = self.watermarks_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self._watermarks, f, separators=(",", ":"))
+        os.replace(tmp_path, self.watermarks_path)
+        self._watermarks_dirty = False
+
+    def read_frame(
+        self, symbol: str, start: TimeLike = None, end: TimeLike = None
+    ) -> "pd.DataFrame":
+        return columns_to_frame(self.read(symbol, start, end))
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol.upper() in self.symbols()
+
+    def __enter__(self) -> "BarStore":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
+
+
+class ColumnarBarStore(BarStore):
+    def __init__(self, root: str = DEFAULT_COLUMNAR_ROOT, readonly: bool = False) -> None:
+        # readonly: another process may be appending, so rows past meta.json
+        # are left alone rather than dropped as a crashed append
+        self.root = root
+        self.readonly = readonly
+        self._symbol_ids: Dict[str, int] = {}
+        self._symbols: List[str] = []
+        self._runs: Dict[int, List[List[int]]] = {}
+        self._rows = 0
+        self._maps: Dict[str, np.memmap] = {}
+        self._dirty = False
+        self._load_meta()
+
+    # -- metadata -----------------------------------------------------------
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.root, "meta.json")
+
+    def column_path(self, name: str) -> str:
+        return os.path.join(self.root, name + "." + COLUMN_DTYPES[name].str[1:])
+
+    def _load_meta(self) -> None:
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r") as f:
+            meta = json.load(f)
+        self._symbols = meta["symbols"]
+        self._symbol_ids = {symbol: i for i, symbol in enumerate(self._symbols)}
+        self._runs = {int(sid): runs for sid, runs in meta["runs"].items()}
+        self._rows = meta["rows"]
+        if self.readonly:
+            return
+        # Drop any rows written after the last committed meta.json (crash mid-append)
+        for name, dtype in COLUMN_DTYPES.items():
+            path = self.column_path(name)
+            if os.path.exists(path) and os.path.getsize(path) > self._rows * dtype.itemsize:
+                with open(path, "r+b") as f:
+                    f.truncate(self._rows * dtype.itemsize)
+
+    def flush(self) -> None:
+        super().flush()
+        if not self._dirty:
+            return
+        meta = {
+            "version": 1,
+            "symbols": self._symbols,
+            "runs": {str(sid): runs for sid, runs in self._runs.items()},
+            "rows": self._rows,
+        }
+        tmp_path = self.meta_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f, separators=(",", ":"))
+        os.replace(tmp_path, self.meta_path)
+        self._dirty = False
+
+    def symbols(self) -> List[str]:
+        return [symbol for symbol in self._symbols if self._runs.get(self._symbol_ids[symbol])]
+
+    def __contains__(self, symbol: str) -> bool:
+        sid = self._symbol_ids.get(symbol.upper())
+        return sid is not None and bool(self._runs.get(sid))
+
+    def symbol_id(self, symbol: str) -> int:
+        symbol = symbol.upper()
+        if symbol not in self._symbol_ids:
+            self._symbol_ids[symbol] = len(self._symbols)
+            self._symbols.append(symbol)
+            self._dirty = True
+        return self._symbol_ids[symbol]
+
+    def __len__(self) -> int:
+        return self._rows
+
+    def data_version(self) -> str:
+        # Rows are append-only, so the row count and runs identify the contents
+        runs = json.dumps([self._rows, self._symbols, sorted(self._runs.items())])
+        return hashlib.sha1(runs.encode()).hexdigest()[:16]
+
+    # -- writing ------------------------------------------------------------
+
+    def last_timestamp(self, symbol: str) -> Optional[int]:
+        sid = self._symbol_ids.get(symbol.upper())
+        if sid is None or not self._runs.get(sid):
+            return None
+        return int(self.column("timestamp")[self._runs[sid][-1][1] - 1])
+
+    def _check_writable(self) -> None:
+        if self.readonly:
+            raise ValueError(f"Bar store {self.root} is open read-only")
+
+    def append(self, symbol: str, columns: Columns) -> int:
+        self._check_writable()
+        columns = drop_stored_overlap(columns, self.last_timestamp(symbol))
+        count = len(columns["timestamp"])
+        if count == 0:
+            return 0
+        sid = self.symbol_id(symbol)
+        os.makedirs(self.root, exist_ok=True)
+        self._maps.clear()
+        for name, dtype in COLUMN_DTYPES.items():
+            if name == "symbol":
+                values = np.full(count, sid, dtype=dtype)
+            else:
+                values = np.ascontiguousarray(columns[name], dtype=dtype)
+            with open(self.column_path(name), "ab") as f:
+                f.write(values.tobytes())
+        runs = self._runs.setdefault(sid, [])
+        if runs and runs[-1][1] == self._rows:
+            runs[-1][1] += count
+        else:
+            runs.append([self._rows, self._rows + count])
+        self._rows += count
+        self._dirty = True
+        metrics.count("bars_written", count)
+        metrics.count("bytes_written", count * ROW_BYTES)
+        return count
+
+    def append_many(self, segments: Iterable[Tuple[str, int, int]], columns: Columns) -> int:
+        # Same as append() per segment, but one write per column for all of them
+        self._check_writable()
+        parts = []
+        last: Dict[str, Optional[int]] = {}  # including the parts not written yet
+        for symbol, lo, hi in segments:
+            symbol = symbol.upper()
+            if symbol not in last:
+                last[symbol] = self.last_timestamp(symbol)
+            part = drop_stored_overlap({name: columns[name][lo:hi] for name in COLUMN_DTYPES if name != "symbol"}, last[symbol])
+            if len(part["timestamp"]):
+                parts.append((self.symbol_id(symbol), part))
+                last[symbol] = int(part["timestamp"][-1])
+        count = sum(len(part["timestamp"]) for _, part in parts)
+        if count == 0:
+            return 0
+        os.makedirs(self.root, exist_ok=True)
+        self._maps.clear()
+        for name, dtype in COLUMN_DTYPES.items():
+            if name == "symbol":
+                values = np.repeat([sid for sid, _ in parts], [len(part["timestamp"]) for _, part in parts]).astype(dtype)
+            else:
+                values = np.concatenate([np.asarray(part[name], dtype=dtype) for _, part in parts])
+            with open(self.column_path(name), "ab") as f:
+                f.write(values.tobytes())
+        for sid, part in parts:
+            size = len(part["timestamp"])
+            runs = self._runs.setdefault(sid, [])
+            if runs and runs[-1][1] == self._rows:
+                runs[-1][1] += size
+            else:
+                runs.append([self._rows, self._rows + size])
+            self._rows += size
+        self._dirty = True
+        metrics.count("bars_written", count)
+        metrics.count("bytes_written", count * ROW_BYTES)
+        return count
+
+    # -- reading ------------------------------------------------------------
+
+    def column(self, name: str) -> np.ndarray:
+        # Memory-mapped view over the whole column, shared by every read
+        if self._rows == 0:
+            return np.empty(0, dtype=COLUMN_DTYPES[name])
+        if name not in self._maps:
+            self._maps[name] = np.memmap(
+                self.column_path(name),
+                dtype=COLUMN_DTYPES[name],
+                mode="r",
+                shape=(self._rows,),
+            )
+        return self._maps[name]
+
+    def _run_slices(self, symbol: str, start: TimeLike, end: TimeLike) -> List[Tuple[int, int]]:
+        sid = self._symbol_ids.get(symbol.upper())
+        if sid is None:
+            return []
+        start_ns, end_ns = to_epoch_ns(start), to_epoch_ns(end)
+        timestamps = self.column("timestamp")
+        slices = []
+        for run_start, run_stop in self._runs.get(sid, []):
+            run = timestamps[run_start:run_stop]
+            lo = 0 if start_ns is None else int(np.searchsorted(run, start_ns, "left"))
+            hi = len(run) if end_ns is None else int(np.searchsorted(run, end_ns, "right"))
+            if lo < hi:
+                slices.append((run_start + lo, run_start + hi))
+        return slices
+
+    def read(self, symbol: str, start: TimeLike = None, end: TimeLike = None) -> Columns:
+        slices = self._run_slices(symbol, start, end)
+        if not slices:
+            return empty_columns()
+        columns = {}
+        for name in COLUMN_DTYPES:
+            if name == "symbol":
+                continue
+            column = self.column(name)
+            if len(slices) == 1:
+                lo, hi = slices[0]
+                columns[name] = column[lo:hi]
+            else:
+                columns[name] = np.concatenate([column[lo:hi] for lo, hi in slices])
+        return columns
+
+
+class JsonBarStore(BarStore):
+    """Legacy layout: output/tickers/<sym>/<sym>_bars.json, one dict per bar."""
+
+    def __init__(self, root: str = DEFAULT_JSON_ROOT, indent: Optional[int] = 4) -> None:
+        self.root = root
+        self.indent = indent
+
+    def path(self, symbol: str) -> str:
+        return os.path.join(self.root, symbol.lower(), f"{symbol.lower()}_bars.json")
+
+    def symbols(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name.upper()
+            for name in os.listdir(self.root)
+            if os.path.exists(self.path(name))
+        )
+
+    def append(self, symbol: str, columns: Columns) -> int:
+        import pandas as pd
+
+        records = self._load(symbol)
+        last_ns = to_epoch_ns(records[-1]["timestamp"]) if records else None
+        columns = drop_stored_overlap(columns, last_ns)
+        if len(columns["timestamp"]) == 0:
+            return 0
+        records.extend(
+            {
+                "symbol": symbol.upper(),
+                "timestamp": pd.Timestamp(int(ts), tz=timezone.utc).isoformat(),
+                **{
+                    field: None if np.isnan(columns[field][i]) else float(columns[field][i])
+                    for field in PRICE_FIELDS
+                },
+            }
+            for i, ts in enumerate(columns["timestamp"])
+        )
+        os.makedirs(os.path.dirname(self.path(symbol)), exist_ok=True)
+        with open(self.path(symbol), "w") as f:
+            json.dump(records, f, indent=self.indent)
+            metrics.count("bytes_written", f.tell())
+        metrics.count("bars_written", len(columns["timestamp"]))
+        return len(columns["timestamp"])
+
+    def _load(self, symbol: str) -> List[dict]:
+        if not os.path.exists(self.path(symbol)):
+            return []
+        with open(self.path(symbol), "r") as f:
+            return json.load(f)
+
+    def read(self, symbol: str, start: TimeLike = None, end: TimeLike = None) -> Columns:
+        columns = records_to_columns(self._load(symbol))
+        start_ns, end_ns = to_epoch_ns(start), to_epoch_ns(end)
+        mask = np.ones(len(columns["timestamp"]), dtype=bool)
+        if start_ns is not None:
+            mask &= columns["timestamp"] >= start_ns
+        if end_ns is not None:
+            mask &= columns["timestamp"] <= end_ns
+        return {name: values[mask] for name, values in columns.items()}
+
+
+# Field name -> key in the raw API payload (what alpaca.data.models.Bar maps from)
+RAW_BAR_KEYS = {
+    "open": "o",
+    "high": "h",
+    "low": "l",
+    "close": "c",
+    "volume": "v",
+    "trade_count": "n",
+    "vwap": "vw",
+}
+
+
+class BarBatchWriter:
+    """
+    Copies bars straight into preallocated column buffers and appends them to
+    the store every batch_size bars, so memory is bounded by the batch rather
+    than the universe. Accepts alpaca Bar models, raw API dicts or
+    records.BarColumns; none is turned into an intermediate dict or ISO string.
+    """
+
+    def __init__(self, store: BarStore, batch_size: int = 65536) -> None:
+        self.store = store
+        self.batch_size = batch_size
+        self.buffers = empty_columns(batch_size)
+        self.segments: List[Tuple[str, int, int]] = []
+        self.size = 0
+        self.written = 0
+
+    def write(self, symbol: str, bars: list) -> None:
+        pos = 0
+        while pos < len(bars):
+            if self.size == self.batch_size:
+                self.flush()
+            take = min(len(bars) - pos, self.batch_size - self.size)
+            self._fill(symbol, bars[pos: pos + take])
+            pos += take
+
+    def write_many(self, bars_by_symbol: Dict[str, list]) -> None:
+        for symbol, bars in bars_by_symbol.items():
+            self.write(symbol, bars)
+
+    def _fill(self, symbol: str, bars: list) -> None:
+        lo, hi = self.size, self.size + len(bars)
+        columns = getattr(bars, "columns", None)
+        if columns is not None:
+            # Already decoded (records.BarColumns), a straight copy
+            for name, values in self.buffers.items():
+                values[lo:hi] = columns[name]
+            self.segments.append((symbol, lo, hi))
+            self.size = hi
+            return
+        import pandas as pd
+
+        if isinstance(bars[0], dict):
+            timestamps = pd.to_datetime([bar["t"] for bar in bars], utc=True, format="ISO8601")
+            for field, key in RAW_BAR_KEYS.items():
+                self.buffers[field][lo:hi] = [bar.get(key) for bar in bars]
+        else:
+            timestamps = pd.to_datetime([bar.timestamp for bar in bars], utc=True)
+            for field in PRICE_FIELDS:
+                self.buffers[field][lo:hi] = [getattr(bar, field) for bar in bars]
+        self.buffers["timestamp"][lo:hi] = timestamps.as_unit("ns").asi8
+        self.segments.append((symbol, lo, hi))
+        self.size = hi
+
+    def flush(self) -> None:
+        self.written += self.store.append_many(self.segments, self.buffers)
+        self.store.flush()
+        self.segments.clear()
+        self.size = 0
+
+    def __enter__(self) -> "BarBatchWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.flush()
+
+
+BAR_STORES = {
+    "columnar": (ColumnarBarStore, DEFAULT_COLUMNAR_ROOT),
+    "json": (JsonBarStore, DEFAULT_JSON_ROOT),
+}
+
+
+def open_bar_store(kind: str = "columnar", root: Optional[str] = None) -> BarStore:
+    if kind not in BAR_STORES:
+        raise ValueError(f"Unknown bar store {kind!r}, expected one of {list(BAR_STORES)}")
+    store_cls, default_root = BAR_STORES[kind]
+    return store_cls(root or default_root)
+
+
+def load_bars_frame(
+    symbol: str, start: TimeLike = None, end: TimeLike = None
+) -> "pd.DataFrame":
+    # Prefer the columnar store, fall back to the legacy JSON tree
+    store = open_bar_store("columnar")
+    if symbol.upper() not in store:
+        store = open_bar_store("json")
+    return store.read_frame(symbol, start, end)
+
+
+def migrate_json_tree(
+    source: str = DEFAULT_JSON_ROOT, destination: str = DEFAULT_COLUMNAR_ROOT
+) -> Tuple[int, int]:
+    json_store = JsonBarStore(source)
+    symbols = json_store.symbols()
+    rows = 0
+    with ColumnarBarStore(destination) as store:
+        existing = set(store.symbols())
+        for symbol in symbols:
+            if symbol in existing:
+                print(f"{bcolors.WARNING}Skipping {symbol}, already migrated.{bcolors.ENDC}")
+                continue
+            rows += store.append(symbol, json_store.read(symbol))
+    print(f"{bcolors.OKGREEN}Migrated {len(symbols)} tickers ({rows} bars) from {source} to {destination}.{bcolors.ENDC}")
+    return len(symbols), rows
+
+
+if __name__ == "__main__":
+    migrate_json_tree()
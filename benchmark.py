@@ -0,0 +1,680 @@
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from datetime import datetime, timedelta, timezone
+from multiprocessing import get_context
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from bcolors import bcolors
+
+"""
+Benchmarks for the screen -> fetch -> save -> analyse -> order hot paths.
+
+Each benchmark builds its synthetic inputs (bars, screener payload, orders)
+in a temporary directory, then times one operation repeatedly. Results hold
+ops/sec, items/sec (bars, tickers, orders...), p50/p99 latency per operation
+and the peak RSS of the process that ran it. Every benchmark runs in a fresh
+spawned process by default, so the peak RSS is its own. The cold_start_*
+benchmarks time whole interpreter runs (import, then the first orders against
+fake_server.py), lite_client against the Alpaca SDK.
+
+Results are written to output/benchmarks/<timestamp>.json and compared with
+the previous run (or --baseline), flagging ops/sec regressions.
+
+    python benchmark.py                      # everything
+    python benchmark.py --only indicators adjust_for_market_days
+"""
+
+DEFAULT_RESULTS_DIR = "output/benchmarks"
+
+
+@dataclass
+class BenchmarkConfig:
+    symbols: int = 200
+    bars: int = 390  # one regular session of minute bars per symbol
+    screener_size: int = 6000
+    orders: int = 100
+    order_latency: float = 0.002  # seconds per mock submit_order call
+    min_time: float = 1.0
+    min_ops: int = 5
+    seed: int = 0
+
+
+@dataclass
+class BenchmarkResult:
+    name: str
+    ops: int
+    items_per_op: int
+    seconds: float
+    ops_per_sec: float
+    items_per_sec: float
+    p50_ms: float
+    p99_ms: float
+    peak_rss_mb: float
+
+
+# name -> factory(config) returning (operation, items per operation)
+BENCHMARKS: Dict[str, Callable[[BenchmarkConfig], Tuple[Callable[[], object], int]]] = {}
+
+
+def benchmark(name: str):
+    def register(factory):
+        BENCHMARKS[name] = factory
+        return factory
+
+    return register
+
+
+# -- synthetic data ---------------------------------------------------------
+
+SESSION_START = datetime(2024, 7, 26, 13, 30, tzinfo=timezone.utc)
+
+
+def synthetic_symbols(count: int) -> List[str]:
+    return [f"S{i:04d}" for i in range(count)]
+
+
+def synthetic_raw_bars(config: BenchmarkConfig) -> Dict[str, List[dict]]:
+    # Raw API payload ({symbol: [{t, o, h, l, c, v, n, vw}]}), random-walk prices
+    rng = np.random.default_rng(config.seed)
+    stamps = [(SESSION_START + timedelta(minutes=i)).strftime("%Y-%m-%dT%H:%M:%SZ") for i in range(config.bars)]
+    data = {}
+    for symbol in synthetic_symbols(config.symbols):
+        close = 10 * np.exp(np.cumsum(rng.normal(0, 0.002, config.bars)))
+        spread = np.abs(rng.normal(0, 0.01, config.bars)) * close
+        volume = rng.integers(100, 10_000, config.bars)
+        data[symbol] = [
+            {"t": stamps[i], "o": float(close[i - 1] if i else close[0]), "h": float(close[i] + spread[i]),
+             "l": float(close[i] - spread[i]), "c": float(close[i]), "v": float(volume[i]),
+             "n": float(volume[i] // 10), "vw": float(close[i])}
+            for i in range(config.bars)
+        ]
+    return data
+
+
+def synthetic_screener(config: BenchmarkConfig) -> List[dict]:
+    rng = random.Random(config.seed)
+    exchanges = ("NASDAQ", "NYSE", "AMEX", "TSX")
+    payload = []
+    for i in range(config.screener_size):
+        symbol = f"T{i:04d}" + (rng.choice(("", "", "", "", "-B", ".A")))
+        payload.append({
+            "symbol": symbol, "price": rng.uniform(1, 20), "volume": rng.randint(1_000, 50_000_000),
+            "marketCap": rng.randint(10_000_000, 3_500_000_000), "beta": rng.uniform(-1, 3),
+            "exchangeShortName": rng.choice(exchanges), "isEtf": rng.random() < 0.1,
+            "isFund": False, "isActivelyTrading": True,
+        })
+    return payload
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+_temp_dirs: List[str] = []
+
+
+def in_temp_dir() -> str:
+    # Benchmarks write under ./output like the bot does; keep that out of the repo
+    path = tempfile.mkdtemp(prefix="bench-")
+    _temp_dirs.append(path)
+    os.chdir(path)
+    return path
+
+
+# -- benchmarks -------------------------------------------------------------
+
+@benchmark("get_stock_tickers")
+def bench_get_stock_tickers(config: BenchmarkConfig):
+    import api_utils
+    from screener_cache import ScreenerCache
+    from universe import UniverseSpec, select_universe
+
+    in_temp_dir()
+    payload = synthetic_screener(config)
+    cache = ScreenerCache(lambda: payload, path="output/tickers.json")
+    cache.refresh()
+
+    def op():
+        # A fresh list each time, as after a screener refresh (no table cache hit)
+        cache.payload = list(payload)
+        # paper_bot's screening: one table, filtered and ranked in one pass
+        return select_universe(api_utils.get_stock_tickers(None, cache), UniverseSpec(excluded_chars="-.", rank_by=("volume",)))
+
+    return op, config.screener_size
+
+
+@benchmark("select_universe_cached")
+def bench_select_universe_cached(config: BenchmarkConfig):
+    from universe import UniverseSpec, select_universe
+
+    payload = synthetic_screener(config)
+    spec = UniverseSpec(exchanges=("NASDAQ", "NYSE", "AMEX"), exclude_etfs=True, top_k=200)
+    return (lambda: select_universe(payload, spec)), config.screener_size
+
+
+@benchmark("convert_Bar_to_dict")
+def bench_convert_bar_to_dict(config: BenchmarkConfig):
+    from alpaca.data.models import BarSet
+
+    import api_utils
+
+    bars = [bar for symbol_bars in BarSet(synthetic_raw_bars(config)).data.values() for bar in symbol_bars]
+    return (lambda: [api_utils.convert_Bar_to_dict(bar) for bar in bars]), len(bars)
+
+
+@benchmark("decode_bars_models")
+def bench_decode_bars_models(config: BenchmarkConfig):
+    from alpaca.data.models import BarSet
+
+    raw = synthetic_raw_bars(config)
+    return (lambda: BarSet(raw)), config.symbols * config.bars
+
+
+@benchmark("decode_bars_columns")
+def bench_decode_bars_columns(config: BenchmarkConfig):
+    from records import decode_bars
+
+    raw = synthetic_raw_bars(config)
+    return (lambda: decode_bars(raw)), config.symbols * config.bars
+
+
+@benchmark("decode_tickers")
+def bench_decode_tickers(config: BenchmarkConfig):
+    from records import decode_tickers
+
+    payload = synthetic_screener(config)
+    return (lambda: decode_tickers(payload)), config.screener_size
+
+
+@benchmark("save_stock_bars_to_json")
+def bench_save_stock_bars_to_json(config: BenchmarkConfig):
+    from alpaca.data.models import BarSet
+
+    import api_utils
+
+    in_temp_dir()
+    barset = BarSet(synthetic_raw_bars(config))
+    tickers = list(barset.data)
+
+    def op():
+        with quiet():
+            api_utils.save_stock_bars_to_json(barset, tickers)
+
+    return op, config.symbols * config.bars
+
+
+@benchmark("save_stock_bars_columnar")
+def bench_save_stock_bars_columnar(config: BenchmarkConfig):
+    import api_utils
+    from bar_store import ColumnarBarStore
+
+    root = in_temp_dir()
+    raw = synthetic_raw_bars(config)
+    tickers = list(raw)
+    runs = itertools.count()
+
+    def op():
+        # A new store every time; appending to the same one would drop the overlap
+        with quiet():
+            api_utils.save_stock_bars(raw, tickers, ColumnarBarStore(os.path.join(root, f"bars{next(runs)}")))
+
+    return op, config.symbols * config.bars
+
+
+def _stored_bars(config: BenchmarkConfig) -> List[str]:
+    import api_utils
+    from bar_store import ColumnarBarStore, JsonBarStore
+
+    in_temp_dir()
+    raw = synthetic_raw_bars(config)
+    tickers = list(raw)
+    with quiet():
+        api_utils.save_stock_bars(raw, tickers, ColumnarBarStore())
+        api_utils.save_stock_bars(raw, tickers, JsonBarStore())
+    return tickers
+
+
+@benchmark("read_bars_columnar")
+def bench_read_bars_columnar(config: BenchmarkConfig):
+    from bar_store import load_bars_frame
+
+    tickers = _stored_bars(config)
+    # One ticker per op, the way stock_analysis.py loads its chart data
+    cycle = itertools.cycle(tickers)
+    return (lambda: load_bars_frame(next(cycle))), config.bars
+
+
+@benchmark("read_bars_json")
+def bench_read_bars_json(config: BenchmarkConfig):
+    from bar_store import open_bar_store
+
+    tickers = _stored_bars(config)
+    store = open_bar_store("json")
+    cycle = itertools.cycle(tickers)
+    return (lambda: store.read_frame(next(cycle))), config.bars
+
+
+@benchmark("indicators")
+def bench_indicators(config: BenchmarkConfig):
+    from bar_store import open_bar_store
+    from indicators import compute_indicators, load_panel
+
+    tickers = _stored_bars(config)
+    store = open_bar_store()
+    return (lambda: compute_indicators(load_panel(store, tickers))), config.symbols * config.bars
+
+
+@benchmark("streaming_indicators")
+def bench_streaming_indicators(config: BenchmarkConfig):
+    from streaming_indicators import IndicatorState
+
+    raw = synthetic_raw_bars(config)
+    bars = [(bar["h"], bar["l"], bar["c"]) for bar in next(iter(raw.values()))]
+
+    def op():
+        state = IndicatorState()
+        for high, low, close in bars:
+            state.update(high, low, close)
+
+    return op, config.bars
+
+
+@benchmark("resample_universe")
+def bench_resample_universe(config: BenchmarkConfig):
+    from bar_store import ColumnarBarStore
+    from resample import TIMEFRAMES, Resampler, resample
+
+    _stored_bars(config)
+    resampler = Resampler(ColumnarBarStore())
+    calendar = resampler.calendar
+    symbols = resampler.store.symbols()
+
+    def op():
+        # Every timeframe of the whole universe, one pass each
+        symbol_ids, minutes = resampler.gather(symbols, [None] * len(symbols))
+        return [resample(symbol_ids, minutes, name, calendar) for name in TIMEFRAMES]
+
+    return op, config.symbols * config.bars
+
+
+@benchmark("resample_pandas_per_ticker")
+def bench_resample_pandas_per_ticker(config: BenchmarkConfig):
+    from bar_store import ColumnarBarStore
+
+    tickers = _stored_bars(config)
+    store = ColumnarBarStore()
+    rules = {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum", "trade_count": "sum"}
+
+    def op():
+        # The per-ticker alternative (clock-aligned, no session handling)
+        for ticker in tickers:
+            frame = store.read_frame(ticker)
+            for rule in ("5min", "15min", "1h", "1D"):
+                frame.resample(rule).agg(rules)
+
+    return op, config.symbols * config.bars
+
+
+@benchmark("adjust_for_market_days")
+def bench_adjust_for_market_days(config: BenchmarkConfig):
+    import api_utils
+    from market_calendar import get_session_index
+
+    get_session_index()
+    rng = random.Random(config.seed)
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    windows = []
+    for _ in range(1000):
+        end = base + timedelta(minutes=rng.randrange(365 * 24 * 60))
+        windows.append((end - timedelta(minutes=100), end))
+
+    def op():
+        for start, end in windows:
+            api_utils.adjust_for_market_days(start, end)
+
+    return op, len(windows)
+
+
+@benchmark("submit_orders")
+def bench_submit_orders(config: BenchmarkConfig):
+    from alpaca.trading.enums import OrderSide, TimeInForce
+    from alpaca.trading.requests import LimitOrderRequest
+
+    import api_utils
+    from replay import FakeTradingClient
+
+    client = FakeTradingClient(cash=1e12, latency=config.order_latency)
+    requests = [
+        LimitOrderRequest(symbol=symbol, qty=1, side=OrderSide.BUY, time_in_force=TimeInForce.DAY, limit_price=10.0, extended_hours=True)
+        for symbol in synthetic_symbols(config.orders)
+    ]
+    return (lambda: api_utils.submit_orders(client, requests)), config.orders
+
+
+# "Is there an open buy for this symbol?" per decision: the order book kept
+# from trade updates vs asking the API each time
+
+@benchmark("open_order_check_book")
+def bench_open_order_check_book(config: BenchmarkConfig):
+    from orders import OrderBook
+
+    book = OrderBook()
+    symbols = synthetic_symbols(config.orders)
+    for i, symbol in enumerate(symbols):
+        book.apply_order({"id": str(i), "client_order_id": f"c{i}", "symbol": symbol, "side": "buy", "qty": "1", "status": "new" if i % 2 else "filled"})
+    return (lambda: [book.has_open(symbol, "buy") for symbol in symbols]), len(symbols)
+
+
+@benchmark("open_order_check_polled")
+def bench_open_order_check_polled(config: BenchmarkConfig):
+    import http_pool
+    from fake_server import FakeServer, FakeServerConfig
+    from lite_client import LiteClient, OrderSpec
+
+    tickers = _stored_bars(BenchmarkConfig(symbols=20, bars=config.bars, seed=config.seed))
+    fake = FakeServer(FakeServerConfig(port=0, cash=1e12, store_root="output/bars")).start()
+    session = http_pool.new_session()
+    client = LiteClient("key", "secret", url_override=fake.url, session=session)
+    for ticker in tickers:
+        client.submit_order(OrderSpec.limit(ticker, 1, "buy", 10.0))
+
+    def op():
+        for ticker in tickers:
+            orders = session.get(f"{fake.url}/v2/orders?status=open", headers=client.headers).json()
+            any(order["symbol"] == ticker and order["side"] == "buy" and order["status"] == "new" for order in orders)
+
+    return op, len(tickers)
+
+
+# fetch -> store -> signals for the whole universe from a fake Alpaca with
+# 20ms per response, in this process vs sharded over worker processes
+# (spawned per run, like a cron run would)
+PIPELINE_SHARDS = 4
+
+
+def _pipeline(config: BenchmarkConfig, shards: Optional[int]):
+    import api_utils
+    import http_pool
+    import sharding
+    from bar_store import ColumnarBarStore
+    from fake_server import FakeServer, FakeServerConfig
+
+    tickers = _stored_bars(BenchmarkConfig(symbols=config.symbols * 2, bars=config.bars, seed=config.seed))
+    fake = FakeServer(FakeServerConfig(port=0, latency=0.02, store_root="output/bars")).start()
+    start, end = SESSION_START, SESSION_START + timedelta(minutes=config.bars + 1)
+    shard_config = sharding.ShardConfig(shards=shards or 1)
+
+    def op():
+        root = tempfile.mkdtemp(dir=".")
+        with quiet():
+            if shards:
+                sharding.run_sharded(tickers, start, end, shard_config, "key", "secret", fake.url, root)
+            else:
+                client = http_pool.ClientFactory("key", "secret", url_override=fake.url).data_client()
+                store = ColumnarBarStore(root)
+                api_utils.sync_stock_bars(client, store, tickers, start, end)
+                sharding.buy_candidates(store, tickers, shard_config)
+
+    return op, len(tickers)
+
+
+@benchmark("pipeline_sequential")
+def bench_pipeline_sequential(config: BenchmarkConfig):
+    return _pipeline(config, shards=None)
+
+
+@benchmark("pipeline_sharded")
+def bench_pipeline_sharded(config: BenchmarkConfig):
+    return _pipeline(config, shards=PIPELINE_SHARDS)
+
+
+# Chart packs, in this process: every chart redrawn vs none of the bars changed
+CHART_SYMBOLS = 20
+
+
+def _charts(config: BenchmarkConfig, force: bool):
+    import charts
+
+    tickers = _stored_bars(BenchmarkConfig(symbols=CHART_SYMBOLS, bars=config.bars, seed=config.seed))
+    with quiet():
+        charts.render_charts(tickers, max_workers=1)
+
+    def op():
+        with quiet():
+            charts.render_charts(tickers, max_workers=1, force=force)
+
+    return op, len(tickers)
+
+
+@benchmark("charts_render")
+def bench_charts_render(config: BenchmarkConfig):
+    return _charts(config, force=True)
+
+
+@benchmark("charts_unchanged")
+def bench_charts_unchanged(config: BenchmarkConfig):
+    return _charts(config, force=False)
+
+
+def self_signed_cert(directory: str) -> str:
+    path = os.path.join(directory, "localhost.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=127.0.0.1",
+         "-addext", "subjectAltName=IP:127.0.0.1", "-keyout", path, "-out", path + ".crt"],
+        check=True, capture_output=True,
+    )
+    with open(path, "a") as pem, open(path + ".crt") as crt:
+        pem.write(crt.read())
+    return path
+
+
+def _per_ticker_requests(config: BenchmarkConfig, pooled: bool):
+    import requests
+
+    import http_pool
+    from fake_server import FakeServer, FakeServerConfig
+
+    # One latest-bar request per ticker in a loop against a local fake Alpaca
+    # over TLS: a new connection pays the handshake, a pooled one doesn't
+    tickers = _stored_bars(BenchmarkConfig(symbols=20, bars=config.bars, seed=config.seed))
+    cert = self_signed_cert(os.getcwd())
+    fake = FakeServer(FakeServerConfig(port=0, store_root="output/bars", certfile=cert)).start()
+    urls = [f"{fake.url}/v2/stocks/bars/latest?symbols={ticker}" for ticker in tickers]
+    get = http_pool.new_session().get if pooled else requests.get
+    return (lambda: [get(url, verify=cert + ".crt").json() for url in urls]), len(urls)
+
+
+@benchmark("per_ticker_requests_pooled")
+def bench_per_ticker_requests_pooled(config: BenchmarkConfig):
+    return _per_ticker_requests(config, pooled=True)
+
+
+@benchmark("per_ticker_requests_unpooled")
+def bench_per_ticker_requests_unpooled(config: BenchmarkConfig):
+    return _per_ticker_requests(config, pooled=False)
+
+
+# -- cold start ---------------------------------------------------------------
+# Each op is a fresh interpreter, the way cron starts paper_bot: import time
+# counts, and the warm-up run only warms the OS file cache.
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+COLD_START_ORDERS = 10
+
+
+def run_python(args: List[str], env: Optional[Dict[str, str]] = None) -> None:
+    env = dict(os.environ, **(env or {}))
+    env["PYTHONPATH"] = REPO_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    subprocess.run([sys.executable, *args], env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+@benchmark("cold_start_import")
+def bench_cold_start_import(config: BenchmarkConfig):
+    return (lambda: run_python(["-c", "import paper_bot"])), 1
+
+
+def _cold_start_first_order(config: BenchmarkConfig, sdk: bool):
+    from fake_server import FakeServer, FakeServerConfig
+
+    # A fake Alpaca over a small store; prices come from one latest-bar request
+    tickers = _stored_bars(BenchmarkConfig(symbols=COLD_START_ORDERS, bars=config.bars, seed=config.seed))
+    fake = FakeServer(FakeServerConfig(port=0, cash=1e12, store_root="output/bars")).start()
+    env = {"ALPACA_URL_OVERRIDE": fake.url, "ALPACA_PAPER_TOKEN": "key", "ALPACA_PAPER_SECRET": "secret"}
+    args = [os.path.join(REPO_DIR, "cli.py"), *(["--sdk"] if sdk else []), "orders", *tickers, "--dollars", "100"]
+    return (lambda: run_python(args, env)), COLD_START_ORDERS
+
+
+@benchmark("cold_start_first_order")
+def bench_cold_start_first_order(config: BenchmarkConfig):
+    return _cold_start_first_order(config, sdk=False)
+
+
+@benchmark("cold_start_first_order_sdk")
+def bench_cold_start_first_order_sdk(config: BenchmarkConfig):
+    return _cold_start_first_order(config, sdk=True)
+
+
+# -- running ----------------------------------------------------------------
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def measure(name: str, config: BenchmarkConfig) -> BenchmarkResult:
+    cwd = os.getcwd()
+    try:
+        op, items = BENCHMARKS[name](config)
+        op()  # warm-up (imports, caches, page faults)
+        timings = []
+        started = time.perf_counter()
+        while len(timings) < config.min_ops or time.perf_counter() - started < config.min_time:
+            t0 = time.perf_counter()
+            op()
+            timings.append(time.perf_counter() - t0)
+    finally:
+        os.chdir(cwd)
+        while _temp_dirs:
+            shutil.rmtree(_temp_dirs.pop(), ignore_errors=True)
+    timings.sort()
+    total = sum(timings)
+    return BenchmarkResult(
+        name=name,
+        ops=len(timings),
+        items_per_op=items,
+        seconds=total,
+        ops_per_sec=len(timings) / total,
+        items_per_sec=len(timings) * items / total,
+        p50_ms=timings[len(timings) // 2] * 1000,
+        p99_ms=timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000,
+        peak_rss_mb=peak_rss_mb(),
+    )
+
+
+def run_benchmarks(names: Optional[List[str]] = None, config: BenchmarkConfig = BenchmarkConfig(), isolate: bool = True) -> List[BenchmarkResult]:
+    results = []
+    for name in names or list(BENCHMARKS):
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                result = pool.submit(measure, name, config).result()
+        else:
+            result = measure(name, config)
+        print_result(result)
+        results.append(result)
+    return results
+
+
+def print_result(result: BenchmarkResult) -> None:
+    print(
+        f"{result.name:<26} {result.ops_per_sec:>10,.1f} ops/s {result.items_per_sec:>14,.0f} items/s "
+        f"p50 {result.p50_ms:>9.3f}ms p99 {result.p99_ms:>9.3f}ms rss {result.peak_rss_mb:>7.1f}MB"
+    )
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save_results(results: List[BenchmarkResult], config: BenchmarkConfig, results_dir: str = DEFAULT_RESULTS_DIR) -> str:
+    os.makedirs(results_dir, exist_ok=True)
+    path = os.path.join(results_dir, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    with open(path, "w") as f:
+        json.dump(
+            {"created": datetime.now(timezone.utc).isoformat(), "revision": git_revision(),
+             "config": asdict(config), "results": [asdict(result) for result in results]},
+            f, indent=4,
+        )
+    return path
+
+
+def latest_results(results_dir: str = DEFAULT_RESULTS_DIR, exclude: Optional[str] = None) -> Optional[str]:
+    if not os.path.isdir(results_dir):
+        return None
+    paths = sorted(
+        os.path.join(results_dir, name) for name in os.listdir(results_dir)
+        if name.endswith(".json") and os.path.join(results_dir, name) != exclude
+    )
+    return paths[-1] if paths else None
+
+
+def compare(baseline_path: str, results: List[BenchmarkResult], threshold: float = 0.10) -> List[str]:
+    # Prints ops/sec change per benchmark, returns the ones slower than threshold
+    with open(baseline_path, "r") as f:
+        baseline = {result["name"]: result for result in json.load(f)["results"]}
+    regressions = []
+    print(f"\nCompared with {baseline_path}:")
+    for result in results:
+        before = baseline.get(result.name)
+        if before is None:
+            continue
+        change = result.ops_per_sec / before["ops_per_sec"] - 1
+        color = bcolors.FAIL if change < -threshold else bcolors.OKGREEN if change > threshold else ""
+        print(f"{color}{result.name:<26} {change:+8.1%}{bcolors.ENDC if color else ''}")
+        if change < -threshold:
+            regressions.append(result.name)
+    return regressions
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the data and order hot paths")
+    parser.add_argument("--only", nargs="*", choices=list(BENCHMARKS))
+    parser.add_argument("--symbols", type=int, default=BenchmarkConfig.symbols)
+    parser.add_argument("--bars", type=int, default=BenchmarkConfig.bars)
+    parser.add_argument("--screener-size", type=int, default=BenchmarkConfig.screener_size)
+    parser.add_argument("--orders", type=int, default=BenchmarkConfig.orders)
+    parser.add_argument("--min-time", type=float, default=BenchmarkConfig.min_time)
+    parser.add_argument("--baseline", help="results file to compare against (default: the previous run)")
+    parser.add_argument("--no-isolate", action="store_true", help="run everything in this process")
+    args = parser.parse_args()
+
+    config = BenchmarkConfig(
+        symbols=args.symbols, bars=args.bars, screener_size=args.screener_size,
+        orders=args.orders, min_time=args.min_time,
+    )
+    results = run_benchmarks(args.only, config, isolate=not args.no_isolate)
+    path = save_results(results, config)
+    print(f"{bcolors.OKCYAN}Saved {path}{bcolors.ENDC}")
+    baseline = args.baseline or latest_results(exclude=path)
+    if baseline:
+        compare(baseline, results)
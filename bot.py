@@ -1,59 +1,388 @@
+import asyncio
+import math
+import os
+import time
+from dataclasses import dataclass, replace
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+import api_utils
+import metrics
+from bar_store import BarStore, open_bar_store, to_epoch_ns
+from bcolors import bcolors
+from market_calendar import get_session_index
+from orders import OrderBook, TradeUpdateListener, new_client_order_id
+from screener_cache import ScreenerCache
+from streaming import MarketData, StreamIngestor
+from streaming_indicators import IndicatorStates
+from universe import UniverseSpec, select_universe
+
+if TYPE_CHECKING:
+    # The SDK (and pandas with it) loads with the first order, see sell()/buy()
+    from alpaca.trading.requests import LimitOrderRequest
+
+# Load the .env file
+load_dotenv()
+metrics.enable_from_env()
+
+# Define global variables for the API keys and secrets
+ALPACA_PAPER_TOKEN = os.getenv("ALPACA_PAPER_TOKEN")
+ALPACA_PAPER_SECRET = os.getenv("ALPACA_PAPER_SECRET")
+# Points both Alpaca clients somewhere else, e.g. fake_server.py
+ALPACA_URL_OVERRIDE = os.getenv("ALPACA_URL_OVERRIDE")
+# The data stream is a websocket, so it has its own override
+ALPACA_STREAM_URL_OVERRIDE = os.getenv("ALPACA_STREAM_URL_OVERRIDE")
+# And so is the trade updates stream
+ALPACA_TRADE_STREAM_URL_OVERRIDE = os.getenv("ALPACA_TRADE_STREAM_URL_OVERRIDE")
+
+
+@dataclass
+class BotConfig:
+    dollars_per_ticker: float = 100
+    max_positions: int = 20
+    universe_size: int = 200
+    universe_filter: UniverseSpec = UniverseSpec()
+    stop_loss: float = 0.05
+    rsi_overbought: float = 70
+    order_workers: int = 4
+    order_queue_size: int = 100
+    # Run a few seconds after the minute so its bar has been published
+    cycle_offset: timedelta = timedelta(seconds=5)
+    lookback: timedelta = timedelta(minutes=100)
+    market_hours_only: bool = True
+    # Minute bars and quotes over the data stream instead of polling REST
+    streaming: bool = True
+    ring_size: int = 100
+
+
+class BotContext:
+    """Everything one bot run shares between the two paths and the order workers."""
+
+    def __init__(self, trading_client, data_client, store: BarStore, clock, config: Optional[BotConfig] = None, book: Optional[OrderBook] = None) -> None:
+        self.trading_client = trading_client
+        self.data_client = data_client
+        self.store = store
+        self.clock = clock
+        self.config = config if config is not None else BotConfig()
+        self.states = IndicatorStates()
+        self.last_close: Dict[str, float] = {}
+        self.universe: List[str] = []
+        self.screener = api_utils.screener_cache
+        self.ingestor: Optional[StreamIngestor] = None
+        # Symbols backfilled since they were subscribed, the stream covers the rest
+        self.streamed: Set[str] = set()
+        self.held: Set[str] = set()
+        # Decided this cycle, not submitted yet; submitted orders are in the book
+        self.pending: Set[str] = set()
+        self.book = book or OrderBook()
+        self.trade_updates: Optional[TradeUpdateListener] = None
+        self.minute: Optional[datetime] = None
+        self.order_queue: Optional[asyncio.Queue] = None
+        self.orders: List[dict] = []
+        self.latencies: List[float] = []
+        self.overruns = 0
+        self.skipped_minutes = 0
+
+
+def next_minute(now: datetime) -> datetime:
+    return now.replace(second=0, microsecond=0) + timedelta(minutes=1)
+
+
+# Keep the indicator state in step with the store
+
+def update_states(ctx: BotContext, symbols: List[str], source=None) -> None:
+    # source: the bar store, or the stream's MarketData (same read())
+    source = source or ctx.store
+    for symbol in symbols:
+        if symbol in ctx.states:
+            since = ctx.states.states[symbol].timestamp
+            columns = source.read(symbol, None if since is None else since + 1)
+        else:
+            columns = source.read(symbol)
+        for i in range(len(columns["timestamp"])):
+            ctx.states.update(
+                symbol,
+                float(columns["high"][i]),
+                float(columns["low"][i]),
+                float(columns["close"][i]),
+                int(columns["timestamp"][i]),
+            )
+        if len(columns["close"]):
+            ctx.last_close[symbol] = float(columns["close"][-1])
+
+
+@metrics.timed("bot.refresh_bars")
+async def refresh_bars(ctx: BotContext, minute: datetime) -> None:
+    symbols = sorted(set(ctx.universe) | ctx.held)
+    backfill = symbols
+    if ctx.ingestor is not None:
+        # Newly subscribed symbols are backfilled over REST once, after that
+        # their bars come from the stream's ring buffers
+        await asyncio.to_thread(ctx.ingestor.sync, to_epoch_ns(minute))
+        backfill = [symbol for symbol in symbols if symbol not in ctx.streamed]
+        streamed = [symbol for symbol in symbols if symbol in ctx.streamed]
+        await asyncio.to_thread(update_states, ctx, streamed, ctx.ingestor.market)
+    if backfill:
+        await asyncio.to_thread(
+            api_utils.sync_stock_bars, ctx.data_client, ctx.store, backfill, minute - ctx.config.lookback, minute
+        )
+        await asyncio.to_thread(update_states, ctx, backfill)
+        if ctx.ingestor is not None:
+            ctx.streamed.update(backfill)
 
 
 # PATH 1 -- Deciding to sell current positions
 
-async def check_current():
-    pass
+@metrics.timed("bot.check_current")
+async def check_current(ctx: BotContext) -> None:
+    positions = await get_positions(ctx)
+    await asyncio.gather(*(decide_sell(ctx, position) for position in positions))
+
 
+async def get_positions(ctx: BotContext) -> list:
+    positions = await asyncio.to_thread(ctx.trading_client.get_all_positions)
+    ctx.held = {position.symbol for position in positions}
+    return positions
 
-async def get_positions():
-    pass
 
+async def decide_sell(ctx: BotContext, position) -> None:
+    if position.symbol in ctx.pending or ctx.book.has_open(position.symbol) or position.symbol not in ctx.states:
+        return
+    values = ctx.states[position.symbol]
+    stopped_out = float(position.unrealized_plpc) <= -ctx.config.stop_loss
+    # MACD histogram falling and accelerating downwards
+    turning_down = values["macdHistDeriv"] < 0 and values["macdHistDeriv2"] < 0
+    if stopped_out or turning_down:
+        await sell(ctx, position)
 
-async def decide_sell():
-    if False:
-        sell()
 
+async def sell(ctx: BotContext, position) -> None:
+    from alpaca.trading.enums import OrderSide, TimeInForce
+    from alpaca.trading.requests import LimitOrderRequest
 
-async def sell():
-    price = get_limit_price()
-    post_order()
+    price = await get_limit_price(ctx, position.symbol)
+    if price <= 0:
+        return
+    await post_order(
+        ctx,
+        LimitOrderRequest(
+            symbol=position.symbol, qty=float(position.qty_available), side=OrderSide.SELL,
+            time_in_force=TimeInForce.DAY, limit_price=price, extended_hours=True
+        ),
+    )
 
 
-async def get_limit_price():
-    return 0
+async def get_limit_price(ctx: BotContext, symbol: str) -> float:
+    price = ctx.ingestor.market.price(symbol) if ctx.ingestor is not None else None
+    return round(price or ctx.last_close.get(symbol, 0.0), 2)
 
 
 # PATH 2 -- Deciding to buy new positions
-async def check_scan():
-    pass
 
+@metrics.timed("bot.check_scan")
+async def check_scan(ctx: BotContext) -> None:
+    candidates = await get_small_cap_stocks(ctx)
+    slots = ctx.config.max_positions - len(ctx.held | ctx.pending | ctx.book.open_symbols("buy"))
+    for symbol in candidates:
+        if slots <= 0:
+            break
+        if await decide_buy(ctx, symbol):
+            slots -= 1
 
-async def get_small_cap_stocks():
-    pass
 
+@metrics.timed("bot.get_small_cap_stocks")
+async def get_small_cap_stocks(ctx: BotContext) -> List[str]:
+    # The screener cache refreshes in the background once stale; until then
+    # the same payload comes back and the selection is a cache hit
+    response = await asyncio.to_thread(api_utils.get_stock_tickers, None, ctx.screener)
+    spec = replace(ctx.config.universe_filter, top_k=ctx.config.universe_size)
+    ctx.universe = select_universe(response, spec)
+    if ctx.ingestor is not None:
+        wanted = set(ctx.universe) | ctx.held
+        await asyncio.to_thread(ctx.ingestor.set_universe, wanted)
+        ctx.streamed &= wanted
+    return ctx.universe
 
-async def decide_buy():
-    if False:
-        buy()
 
+async def decide_buy(ctx: BotContext, symbol: str) -> bool:
+    if symbol in ctx.held or symbol in ctx.pending or ctx.book.has_open(symbol) or symbol not in ctx.states:
+        return False
+    values = ctx.states[symbol]
+    # MACD histogram below zero but rising and accelerating, not overbought
+    turning_up = values["macdHist"] < 0 and values["macdHistDeriv"] > 0 and values["macdHistDeriv2"] > 0
+    if not turning_up or not values["rsi"] < ctx.config.rsi_overbought:
+        return False
+    return await buy(ctx, symbol)
 
-async def buy():
-    price, amt = get_limit_price_and_amt()
-    post_order()
 
+async def buy(ctx: BotContext, symbol: str) -> bool:
+    from alpaca.trading.enums import OrderSide, TimeInForce
+    from alpaca.trading.requests import LimitOrderRequest
 
-async def get_limit_price_and_amt():
-    return 0, 0
+    price, amt = await get_limit_price_and_amt(ctx, symbol)
+    if amt < 1:
+        return False
+    await post_order(
+        ctx,
+        LimitOrderRequest(
+            symbol=symbol, qty=amt, side=OrderSide.BUY, time_in_force=TimeInForce.DAY,
+            limit_price=price, extended_hours=True
+        ),
+    )
+    return True
+
+
+async def get_limit_price_and_amt(ctx: BotContext, symbol: str):
+    price = await get_limit_price(ctx, symbol)
+    if price <= 0:
+        return 0, 0
+    return price, math.floor(ctx.config.dollars_per_ticker // price)
 
 
 # Finally, post the order
-async def post_order():
-    pass
+
+async def post_order(ctx: BotContext, request: "LimitOrderRequest") -> None:
+    # Bounded queue: a burst of decisions waits here instead of flooding the API
+    ctx.pending.add(request.symbol)
+    # One id per decision, so resubmitting it can't open a second order
+    request.client_order_id = new_client_order_id(f"{request.symbol}:{request.side.value}:{ctx.minute:%Y-%m-%dT%H:%M}")
+    await ctx.order_queue.put((request, time.perf_counter()))
+
+
+async def order_worker(ctx: BotContext) -> None:
+    while True:
+        request, queued_at = await ctx.order_queue.get()
+        result = {"symbol": request.symbol, "side": request.side.value, "qty": request.qty, "limit_price": request.limit_price}
+        metrics.count("orders_sent")
+        try:
+            order = await asyncio.to_thread(ctx.book.submit, ctx.trading_client, request)
+            result["status"] = order.status
+            print(f"{bcolors.OKGREEN}Order placed: {request.side.value} {request.qty} {request.symbol} @ {request.limit_price}{bcolors.ENDC}")
+        except Exception as e:
+            result["status"] = "error"
+            result["error"] = str(e)
+            metrics.count("order_errors")
+            print(f"{bcolors.FAIL}Order failed for {request.symbol}: {e}{bcolors.ENDC}")
+        finally:
+            result["latency"] = time.perf_counter() - queued_at
+            metrics.observe("bot.order", result["latency"])
+            ctx.orders.append(result)
+            ctx.pending.discard(request.symbol)
+            ctx.order_queue.task_done()
+
+
+# The minute loop
+
+@metrics.timed("bot.cycle")
+async def run_cycle(ctx: BotContext, minute: datetime) -> None:
+    ctx.minute = minute
+    await get_small_cap_stocks(ctx)
+    await refresh_bars(ctx, minute)
+    await asyncio.gather(check_current(ctx), check_scan(ctx))
+    await ctx.order_queue.join()
+
+
+async def run(ctx: BotContext, cycles: Optional[int] = None) -> BotContext:
+    ctx.order_queue = asyncio.Queue(maxsize=ctx.config.order_queue_size)
+    workers = [asyncio.create_task(order_worker(ctx)) for _ in range(ctx.config.order_workers)]
+    calendar = get_session_index()
+    if ctx.ingestor is not None:
+        ctx.ingestor.start()
+    if ctx.trade_updates is not None:
+        ctx.trade_updates.start()
+    try:
+        minute = next_minute(ctx.clock.now())
+        while ctx.clock.running() and (cycles is None or len(ctx.latencies) < cycles):
+            # Each cycle handles the bar of the minute before it; outside the
+            # session, sleep until the minute after the next open
+            if ctx.config.market_hours_only and not calendar.is_open(minute - timedelta(minutes=1)):
+                next_open = calendar.next_open(minute)
+                if next_open is None:
+                    break
+                minute = next_open + timedelta(minutes=1)
+                continue
+            await ctx.clock.sleep_until(minute + ctx.config.cycle_offset)
+            started = time.perf_counter()
+            await run_cycle(ctx, minute)
+            ctx.latencies.append(time.perf_counter() - started)
+            metrics.end_cycle()
+
+            # If the cycle ran past the next minute, skip to the upcoming one
+            # instead of queueing up back-to-back catch-up cycles
+            minute += timedelta(minutes=1)
+            now = ctx.clock.now()
+            if now > minute + ctx.config.cycle_offset:
+                behind = next_minute(now - ctx.config.cycle_offset)
+                missed = int((behind - minute) / timedelta(minutes=1))
+                ctx.overruns += 1
+                ctx.skipped_minutes += missed
+                print(f"{bcolors.WARNING}Cycle took {ctx.latencies[-1]:.2f}s, skipping {missed} minute(s).{bcolors.ENDC}")
+                minute = behind
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        if ctx.ingestor is not None:
+            ctx.ingestor.stop()
+        if ctx.trade_updates is not None:
+            ctx.trade_updates.stop()
+        ctx.book.close()
+    print_cycle_stats(ctx)
+    return ctx
+
+
+def print_cycle_stats(ctx: BotContext) -> None:
+    if not ctx.latencies:
+        return
+    latencies = sorted(ctx.latencies)
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{bcolors.OKCYAN}{len(latencies)} cycles, p50 {p50 * 1000:.1f}ms, p99 {p99 * 1000:.1f}ms, "
+        f"max {latencies[-1] * 1000:.1f}ms, {ctx.overruns} overruns, {len(ctx.orders)} orders{bcolors.ENDC}"
+    )
+
+
+async def run_replay(source: BarStore, work_root: str, start: datetime, end: datetime, config: Optional[BotConfig] = None, speed: float = 1.0) -> BotContext:
+    # Offline run: bars come from `source`, the bot keeps its own store in work_root
+    from orders import open_order_book
+    from replay import FakeTradeStream, FakeTradingClient, ReplayClock, ReplayDataClient
+    from streaming import ReplayStream
+
+    clock = ReplayClock(start, end, speed)
+    book = open_order_book(os.path.join(work_root, "orders", "journal.jsonl"))
+    ctx = BotContext(None, ReplayDataClient(source, clock), open_bar_store(root=work_root), clock, config, book)
+    if ctx.config.streaming:
+        ctx.ingestor = StreamIngestor(ReplayStream(source, clock), MarketData(ctx.config.ring_size))
+    trade_stream = FakeTradeStream()
+    ctx.trading_client = FakeTradingClient(price=lambda symbol: ctx.last_close.get(symbol), trade_stream=trade_stream)
+    ctx.trade_updates = TradeUpdateListener(trade_stream, book)
+    # Use the recorded screener output as is, never refresh it
+    ctx.screener = ScreenerCache(lambda: [], ttl=timedelta.max, persist=False)
+    return await run(ctx)
 
 
 async def main():
-    pass
+    import http_pool
+    from orders import open_order_book, trading_stream
+    from replay import WallClock
+    from streaming import live_stream
+
+    # Both clients (and the screener) on one pooled keep-alive session
+    clients = http_pool.ClientFactory(ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, paper=True, url_override=ALPACA_URL_OVERRIDE)
+    ctx = BotContext(clients.trading_client(), clients.data_client(), open_bar_store(), WallClock(), book=open_order_book())
+    # Orders left open by an earlier run, as they are now; from here on the trade updates keep the book current
+    ctx.book.reconcile(ctx.trading_client)
+    ctx.trade_updates = TradeUpdateListener(
+        trading_stream(ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, paper=True, url_override=ALPACA_TRADE_STREAM_URL_OVERRIDE), ctx.book
+    )
+    if ctx.config.streaming:
+        stream = live_stream(ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, ALPACA_STREAM_URL_OVERRIDE)
+        ctx.ingestor = StreamIngestor(stream, MarketData(ctx.config.ring_size))
+    await run(ctx)
+    http_pool.print_stats()
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
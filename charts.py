@@ -0,0 +1,339 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from bar_store import DEFAULT_COLUMNAR_ROOT, BarStore, ColumnarBarStore, open_bar_store
+from bcolors import bcolors
+from indicators import IndicatorParams, Panel, compute_indicators, load_panel
+
+"""
+Headless batch charts: candlesticks with the SMAs, RSI, MACD and stochastics
+of many tickers, rendered to output/charts/<SYMBOL>.png.
+
+Each process draws with one ChartRenderer: a single Agg figure (no pyplot,
+no display) whose artists are created once and get new data per ticker, with
+the parts every chart shares drawn only once (see ChartRenderer). Tickers are
+handed to a process pool in chunks; a chunk's bars are loaded as one panel
+and its indicators computed in one vectorized pass (indicators.py), over
+`lookback` bars plus enough earlier ones for the slow SMA to settle.
+
+Every chart is keyed by a hash of the bars it was drawn from and the chart
+settings (output/charts/manifest.json); a ticker whose bars haven't changed
+since its last render is skipped, so the end-of-day run only redraws what
+traded.
+"""
+
+DEFAULT_CHARTS_DIR = "output/charts"
+MANIFEST_NAME = "manifest.json"
+# Bump when the drawing changes, so every chart is redrawn once
+CHART_VERSION = 1
+
+UP_COLOR = (0.15, 0.6, 0.3, 1.0)
+DOWN_COLOR = (0.8, 0.2, 0.2, 1.0)
+KEY_FIELDS = ("timestamp", "open", "high", "low", "close")
+
+
+@dataclass(frozen=True)
+class ChartSettings:
+    lookback: int = 390  # bars drawn, one regular session of minutes
+    params: IndicatorParams = IndicatorParams()
+    width: float = 12.0
+    height: float = 8.0
+    dpi: int = 80
+    compress_level: int = 1  # PNG zlib level: fast to write, a bit larger
+
+    @property
+    def warmup(self) -> int:
+        return max(self.params.sma_slow, self.params.macd_slow + self.params.macd_signal)
+
+
+def chart_key(panel: Panel, i: int, settings: ChartSettings) -> str:
+    # The bars of row i and the settings, as drawn
+    digest = hashlib.sha1(json.dumps([CHART_VERSION, asdict(settings)], sort_keys=True).encode())
+    row = panel.row(panel.symbols[i])
+    for field in KEY_FIELDS:
+        digest.update(np.ascontiguousarray(panel[field][i, row]).tobytes())
+    return digest.hexdigest()
+
+
+class ChartRenderer:
+    """
+    One figure, reused for every ticker this process draws. Everything that
+    is the same on every chart (frames, the RSI and stochastic scales, grid
+    columns, the legend) is drawn once and kept as a background; a chart
+    restores it and draws only its own artists (data, price and MACD scales,
+    time axis, title) on top, then writes the canvas buffer out as PNG.
+
+    The figure is built on the first render, so a run where every chart is
+    unchanged never loads matplotlib.
+    """
+
+    def __init__(self, settings: ChartSettings = ChartSettings()) -> None:
+        self.settings = settings
+        self.figure = None
+
+    def _build(self) -> None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection, PolyCollection
+        from matplotlib.figure import Figure
+        from matplotlib.ticker import FixedLocator, FuncFormatter
+
+        settings = self.settings
+        self.figure = Figure(figsize=(settings.width, settings.height), dpi=settings.dpi)
+        self.canvas = FigureCanvasAgg(self.figure)
+        self.price, self.rsi, self.macd, self.stoch = self.figure.subplots(
+            4, sharex=True, gridspec_kw={"height_ratios": (3, 1, 1, 1)})
+        self.figure.subplots_adjust(left=0.06, right=0.95, top=0.9, bottom=0.05, hspace=0.1)
+
+        self.wicks = self.price.add_collection(LineCollection([], linewidths=0.6))
+        self.bodies = self.price.add_collection(PolyCollection([], linewidths=0))
+        self.histogram = self.macd.add_collection(PolyCollection([], linewidths=0, facecolors="0.6", label="MACD hist"))
+        self.lines = {
+            "sma_f": self.price.plot([], [], lw=1, label=f"SMA {settings.params.sma_fast}")[0],
+            "sma_s": self.price.plot([], [], lw=1, label=f"SMA {settings.params.sma_slow}")[0],
+            "rsi": self.rsi.plot([], [], lw=1, label="RSI")[0],
+            "sma_r": self.rsi.plot([], [], lw=1, label="RSI avg")[0],
+            "macd": self.macd.plot([], [], lw=1, label="MACD")[0],
+            "macdSignal": self.macd.plot([], [], lw=1, label="Signal")[0],
+            "stoch_k": self.stoch.plot([], [], lw=1, label="%K")[0],
+            "stoch_d": self.stoch.plot([], [], lw=1, label="%D")[0],
+        }
+        for ax in (self.rsi, self.stoch):
+            ax.set_ylim(0, 100)
+        for level in (30, 70):
+            self.rsi.axhline(level, color="0.7", lw=0.6, ls="--")
+        for level in (20, 80):
+            self.stoch.axhline(level, color="0.7", lw=0.6, ls="--")
+        self.macd.axhline(0, color="0.7", lw=0.6)
+        for ax in (self.price, self.rsi, self.macd, self.stoch):
+            ax.grid(alpha=0.3)
+        # Above the charts, where no data is drawn over it
+        self.figure.legend(
+            handles=[*self.lines.values(), self.histogram], loc="upper center", ncols=9,
+            fontsize="small", frameon=False, bbox_to_anchor=(0.5, 0.96))
+        self.title = self.figure.suptitle("", y=0.995)
+
+        # x is the bar number, right-aligned on a fixed scale of `lookback`
+        # bars, so the grid columns are the same on every chart
+        self.price.set_xlim(-1, settings.lookback)
+        self.timestamps = np.empty(0, dtype=np.int64)
+        self.offset = 0
+        # Counted back from the newest bar, which always gets a label
+        step = max(1, settings.lookback // 8)
+        self.stoch.xaxis.set_major_locator(FixedLocator(range(settings.lookback - 1, -1, -step)))
+        self.stoch.xaxis.set_major_formatter(FuncFormatter(self._tick_label))
+
+        self.dynamic = [
+            self.price.yaxis, self.macd.yaxis, self.stoch.xaxis, self.title,
+            self.wicks, self.bodies, self.histogram, *self.lines.values(),
+        ]
+        for artist in self.dynamic:
+            artist.set_animated(True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+
+    def _tick_label(self, x: float, _) -> str:
+        i = int(x) - self.offset
+        if not 0 <= i < len(self.timestamps):
+            return ""
+        return datetime.fromtimestamp(int(self.timestamps[i]) / 1e9, tz=timezone.utc).strftime("%m-%d %H:%M")
+
+    def render(self, symbol: str, bars: Dict[str, np.ndarray], indicators: Dict[str, np.ndarray], path: str) -> None:
+        # bars and indicators: equal-length arrays, oldest first, at most `lookback` long
+        from PIL import Image
+
+        if self.figure is None:
+            self._build()
+        open_, high, low, close = (bars[name] for name in ("open", "high", "low", "close"))
+        n = len(close)
+        self.offset = self.settings.lookback - n
+        x = np.arange(self.offset, self.settings.lookback, dtype=np.float64)
+        colors = np.where((close >= open_)[:, None], UP_COLOR, DOWN_COLOR)
+
+        self.wicks.set_segments(np.stack([np.column_stack([x, low]), np.column_stack([x, high])], axis=1))
+        self.wicks.set_color(colors)
+        half = 0.35
+        self.bodies.set_verts(np.stack([
+            np.column_stack([x - half, open_]), np.column_stack([x - half, close]),
+            np.column_stack([x + half, close]), np.column_stack([x + half, open_]),
+        ], axis=1))
+        self.bodies.set_facecolor(colors)
+        hist = np.nan_to_num(indicators["macdHist"])
+        zeros = np.zeros(n)
+        self.histogram.set_verts(np.stack([
+            np.column_stack([x - half, zeros]), np.column_stack([x - half, hist]),
+            np.column_stack([x + half, hist]), np.column_stack([x + half, zeros]),
+        ], axis=1))
+        for name, line in self.lines.items():
+            line.set_data(x, indicators[name])
+        # Collections don't take part in autoscaling: set the limits from the data
+        _set_ylim(self.price, low, high, indicators["sma_f"], indicators["sma_s"])
+        _set_ylim(self.macd, hist, indicators["macd"], indicators["macdSignal"])
+        self.timestamps = bars["timestamp"]
+        first, last = (datetime.fromtimestamp(int(self.timestamps[i]) / 1e9, tz=timezone.utc) for i in (0, -1))
+        self.title.set_text(f"{symbol}  {close[-1]:.2f}   {first:%Y-%m-%d %H:%M} to {last:%Y-%m-%d %H:%M} UTC")
+
+        self.canvas.restore_region(self.background)
+        renderer = self.canvas.get_renderer()
+        for artist in self.dynamic:
+            artist.draw(renderer)
+        image = Image.frombuffer("RGBA", self.canvas.get_width_height(), self.canvas.buffer_rgba(), "raw", "RGBA", 0, 1)
+        image.save(path, format="png", compress_level=self.settings.compress_level)
+
+
+def _set_ylim(ax, *series: np.ndarray) -> None:
+    values = np.concatenate([np.asarray(s, dtype=np.float64) for s in series])
+    values = values[np.isfinite(values)]
+    if not len(values):
+        return
+    low, high = float(values.min()), float(values.max())
+    pad = (high - low) * 0.05 or abs(high) * 0.01 or 1.0
+    ax.set_ylim(low - pad, high + pad)
+
+
+def chart_path(out_dir: str, symbol: str) -> str:
+    return os.path.join(out_dir, symbol.upper() + ".png")
+
+
+def render_chunk(store: BarStore, renderer: ChartRenderer, tasks: List[Tuple[str, Optional[str]]], out_dir: str) -> List[Tuple[str, Optional[str], str]]:
+    # tasks: (symbol, key of its last render). Returns (symbol, key, outcome)
+    settings = renderer.settings
+    symbols = [symbol for symbol, _ in tasks]
+    panel = load_panel(store, symbols, settings.lookback + settings.warmup, fields=KEY_FIELDS)
+    outcomes = []
+    todo = []
+    for i, (symbol, previous) in enumerate(tasks):
+        if not panel.lengths[i]:
+            outcomes.append((symbol, None, "empty"))
+            continue
+        key = chart_key(panel, i, settings)
+        if key == previous and os.path.exists(chart_path(out_dir, symbol)):
+            outcomes.append((symbol, key, "unchanged"))
+        else:
+            todo.append((i, key))
+    if not todo:
+        return outcomes
+    rows = np.array([i for i, _ in todo])
+    changed = Panel([symbols[i] for i in rows], panel.lengths[rows], {name: values[rows] for name, values in panel.columns.items()})
+    result = compute_indicators(changed, settings.params)
+    width = changed.shape[1]
+    for j, (i, key) in enumerate(todo):
+        symbol = symbols[i]
+        start = width - min(int(changed.lengths[j]), settings.lookback)
+        bars = {name: values[j, start:] for name, values in changed.columns.items()}
+        indicators = {name: values[j, start:] for name, values in result.columns.items()}
+        renderer.render(symbol, bars, indicators, chart_path(out_dir, symbol))
+        outcomes.append((symbol, key, "rendered"))
+    metrics.count("charts.rendered", len(todo))
+    return outcomes
+
+
+# Worker side: one store and one figure per process
+_worker = {}
+
+
+def open_store(store_kind: str = "columnar", store_root: Optional[str] = None) -> BarStore:
+    # Read-only when columnar: the bot may be appending while charts render
+    if store_kind == "columnar":
+        return ColumnarBarStore(store_root or DEFAULT_COLUMNAR_ROOT, readonly=True)
+    return open_bar_store(store_kind, store_root)
+
+
+def _init_worker(store_kind: str, store_root: Optional[str], settings: ChartSettings, out_dir: str) -> None:
+    _worker.update(store=open_store(store_kind, store_root), renderer=ChartRenderer(settings), out_dir=out_dir)
+
+
+def _render_chunk(tasks: List[Tuple[str, Optional[str]]]) -> List[Tuple[str, Optional[str], str]]:
+    return render_chunk(_worker["store"], _worker["renderer"], tasks, _worker["out_dir"])
+
+
+def load_manifest(out_dir: str) -> Dict[str, str]:
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(out_dir: str, manifest: Dict[str, str]) -> None:
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, separators=(",", ":"))
+    os.replace(path + ".tmp", path)
+
+
+def top_screened(k: int, path: str = "output/tickers.json") -> List[str]:
+    # The top-k screened names, ranked like the bot's universe
+    from screener_cache import read_screener_file
+    from universe import UniverseSpec, select_universe
+
+    return select_universe(read_screener_file(path)[0], UniverseSpec(top_k=k))
+
+
+@metrics.timed("charts.render_charts")
+def render_charts(
+    tickers: List[str],
+    out_dir: str = DEFAULT_CHARTS_DIR,
+    settings: ChartSettings = ChartSettings(),
+    max_workers: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    store_kind: str = "columnar",
+    store_root: Optional[str] = None,
+    force: bool = False,
+) -> Dict[str, str]:
+    # Returns {symbol: "rendered" | "unchanged" | "empty" | "failed"}
+    started = time.perf_counter()
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {} if force else load_manifest(out_dir)
+    tickers = [ticker.upper() for ticker in tickers]
+    tasks = [(ticker, manifest.get(ticker)) for ticker in tickers]
+    workers = max(1, min(max_workers or os.cpu_count() or 1, len(tasks)))
+    # A few chunks per worker, so an uneven chunk doesn't leave the others idle
+    chunk_size = chunk_size or max(1, min(64, -(-len(tasks) // (workers * 4))))
+    chunks = [tasks[i: i + chunk_size] for i in range(0, len(tasks), chunk_size)]
+
+    outcomes: Dict[str, str] = {}
+
+    def record(results: List[Tuple[str, Optional[str], str]]) -> None:
+        for symbol, key, outcome in results:
+            outcomes[symbol] = outcome
+            if key is not None:
+                manifest[symbol] = key
+
+    def fail(chunk: List[Tuple[str, Optional[str]]], e: Exception) -> None:
+        # The chunk's symbols keep their old manifest keys, so they're redrawn next run
+        print(f"{bcolors.FAIL}Charts for {[symbol for symbol, _ in chunk]} failed: {e}{bcolors.ENDC}")
+        outcomes.update((symbol, "failed") for symbol, _ in chunk)
+
+    if workers == 1:
+        # In this process: no pool to start for a handful of charts
+        store, renderer = open_store(store_kind, store_root), ChartRenderer(settings)
+        for chunk in chunks:
+            try:
+                record(render_chunk(store, renderer, chunk, out_dir))
+            except Exception as e:
+                fail(chunk, e)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(store_kind, store_root, settings, out_dir)) as pool:
+            futures = {pool.submit(_render_chunk, chunk): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                try:
+                    record(future.result())
+                except Exception as e:
+                    fail(futures[future], e)
+    save_manifest(out_dir, manifest)
+
+    counts = {outcome: sum(1 for value in outcomes.values() if value == outcome) for outcome in ("rendered", "unchanged", "empty", "failed")}
+    print(
+        f"{bcolors.OKCYAN}Charts in {out_dir}: {counts['rendered']} rendered, {counts['unchanged']} unchanged, "
+        f"{counts['empty']} without bars, {counts['failed']} failed in {time.perf_counter() - started:.2f}s{bcolors.ENDC}"
+    )
+    return outcomes
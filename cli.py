@@ -0,0 +1,186 @@
+import argparse
+import os
+import sys
+from typing import List, Optional
+
+"""
+One entry point for the short, cron-driven jobs.
+
+Every subcommand imports what it needs when it runs, so `python cli.py
+orders ...` never loads pandas, the market calendar, matplotlib or the
+Alpaca SDK: prices come from the bar store or one latest-bar request and the
+orders go out over lite_client.LiteClient, on http_pool's keep-alive
+session. --sdk uses the SDK clients instead.
+
+    python cli.py orders AAPL MSFT --dollars 100
+    python cli.py summary
+    python cli.py monitor --interval 2
+    python cli.py bot
+    python cli.py backtest
+    python cli.py rollups --timeframes 5Min 1Hour
+    python cli.py pipeline --shards 8 --place
+    python cli.py chart AAPL
+    python cli.py charts --top 300
+"""
+
+
+def _keys():
+    from dotenv import load_dotenv
+
+    import metrics
+
+    load_dotenv()
+    metrics.enable_from_env()
+    return os.getenv("ALPACA_PAPER_TOKEN"), os.getenv("ALPACA_PAPER_SECRET"), os.getenv("ALPACA_URL_OVERRIDE")
+
+
+def _clients(sdk: bool):
+    # (trading client, data client), on one pooled keep-alive session
+    import http_pool
+
+    token, secret, url_override = _keys()
+    clients = http_pool.ClientFactory(token, secret, paper=True, url_override=url_override)
+    if sdk:
+        return clients.trading_client(), clients.data_client()
+    client = clients.lite_client()
+    return client, client
+
+
+def orders(args) -> int:
+    import bar_store
+    import paper_bot
+    from orders import open_order_book
+
+    trading_client, data_client = _clients(args.sdk)
+    store = bar_store.open_bar_store() if os.path.isdir(bar_store.DEFAULT_COLUMNAR_ROOT) else None
+    # The journal's open orders, refreshed: tickers with a buy still open are skipped
+    book = open_order_book()
+    book.reconcile(trading_client)
+    results = paper_bot.place_dollar_share_orders(
+        trading_client, data_client, args.tickers, args.dollars, store, args.workers, book)
+    book.close()
+    if args.verbose:
+        import http_pool
+
+        http_pool.print_stats()
+    return 0 if all(result.error is None or result.status == "skipped" for result in results) else 1
+
+
+def summary(args) -> int:
+    import paper_bot
+
+    trading_client, _ = _clients(args.sdk)
+    paper_bot.print_account_summary(trading_client, pause=False)
+    return 0
+
+
+def monitor(args) -> int:
+    import portfolio
+
+    trading_client, _ = _clients(args.sdk)
+    portfolio.monitor(trading_client, args.interval)
+    return 0
+
+
+def bot(args) -> int:
+    import asyncio
+
+    import bot
+
+    asyncio.run(bot.main())
+    return 0
+
+
+def backtest(args) -> int:
+    from backtest import Backtest, MacdStrategy, print_result
+
+    print_result(Backtest(MacdStrategy()).run())
+    return 0
+
+
+def rollups(args) -> int:
+    import bar_store
+    import resample
+
+    resample.update_rollups(bar_store.open_bar_store(), args.tickers or None, args.timeframes)
+    return 0
+
+
+def pipeline(args) -> int:
+    import paper_bot
+
+    paper_bot.main(place_orders=args.place, screen_stocks=True, rollups=args.rollups, shards=args.shards)
+    return 0
+
+
+def chart(args) -> int:
+    import stock_analysis
+
+    _, analysis = stock_analysis.analyse(args.ticker)
+    stock_analysis.plot(analysis)
+    return 0
+
+
+def charts(args) -> int:
+    import charts
+
+    tickers = args.tickers or charts.top_screened(args.top)
+    settings = charts.ChartSettings(lookback=args.lookback)
+    outcomes = charts.render_charts(tickers, args.out, settings, args.workers, force=args.force)
+    return 0 if "failed" not in outcomes.values() else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Alpaca trading bot")
+    parser.add_argument("--sdk", action="store_true", help="use the alpaca-py clients instead of lite_client")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("orders", help="buy about --dollars worth of each ticker with limit orders")
+    command.add_argument("tickers", nargs="+")
+    command.add_argument("--dollars", type=float, required=True)
+    command.add_argument("--workers", type=int, default=8)
+    command.add_argument("--verbose", action="store_true", help="print connection reuse")
+    command.set_defaults(run=orders)
+
+    commands.add_parser("summary", help="print the account and its positions").set_defaults(run=summary)
+
+    command = commands.add_parser("monitor", help="live position board")
+    command.add_argument("--interval", type=float, default=1.0)
+    command.set_defaults(run=monitor)
+
+    commands.add_parser("bot", help="run the trading bot").set_defaults(run=bot)
+    commands.add_parser("backtest", help="backtest the MACD strategy on the bar store").set_defaults(run=backtest)
+
+    command = commands.add_parser("rollups", help="update the 5Min/15Min/1Hour/1Day bars from the stored minutes")
+    command.add_argument("tickers", nargs="*")
+    command.add_argument("--timeframes", nargs="+", default=["5Min", "15Min", "1Hour", "1Day"])
+    command.set_defaults(run=rollups)
+
+    command = commands.add_parser("pipeline", help="screen, fetch, signal and buy, sharded over worker processes")
+    command.add_argument("--shards", type=int, default=os.cpu_count() or 1)
+    command.add_argument("--place", action="store_true", help="submit the orders (default: report them)")
+    command.add_argument("--rollups", action="store_true")
+    command.set_defaults(run=pipeline)
+
+    command = commands.add_parser("chart", help="plot the MACD charts of one ticker")
+    command.add_argument("ticker")
+    command.set_defaults(run=chart)
+
+    command = commands.add_parser("charts", help="render the charts of many tickers to PNG files, headless")
+    command.add_argument("tickers", nargs="*", help="default: the --top screened tickers")
+    command.add_argument("--top", type=int, default=100)
+    command.add_argument("--out", default="output/charts")
+    command.add_argument("--lookback", type=int, default=390, help="bars per chart")
+    command.add_argument("--workers", type=int, default=None, help="default: one per CPU")
+    command.add_argument("--force", action="store_true", help="redraw charts whose bars haven't changed")
+    command.set_defaults(run=charts)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    return args.run(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
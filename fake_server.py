@@ -0,0 +1,396 @@
+import json
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from bar_fetcher import TokenBucket
+from bar_store import BarStore, open_bar_store, to_epoch_ns
+from bcolors import bcolors
+from market_calendar import from_ns
+from replay import FakeAPIError, FakeOrder, FakeTradingClient
+from screener_cache import read_screener_file
+
+"""
+Local stand-in for the Alpaca trading/data APIs and the FMP screener.
+
+Serves, from the recorded output/ data:
+
+    GET    /v2/stocks/bars             --> bars from the bar store (paged like Alpaca)
+    GET    /v2/stocks/bars/latest      --> latest stored bar per symbol
+    GET    /v2/account                 --> account of the in-memory FakeTradingClient
+    GET    /v2/positions
+    GET    /v2/orders, /v2/orders/<id>, /v2/orders:by_client_order_id
+    POST   /v2/orders                  --> market orders fill at the latest stored close, limit
+                                           orders at their limit if that close reaches it
+    DELETE /v2/orders/<id>             --> cancels a limit order still resting
+    GET    /api/v3/stock-screener      --> output/tickers.json
+
+Point the bot at it with ALPACA_URL_OVERRIDE=http://127.0.0.1:<port> and
+FINANCIAL_MODELING_PREP_API_ENDPOINT=http://127.0.0.1:<port>/api/v3/stock-screener.
+Latency and injected 500s are drawn from an RNG seeded per request (the
+config seed, the request itself and how often it has been sent), so which
+requests fail doesn't depend on the order concurrent requests arrive in; 429s
+come from a token bucket.
+"""
+
+SCREENER_PATH = "/api/v3/stock-screener"
+DEFAULT_PAGE_SIZE = 1000
+MAX_PAGE_SIZE = 10000
+
+
+@dataclass
+class FakeServerConfig:
+    host: str = "127.0.0.1"
+    port: int = 8765
+    latency: float = 0.0  # seconds added to every response
+    jitter: float = 0.0  # plus uniform [0, jitter)
+    error_rate: float = 0.0  # fraction of requests answered with a 500
+    rate_limit: Optional[float] = None  # requests per minute, then 429
+    seed: int = 0
+    store_kind: str = "columnar"
+    store_root: Optional[str] = None
+    screener_path: str = "output/tickers.json"
+    cash: float = 100_000.0
+    certfile: Optional[str] = None  # PEM with the key and certificate: serve https
+
+
+def iso(ns: int) -> str:
+    return from_ns(ns).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class FakeServer:
+    def __init__(self, config: FakeServerConfig = FakeServerConfig(), store: Optional[BarStore] = None) -> None:
+        self.config = config
+        self.store = store or (open_bar_store(config.store_kind, config.store_root) if config.store_root else open_bar_store(config.store_kind))
+        self.trading = FakeTradingClient(config.cash, price=self.latest_close, match_limits=True)
+        self.orders: Dict[str, Tuple[FakeOrder, dict]] = {}
+        self.lock = threading.Lock()
+        self.attempts: Dict[str, int] = {}
+        self.bucket = TokenBucket(config.rate_limit, capacity=config.rate_limit / 60) if config.rate_limit else None
+        self.counts: Dict[str, int] = {}
+        self.errors = 0
+        self.throttled = 0
+        self.screener: Optional[List[dict]] = None
+        self.httpd: Optional[ThreadingHTTPServer] = None
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2] if self.httpd else (self.config.host, self.config.port)
+        return f"{'https' if self.config.certfile else 'http'}://{host}:{port}"
+
+    # -- lifecycle ----------------------------------------------------------
+
+    def start(self) -> "FakeServer":
+        server = self
+
+        class Handler(FakeRequestHandler):
+            fake = server
+
+        self.httpd = ThreadingHTTPServer((self.config.host, self.config.port), Handler)
+        self.httpd.daemon_threads = True
+        if self.config.certfile:
+            import ssl
+
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(self.config.certfile)
+            self.httpd.socket = context.wrap_socket(self.httpd.socket, server_side=True)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="fake-server", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+
+    def __enter__(self) -> "FakeServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # -- fault injection ----------------------------------------------------
+
+    def admit(self, method: str, target: str, body: bytes = b"") -> Optional[Tuple[int, dict]]:
+        # Counts the request, sleeps the configured latency, and returns an
+        # error response if this one is throttled or picked to fail. The draw
+        # depends only on the request and its attempt number, so a retry
+        # gets a fresh one and concurrent requests don't shift each other's
+        request = f"{method} {target} {body.decode(errors='replace')}"
+        with self.lock:
+            path = urlparse(target).path
+            self.counts[path] = self.counts.get(path, 0) + 1
+            attempt = self.attempts[request] = self.attempts.get(request, 0) + 1
+        rng = random.Random(f"{self.config.seed}:{request}:{attempt}")
+        delay = self.config.latency + (rng.random() * self.config.jitter if self.config.jitter else 0.0)
+        fail = self.config.error_rate > 0 and rng.random() < self.config.error_rate
+        if delay:
+            time.sleep(delay)
+        if self.bucket is not None and not self.bucket.try_acquire():
+            self.throttled += 1
+            return 429, {"code": 42910000, "message": "rate limit exceeded"}
+        if fail:
+            self.errors += 1
+            return 500, {"code": 50010000, "message": "injected error"}
+        return None
+
+    # -- data ---------------------------------------------------------------
+
+    def latest_close(self, symbol: str) -> Optional[float]:
+        columns = self.store.read(symbol)
+        return float(columns["close"][-1]) if len(columns["close"]) else None
+
+    @staticmethod
+    def bar_json(columns: dict, i: int) -> dict:
+        return {
+            "t": iso(int(columns["timestamp"][i])),
+            "o": float(columns["open"][i]),
+            "h": float(columns["high"][i]),
+            "l": float(columns["low"][i]),
+            "c": float(columns["close"][i]),
+            "v": float(columns["volume"][i]),
+            "n": float(columns["trade_count"][i]),
+            "vw": float(columns["vwap"][i]),
+        }
+
+    def bars(self, query: Dict[str, str]) -> dict:
+        # Symbols in request order, `limit` bars per page across all of them;
+        # the page token is "<symbol index>:<row>" of the next bar to send
+        symbols = query["symbols"].upper().split(",")
+        start, end = to_epoch_ns(query.get("start")), to_epoch_ns(query.get("end"))
+        limit = min(int(query.get("limit") or DEFAULT_PAGE_SIZE), MAX_PAGE_SIZE)
+        token = query.get("page_token")
+        symbol_index, row = map(int, token.split(":")) if token else (0, 0)
+        data: Dict[str, List[dict]] = {}
+        sent = 0
+        while symbol_index < len(symbols):
+            columns = self.store.read(symbols[symbol_index], start, end)
+            count = len(columns["timestamp"])
+            take = min(count - row, limit - sent)
+            if take > 0:
+                data[symbols[symbol_index]] = [self.bar_json(columns, i) for i in range(row, row + take)]
+                sent += take
+                row += take
+            if row < count:
+                break
+            symbol_index, row = symbol_index + 1, 0
+        next_token = f"{symbol_index}:{row}" if symbol_index < len(symbols) else None
+        return {"bars": data, "next_page_token": next_token}
+
+    def latest_bars(self, query: Dict[str, str]) -> dict:
+        data = {}
+        for symbol in query["symbols"].upper().split(","):
+            columns = self.store.read(symbol)
+            if len(columns["timestamp"]):
+                data[symbol] = self.bar_json(columns, len(columns["timestamp"]) - 1)
+        return {"bars": data}
+
+    def screener_payload(self, query: Dict[str, str]) -> List[dict]:
+        if self.screener is None:
+            self.screener = read_screener_file(self.config.screener_path)[0]
+        limit = query.get("limit")
+        return self.screener[: int(limit)] if limit else self.screener
+
+    # -- trading ------------------------------------------------------------
+
+    def account_json(self) -> dict:
+        account = self.trading.get_account()
+        return {
+            "id": "00000000-0000-0000-0000-000000000000",
+            "account_number": "PAFAKE",
+            "status": "ACTIVE",
+            "currency": "USD",
+            "cash": account.cash,
+            "buying_power": account.buying_power,
+            "portfolio_value": account.portfolio_value,
+            "equity": account.portfolio_value,
+            "last_equity": account.portfolio_value,
+            "pattern_day_trader": False,
+            "trading_blocked": False,
+            "account_blocked": False,
+            "created_at": now_iso(),
+        }
+
+    def positions_json(self) -> List[dict]:
+        return [
+            {
+                "asset_id": str(uuid.uuid5(uuid.NAMESPACE_OID, position.symbol)),
+                "symbol": position.symbol,
+                "exchange": "NASDAQ",
+                "asset_class": "us_equity",
+                "avg_entry_price": str(position.avg_entry_price),
+                "qty": str(position.qty),
+                "qty_available": position.qty_available,
+                "side": "long",
+                "market_value": position.market_value,
+                "cost_basis": position.cost_basis,
+                "unrealized_pl": position.unrealized_pl,
+                "unrealized_plpc": position.unrealized_plpc,
+                "current_price": str(position.current_price),
+            }
+            for position in self.trading.get_all_positions()
+        ]
+
+    def submit_order(self, body: dict) -> dict:
+        order_type = body.get("type", "market")
+        if order_type not in ("market", "limit"):
+            raise FakeAPIError(422, f"order type {order_type!r} is not supported")
+        if order_type == "limit" and body.get("limit_price") is None:
+            raise FakeAPIError(422, "limit_price is required for limit orders")
+        request = SimpleNamespace(
+            symbol=body["symbol"].upper(),
+            qty=float(body.get("qty") or 0),
+            side=body["side"],
+            # A market order takes whatever the latest close is
+            limit_price=float(body["limit_price"]) if order_type == "limit" else None,
+            client_order_id=body.get("client_order_id"),
+        )
+        order = self.trading.submit_order(request)
+        submitted = now_iso()
+        filled = order.status == "filled"
+        record = {
+            "id": str(order.id),
+            "client_order_id": order.client_order_id,
+            "created_at": submitted,
+            "updated_at": submitted,
+            "submitted_at": submitted,
+            "filled_at": submitted if filled else None,
+            "canceled_at": None,
+            "symbol": order.symbol,
+            "asset_class": "us_equity",
+            "qty": str(order.qty),
+            "filled_qty": str(order.qty if filled else 0),
+            "filled_avg_price": str(order.filled_avg_price) if filled else None,
+            "order_class": body.get("order_class") or "simple",
+            "order_type": order_type,
+            "type": order_type,
+            "side": body["side"],
+            "time_in_force": body.get("time_in_force", "day"),
+            "limit_price": body.get("limit_price") if order_type == "limit" else None,
+            "status": order.status,
+            "extended_hours": bool(body.get("extended_hours", False)),
+        }
+        self.orders[record["id"]] = (order, record)
+        return record
+
+    def cancel_order(self, order_id: str) -> Tuple[int, Optional[dict]]:
+        order, record = self.orders[order_id]
+        if order.status != "new":
+            return 422, {"code": 42210000, "message": f"order is already in \"{record['status']}\" state"}
+        # Only a limit order the price never reached is still open
+        order.status = record["status"] = "canceled"
+        order.updated_at = datetime.now(timezone.utc)
+        record["updated_at"] = record["canceled_at"] = now_iso()
+        return 204, None
+
+    # -- routing ------------------------------------------------------------
+
+    def route(self, method: str, path: str, query: Dict[str, str], body: Optional[dict]) -> Tuple[int, object]:
+        if method == "GET" and path == "/v2/stocks/bars":
+            return 200, self.bars(query)
+        if method == "GET" and path == "/v2/stocks/bars/latest":
+            return 200, self.latest_bars(query)
+        if method == "GET" and path == SCREENER_PATH:
+            return 200, self.screener_payload(query)
+        if method == "GET" and path == "/v2/account":
+            return 200, self.account_json()
+        if method == "GET" and path == "/v2/positions":
+            return 200, self.positions_json()
+        if method == "POST" and path == "/v2/orders":
+            try:
+                return 200, self.submit_order(body or {})
+            except FakeAPIError as e:
+                return e.status_code, {"code": 40010001, "message": str(e)}
+        if method == "GET" and path == "/v2/orders":
+            return 200, [record for _, record in self.orders.values()]
+        if method == "GET" and path == "/v2/orders:by_client_order_id":
+            try:
+                order = self.trading.get_order_by_client_id(query.get("client_order_id", ""))
+            except FakeAPIError as e:
+                return e.status_code, {"code": 40410000, "message": str(e)}
+            return 200, self.orders[str(order.id)][1]
+        if path.startswith("/v2/orders/"):
+            order_id = path.rsplit("/", 1)[1]
+            if order_id not in self.orders:
+                return 404, {"code": 40410000, "message": "order not found"}
+            if method == "GET":
+                return 200, self.orders[order_id][1]
+            if method == "DELETE":
+                return self.cancel_order(order_id)
+        return 404, {"code": 40410000, "message": f"{method} {path} not found"}
+
+
+class FakeRequestHandler(BaseHTTPRequestHandler):
+    fake: FakeServer
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, every
+    # kept-alive request would wait out the client's delayed ACK (~40ms)
+    disable_nagle_algorithm = True
+
+    def handle_request(self, method: str) -> None:
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        body = json.loads(raw) if raw else None
+        error = self.fake.admit(method, self.path, raw)
+        try:
+            status, payload = error or self.fake.route(method, url.path, query, body)
+        except (KeyError, ValueError) as e:
+            status, payload = 422, {"code": 42210000, "message": f"invalid request: {e}"}
+        data = b"" if payload is None else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        self.handle_request("GET")
+
+    def do_POST(self) -> None:
+        self.handle_request("POST")
+
+    def do_DELETE(self) -> None:
+        self.handle_request("DELETE")
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Fake Alpaca/FMP server over the recorded output/ data")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit", type=float, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    fake = FakeServer(FakeServerConfig(
+        port=args.port, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_limit=args.rate_limit, seed=args.seed,
+    )).start()
+    print(f"{bcolors.OKGREEN}Serving on {fake.url}{bcolors.ENDC}")
+    print(f"  ALPACA_URL_OVERRIDE={fake.url}")
+    print(f"  FINANCIAL_MODELING_PREP_API_ENDPOINT={fake.url}{SCREENER_PATH}")
+    try:
+        fake.thread.join()
+    except KeyboardInterrupt:
+        fake.stop()
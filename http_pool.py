@@ -0,0 +1,195 @@
+import threading
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+import metrics
+from bcolors import bcolors
+
+"""
+Pooled keep-alive HTTP for every outbound call.
+
+One requests.Session per process, with an adapter that keeps up to
+`pool_maxsize` open connections per host, puts a default timeout on every
+request and retries connection failures and 502/503/504 on idempotent
+requests. 429s are left to the callers, which already back off on their own
+(the SDK's retry loop, bar_fetcher's token bucket).
+
+ClientFactory hands the same session to the screener (api_utils), the Alpaca
+trading and data clients and LiteClient, so a loop of per-ticker calls
+reuses warm connections instead of paying a TCP/TLS handshake per call.
+Connection reuse is counted: stats() (and the http.requests /
+http.connections metrics) tell how many requests went out and how many new
+connections they needed.
+"""
+
+
+@dataclass
+class PoolConfig:
+    pool_connections: int = 4  # hosts kept (screener, trading, data, ...)
+    pool_maxsize: int = 16  # open connections per host, >= the order/fetch workers
+    connect_timeout: float = 3.05
+    read_timeout: float = 10.0
+    retries: int = 2
+    backoff_factor: float = 0.3
+    retry_statuses: Tuple[int, ...] = (502, 503, 504)
+
+    def retry(self) -> Retry:
+        # POST (orders) is only retried when the connection failed before sending
+        return Retry(
+            total=self.retries, connect=self.retries, read=self.retries, status=self.retries,
+            backoff_factor=self.backoff_factor, status_forcelist=self.retry_statuses,
+            raise_on_status=False, respect_retry_after_header=True,
+        )
+
+
+class ConnectionStats:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+
+    def on_request(self) -> None:
+        with self.lock:
+            self.requests += 1
+        metrics.count("http.requests")
+
+    def on_connection(self) -> None:
+        with self.lock:
+            self.connections += 1
+        metrics.count("http.connections")
+
+    def snapshot(self) -> Dict[str, float]:
+        with self.lock:
+            requests_sent, connections = self.requests, self.connections
+        reused = max(0, requests_sent - connections)
+        return {
+            "requests": requests_sent,
+            "connections": connections,
+            "reused": reused,
+            "reuse_ratio": reused / requests_sent if requests_sent else 0.0,
+        }
+
+
+def _counting_pool(base: type, stats: ConnectionStats) -> type:
+    class CountingPool(base):
+        def _new_conn(self):
+            stats.on_connection()
+            return super()._new_conn()
+
+    return CountingPool
+
+
+class PooledAdapter(HTTPAdapter):
+    def __init__(self, config: PoolConfig, stats: ConnectionStats) -> None:
+        self.pool_config = config  # HTTPAdapter has a `config` of its own
+        self.stats = stats
+        super().__init__(pool_connections=config.pool_connections, pool_maxsize=config.pool_maxsize, max_retries=config.retry())
+
+    def init_poolmanager(self, *args, **kwargs) -> None:
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _counting_pool(HTTPConnectionPool, self.stats),
+            "https": _counting_pool(HTTPSConnectionPool, self.stats),
+        }
+
+    def send(self, request, timeout=None, **kwargs):
+        self.stats.on_request()
+        if timeout is None:
+            timeout = (self.pool_config.connect_timeout, self.pool_config.read_timeout)
+        return super().send(request, timeout=timeout, **kwargs)
+
+
+def new_session(config: Optional[PoolConfig] = None, stats: Optional[ConnectionStats] = None) -> requests.Session:
+    session = requests.Session()
+    adapter = PooledAdapter(config or PoolConfig(), stats or ConnectionStats())
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def session_stats(session: requests.Session) -> Dict[str, float]:
+    adapter = session.get_adapter("https://")
+    return adapter.stats.snapshot() if isinstance(adapter, PooledAdapter) else {}
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    # The process-wide session, built on first use
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = new_session()
+        return _session
+
+
+def stats() -> Dict[str, float]:
+    return session_stats(get_session())
+
+
+def print_stats(session: Optional[requests.Session] = None) -> None:
+    snapshot = session_stats(session or get_session())
+    if snapshot.get("requests"):
+        print(
+            f"{bcolors.OKCYAN}HTTP: {snapshot['requests']} requests over {snapshot['connections']} connections "
+            f"({snapshot['reuse_ratio']:.0%} reused){bcolors.ENDC}"
+        )
+
+
+class ClientFactory:
+    """
+    Builds the API clients once per process, all on one pooled session.
+    Clients are cached by their arguments, so paper_bot, bot and the CLI
+    asking for "the trading client" share an instance.
+    """
+
+    def __init__(self, api_key: Optional[str], secret_key: Optional[str], paper: bool = True, url_override: Optional[str] = None, session: Optional[requests.Session] = None) -> None:
+        self.api_key = api_key
+        self.secret_key = secret_key
+        self.paper = paper
+        self.url_override = url_override
+        self.session = session or get_session()
+        self.clients: Dict[tuple, object] = {}
+        self.lock = threading.Lock()
+
+    def _cached(self, key: tuple, build):
+        with self.lock:
+            client = self.clients.get(key)
+            if client is None:
+                client = self.clients[key] = build()
+            return client
+
+    def _share_session(self, client):
+        # The SDK's RESTClient builds a Session of its own; swap in the pooled one
+        client._session.close()
+        client._session = self.session
+        return client
+
+    def trading_client(self):
+        from alpaca.trading.client import TradingClient
+
+        return self._cached(("trading",), lambda: self._share_session(TradingClient(
+            self.api_key, self.secret_key, paper=self.paper, url_override=self.url_override)))
+
+    def data_client(self, raw_data: bool = True):
+        # Raw mode by default: plain dicts, decoded straight into columns (records.py)
+        from alpaca.data.historical.stock import StockHistoricalDataClient
+
+        return self._cached(("data", raw_data), lambda: self._share_session(StockHistoricalDataClient(
+            self.api_key, self.secret_key, raw_data=raw_data, url_override=self.url_override)))
+
+    def lite_client(self):
+        from lite_client import LiteClient
+
+        return self._cached(("lite",), lambda: LiteClient(
+            self.api_key, self.secret_key, paper=self.paper, url_override=self.url_override, session=self.session))
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return session_stats(self.session)
@@ -0,0 +1,268 @@
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+from bar_store import BarStore, open_bar_store
+
+if TYPE_CHECKING:
+    # pandas is only needed to hand results back as DataFrames
+    import pandas as pd
+
+"""
+Vectorized indicators over a (symbols x time) panel.
+
+Each row holds one symbol's own bar sequence, right-aligned so the latest bar
+of every symbol sits in the last column and shorter histories are NaN-padded on
+the left. That is exactly the series stock_analysis.py builds per ticker, so
+every indicator matches the per-ticker talib/pandas results; the recursive ones
+(EMA, Wilder RSI) loop over time once with numpy ops across all symbols.
+"""
+
+
+@dataclass(frozen=True)
+class IndicatorParams:
+    sma_fast: int = 50
+    sma_slow: int = 200
+    rsi_period: int = 14
+    rsi_avg_period: int = 15
+    macd_fast: int = 12
+    macd_slow: int = 26
+    macd_signal: int = 9
+    stoch_fastk: int = 5
+    stoch_k: int = 14
+    stoch_d: int = 3
+
+
+INDICATOR_COLUMNS = (
+    "sma_f",
+    "sma_s",
+    "rsi",
+    "sma_r",
+    "macd",
+    "macdSignal",
+    "macdHist",
+    "stoch_k",
+    "stoch_d",
+    "macdHistDeriv",
+    "macdHistDeriv2",
+)
+
+
+class Panel:
+    """Right-aligned (symbols x time) bar arrays, NaN where a symbol has no bar."""
+
+    def __init__(self, symbols: List[str], lengths: np.ndarray, columns: Dict[str, np.ndarray]) -> None:
+        self.symbols = symbols
+        self.lengths = lengths
+        self.columns = columns
+        self.index = {symbol: i for i, symbol in enumerate(symbols)}
+
+    @property
+    def shape(self):
+        return self.columns["close"].shape
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def row(self, symbol: str) -> slice:
+        width = self.shape[1]
+        return slice(width - int(self.lengths[self.index[symbol]]), width)
+
+
+def load_panel(
+    store: Optional[BarStore] = None,
+    symbols: Optional[List[str]] = None,
+    lookback: Optional[int] = None,
+    fields=("timestamp", "open", "high", "low", "close", "volume"),
+) -> Panel:
+    # Keeps the last `lookback` bars of every symbol (all of them if None)
+    store = store or open_bar_store()
+    symbols = store.symbols() if symbols is None else symbols
+    reads = [store.read(symbol) for symbol in symbols]
+    lengths = np.array([len(read["timestamp"]) for read in reads], dtype=np.int64)
+    if lookback is not None:
+        lengths = np.minimum(lengths, lookback)
+    width = int(lengths.max()) if len(lengths) else 0
+    columns = {}
+    for field in fields:
+        if field == "timestamp":
+            panel = np.zeros((len(symbols), width), dtype=np.int64)
+        else:
+            panel = np.full((len(symbols), width), np.nan)
+        for i, read in enumerate(reads):
+            if lengths[i]:
+                panel[i, width - lengths[i]:] = read[field][-lengths[i]:]
+        columns[field] = panel
+    return Panel(list(symbols), lengths, columns)
+
+
+def panel_from_frame(symbol: str, df: "pd.DataFrame") -> Panel:
+    # One-row panel from a bar DataFrame (bar_store.columns_to_frame layout)
+    columns = {"timestamp": df.index.as_unit("ns").asi8[None, :]}
+    for field in ("open", "high", "low", "close", "volume"):
+        columns[field] = df[field].to_numpy(dtype=np.float64)[None, :]
+    return Panel([symbol], np.array([len(df)]), columns)
+
+
+def first_valid(x: np.ndarray) -> np.ndarray:
+    # Index of the first non-NaN value per row (row width if none)
+    valid = ~np.isnan(x)
+    return np.where(valid.any(axis=1), valid.argmax(axis=1), x.shape[1])
+
+
+def rows_by_step(steps: np.ndarray, width: int) -> List[np.ndarray]:
+    # Groups row indices by the time step they hit (e.g. where an EMA is seeded)
+    order = np.argsort(steps, kind="stable")
+    bounds = np.searchsorted(steps[order], np.arange(width + 1))
+    return [order[bounds[t]: bounds[t + 1]] for t in range(width)]
+
+
+def rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    # pandas rolling(window).mean() per row: NaN unless the whole window is valid
+    valid = ~np.isnan(x)
+    sums = np.cumsum(np.where(valid, x, 0.0), axis=1)
+    counts = np.cumsum(valid, axis=1, dtype=np.int32)
+    sums[:, window:] = sums[:, window:] - sums[:, :-window]
+    counts[:, window:] = counts[:, window:] - counts[:, :-window]
+    return np.where(counts == window, sums / window, np.nan)
+
+
+def rolling_extreme(x: np.ndarray, window: int, func) -> np.ndarray:
+    # func is np.maximum or np.minimum (NaN-propagating), folded over the
+    # window's shifted copies
+    out = np.full(x.shape, np.nan)
+    if x.shape[1] >= window:
+        width = x.shape[1] - window + 1
+        acc = x[:, :width].copy()
+        for shift in range(1, window):
+            func(acc, x[:, shift: shift + width], out=acc)
+        out[:, window - 1:] = acc
+    return out
+
+
+def ema(x: np.ndarray, period: int, seed_offset: Optional[int] = None) -> np.ndarray:
+    # talib EMA: seeded with the SMA of the `period` values ending at the seed,
+    # which is period - 1 (or seed_offset) bars after each row's first value.
+    # Runs time-major so each step is one contiguous vector op across symbols.
+    k = 2.0 / (period + 1)
+    seed = rolling_mean(x, period).T
+    seed_rows = rows_by_step(first_valid(x) + (period - 1 if seed_offset is None else seed_offset), x.shape[1])
+    xt = np.ascontiguousarray(x.T)
+    out = np.empty_like(xt)
+    prev = np.full(x.shape[0], np.nan)
+    for t in range(xt.shape[0]):
+        # Unseeded rows stay NaN, NaN propagates through the update
+        prev += k * (xt[t] - prev)
+        rows = seed_rows[t]
+        prev[rows] = seed[t, rows]
+        out[t] = prev
+    return out.T
+
+
+def rsi(close: np.ndarray, period: int) -> np.ndarray:
+    # talib RSI: Wilder smoothing seeded with the mean gain/loss of the first `period` changes
+    delta = np.diff(close, axis=1, prepend=np.nan)
+    gain = np.where(delta > 0, delta, np.where(np.isnan(delta), np.nan, 0.0))
+    loss = np.where(delta < 0, -delta, np.where(np.isnan(delta), np.nan, 0.0))
+    gain_seed = rolling_mean(gain, period).T
+    loss_seed = rolling_mean(loss, period).T
+    seed_rows = rows_by_step(first_valid(close) + period, close.shape[1])
+    gain_t = np.ascontiguousarray(gain.T)
+    loss_t = np.ascontiguousarray(loss.T)
+    avg_gain = np.full(close.shape[0], np.nan)
+    avg_loss = np.full(close.shape[0], np.nan)
+    gains = np.empty_like(gain_t)
+    totals = np.empty_like(gain_t)
+    for t in range(gain_t.shape[0]):
+        avg_gain *= period - 1
+        avg_gain += gain_t[t]
+        avg_gain /= period
+        avg_loss *= period - 1
+        avg_loss += loss_t[t]
+        avg_loss /= period
+        rows = seed_rows[t]
+        avg_gain[rows] = gain_seed[t, rows]
+        avg_loss[rows] = loss_seed[t, rows]
+        gains[t] = avg_gain
+        np.add(avg_gain, avg_loss, out=totals[t])
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals != 0, 100.0 * gains / totals, 0.0).T
+
+
+def macd(close: np.ndarray, fast: int, slow: int, signal: int):
+    # talib MACD: both EMAs start at the slow EMA's seed, output starts once the signal is seeded
+    fast_ema = ema(close, fast, seed_offset=slow - 1)
+    slow_ema = ema(close, slow)
+    line = fast_ema - slow_ema
+    signal_line = ema(line, signal)
+    line = np.where(np.isnan(signal_line), np.nan, line)
+    return line, signal_line, line - signal_line
+
+
+def stoch(high: np.ndarray, low: np.ndarray, close: np.ndarray, fastk: int, slowk: int, slowd: int):
+    # talib STOCH with SMA smoothing (slowk_matype=slowd_matype=0)
+    highest = rolling_extreme(high, fastk, np.maximum)
+    lowest = rolling_extreme(low, fastk, np.minimum)
+    spread = highest - lowest
+    with np.errstate(invalid="ignore", divide="ignore"):
+        fast_k = np.where(spread != 0, (close - lowest) / spread * 100.0, 0.0)
+    fast_k[np.isnan(spread)] = np.nan
+    slow_k = rolling_mean(fast_k, slowk)
+    slow_d = rolling_mean(slow_k, slowd)
+    slow_k = np.where(np.isnan(slow_d), np.nan, slow_k)
+    return slow_k, slow_d
+
+
+class IndicatorResult:
+    """Indicator arrays shaped like the panel, queryable per symbol or for the latest bar."""
+
+    def __init__(self, panel: Panel, columns: Dict[str, np.ndarray]) -> None:
+        self.panel = panel
+        self.columns = columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self.columns[name]
+
+    def latest(self) -> "pd.DataFrame":
+        import pandas as pd
+
+        return pd.DataFrame(
+            {name: values[:, -1] for name, values in self.columns.items()},
+            index=pd.Index(self.panel.symbols, name="symbol"),
+        )
+
+    def frame(self, symbol: str) -> "pd.DataFrame":
+        # Same layout as stock_analysis.py's `analysis` frame
+        import pandas as pd
+
+        row = self.panel.row(symbol)
+        i = self.panel.index[symbol]
+        index = pd.DatetimeIndex(
+            pd.to_datetime(self.panel["timestamp"][i, row], unit="ns", utc=True), name="timestamp"
+        )
+        return pd.DataFrame({name: values[i, row] for name, values in self.columns.items()}, index=index)
+
+
+def compute_indicators(panel: Panel, params: IndicatorParams = IndicatorParams()) -> IndicatorResult:
+    close, high, low = panel["close"], panel["high"], panel["low"]
+    out = {}
+    out["sma_f"] = rolling_mean(close, params.sma_fast)
+    out["sma_s"] = rolling_mean(close, params.sma_slow)
+    out["rsi"] = rsi(close, params.rsi_period)
+    out["sma_r"] = rolling_mean(out["rsi"], params.rsi_avg_period)
+    out["macd"], out["macdSignal"], out["macdHist"] = macd(
+        close, params.macd_fast, params.macd_slow, params.macd_signal
+    )
+    out["stoch_k"], out["stoch_d"] = stoch(
+        high, low, close, params.stoch_fastk, params.stoch_k, params.stoch_d
+    )
+    if close.shape[1] >= 2:
+        deriv = np.gradient(out["macdHist"], axis=1)
+        deriv2 = np.gradient(deriv, axis=1)
+    else:
+        deriv = deriv2 = np.full(close.shape, np.nan)
+    # np.sign keeps NaN, like the pandas columns in stock_analysis.py
+    out["macdHistDeriv"] = np.sign(deriv)
+    out["macdHistDeriv2"] = np.sign(deriv2)
+    return IndicatorResult(panel, out)
@@ -0,0 +1,134 @@
+import json
+import ssl
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Union
+from urllib.error import HTTPError
+from urllib.parse import urlencode
+from urllib.request import Request, urlopen
+
+"""
+Standard-library stand-ins for the few Alpaca SDK pieces a short cron run needs.
+
+Importing the SDK's request models pulls in pandas and pydantic, which is
+most of a cold start. OrderSpec and LatestBarsRequest give the same
+to_request_fields() as LimitOrderRequest / MarketOrderRequest and
+StockLatestBarRequest, so the SDK clients accept them as well. LiteClient
+answers submit_order, get_order_by_client_id, get_account, get_all_positions and get_stock_latest_bar
+over urllib (or a pooled requests session from http_pool.py when one is
+given), returning what the SDK returns in raw mode: plain dicts for bars, and
+string-typed namespaces for orders, accounts and positions.
+"""
+
+PAPER_URL = "https://paper-api.alpaca.markets"
+LIVE_URL = "https://api.alpaca.markets"
+DATA_URL = "https://data.alpaca.markets"
+
+
+class LiteAPIError(Exception):
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(f"{status_code}: {message}")
+        self.status_code = status_code
+
+
+class OrderSpec:
+    __slots__ = ("symbol", "qty", "side", "type", "time_in_force", "limit_price", "extended_hours", "client_order_id")
+
+    def __init__(
+        self,
+        symbol: str,
+        qty: float,
+        side: str,
+        type: str = "market",
+        time_in_force: str = "day",
+        limit_price: Optional[float] = None,
+        extended_hours: Optional[bool] = None,
+        client_order_id: Optional[str] = None,
+    ) -> None:
+        self.symbol = symbol
+        self.qty = float(qty)
+        self.side = side
+        self.type = type
+        self.time_in_force = time_in_force
+        self.limit_price = limit_price
+        self.extended_hours = extended_hours
+        self.client_order_id = client_order_id
+
+    @classmethod
+    def limit(cls, symbol: str, qty: float, side: str, limit_price: float, time_in_force: str = "day", extended_hours: bool = True) -> "OrderSpec":
+        return cls(symbol, qty, side, "limit", time_in_force, limit_price, extended_hours)
+
+    @classmethod
+    def market(cls, symbol: str, qty: float, side: str, time_in_force: str = "day") -> "OrderSpec":
+        return cls(symbol, qty, side, "market", time_in_force)
+
+    def to_request_fields(self) -> dict:
+        # Unset fields are left out, like the SDK's NonEmptyRequest
+        return {name: getattr(self, name) for name in self.__slots__ if getattr(self, name) is not None}
+
+
+class LatestBarsRequest:
+    __slots__ = ("symbol_or_symbols",)
+
+    def __init__(self, symbol_or_symbols: Union[str, List[str]]) -> None:
+        self.symbol_or_symbols = symbol_or_symbols
+
+    def to_request_fields(self) -> dict:
+        symbols = self.symbol_or_symbols
+        return {"symbols": symbols if isinstance(symbols, str) else ",".join(symbols)}
+
+
+def _namespace(payload: dict) -> SimpleNamespace:
+    # Attribute access like the SDK models; numbers stay strings as sent
+    return SimpleNamespace(**payload)
+
+
+class LiteClient:
+    """Trading and market data endpoints over urllib, with one client for both."""
+
+    def __init__(self, api_key: Optional[str], secret_key: Optional[str], paper: bool = True, url_override: Optional[str] = None, timeout: float = 10.0, session=None) -> None:
+        self.trading_url = (url_override or (PAPER_URL if paper else LIVE_URL)).rstrip("/")
+        self.data_url = (url_override or DATA_URL).rstrip("/")
+        self.headers = {
+            "APCA-API-KEY-ID": api_key or "",
+            "APCA-API-SECRET-KEY": secret_key or "",
+            "Content-Type": "application/json",
+        }
+        self.timeout = timeout
+        self.session = session
+        self.context = ssl.create_default_context() if session is None else None
+
+    def _request(self, method: str, url: str, body: Optional[dict] = None):
+        if self.session is not None:
+            response = self.session.request(method, url, json=body, headers=self.headers, timeout=self.timeout)
+            if response.status_code >= 400:
+                raise LiteAPIError(response.status_code, response.text)
+            return response.json() if response.content else None
+        data = json.dumps(body).encode() if body is not None else None
+        request = Request(url, data=data, headers=self.headers, method=method)
+        try:
+            with urlopen(request, timeout=self.timeout, context=self.context if url.startswith("https") else None) as response:
+                return json.loads(response.read() or b"null")
+        except HTTPError as e:
+            raise LiteAPIError(e.code, e.read().decode(errors="replace")) from None
+
+    def submit_order(self, order_data) -> SimpleNamespace:
+        # OrderSpec or any SDK OrderRequest
+        fields = {
+            name: getattr(value, "value", value)
+            for name, value in order_data.to_request_fields().items()
+        }
+        return _namespace(self._request("POST", self.trading_url + "/v2/orders", fields))
+
+    def get_order_by_client_id(self, client_id: str) -> SimpleNamespace:
+        query = urlencode({"client_order_id": client_id})
+        return _namespace(self._request("GET", f"{self.trading_url}/v2/orders:by_client_order_id?{query}"))
+
+    def get_account(self) -> SimpleNamespace:
+        return _namespace(self._request("GET", self.trading_url + "/v2/account"))
+
+    def get_all_positions(self) -> List[SimpleNamespace]:
+        return [_namespace(position) for position in self._request("GET", self.trading_url + "/v2/positions")]
+
+    def get_stock_latest_bar(self, request_params) -> Dict[str, dict]:
+        query = urlencode(request_params.to_request_fields())
+        return self._request("GET", f"{self.data_url}/v2/stocks/bars/latest?{query}").get("bars", {})
@@ -0,0 +1,149 @@
+import os
+from bisect import bisect_left, bisect_right
+from datetime import date, datetime, timedelta, timezone
+from typing import List, Optional, Tuple, Union
+
+import numpy as np
+
+"""
+Precomputed NYSE session index.
+
+pandas_market_calendars is only used to build the index (and only imported
+then); the result is cached in output/calendar/<name>.npz as three arrays:
+session dates (proleptic ordinals), and open/close times in epoch ns (UTC).
+Lookups are bisects over plain lists, a few microseconds each.
+"""
+
+DEFAULT_CACHE_DIR = "output/calendar"
+DEFAULT_RANGE = (date(2000, 1, 1), date(2035, 12, 31))
+MINUTE_NS = 60_000_000_000
+
+DateLike = Union[date, datetime]
+
+
+def to_ns(t: datetime) -> int:
+    # Naive datetimes are taken as UTC, like the rest of the bot
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=timezone.utc)
+    return int(t.timestamp()) * 1_000_000_000 + t.microsecond * 1000
+
+
+def from_ns(ns: int) -> datetime:
+    return datetime.fromtimestamp(ns // 1_000_000_000, tz=timezone.utc) + timedelta(microseconds=ns % 1_000_000_000 // 1000)
+
+
+def to_ordinal(day: DateLike) -> int:
+    return (day.date() if isinstance(day, datetime) else day).toordinal()
+
+
+class SessionIndex:
+    def __init__(self, days: np.ndarray, opens: np.ndarray, closes: np.ndarray) -> None:
+        self.days_array = days
+        self.opens_array = opens
+        self.closes_array = closes
+        # Plain lists: bisect on them beats a numpy call for single lookups
+        self.days: List[int] = days.tolist()
+        self.opens: List[int] = opens.tolist()
+        self.closes: List[int] = closes.tolist()
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def covers(self, day: DateLike) -> bool:
+        return bool(self.days) and self.days[0] <= to_ordinal(day) <= self.days[-1]
+
+    # -- sessions by date -----------------------------------------------------
+
+    def is_session(self, day: DateLike) -> bool:
+        ordinal = to_ordinal(day)
+        i = bisect_left(self.days, ordinal)
+        return i < len(self.days) and self.days[i] == ordinal
+
+    def session_on_or_before(self, day: DateLike) -> Optional[date]:
+        i = bisect_right(self.days, to_ordinal(day)) - 1
+        return date.fromordinal(self.days[i]) if i >= 0 else None
+
+    def previous_session(self, day: DateLike) -> Optional[date]:
+        i = bisect_left(self.days, to_ordinal(day)) - 1
+        return date.fromordinal(self.days[i]) if i >= 0 else None
+
+    def next_session(self, day: DateLike) -> Optional[date]:
+        i = bisect_right(self.days, to_ordinal(day))
+        return date.fromordinal(self.days[i]) if i < len(self.days) else None
+
+    def session_bounds(self, day: DateLike) -> Optional[Tuple[datetime, datetime]]:
+        ordinal = to_ordinal(day)
+        i = bisect_left(self.days, ordinal)
+        if i == len(self.days) or self.days[i] != ordinal:
+            return None
+        return from_ns(self.opens[i]), from_ns(self.closes[i])
+
+    # -- sessions by time -----------------------------------------------------
+
+    def is_open(self, t: datetime) -> bool:
+        ns = to_ns(t)
+        i = bisect_right(self.opens, ns) - 1
+        return i >= 0 and ns < self.closes[i]
+
+    def last_close(self, t: datetime) -> Optional[datetime]:
+        i = bisect_right(self.closes, to_ns(t)) - 1
+        return from_ns(self.closes[i]) if i >= 0 else None
+
+    def next_open(self, t: datetime) -> Optional[datetime]:
+        i = bisect_right(self.opens, to_ns(t))
+        return from_ns(self.opens[i]) if i < len(self.opens) else None
+
+    def last_trading_minutes(self, t: datetime, n: int) -> np.ndarray:
+        # Start times (epoch ns) of the last n complete regular-session minute
+        # bars at or before t, oldest first
+        ns = to_ns(t) // MINUTE_NS * MINUTE_NS
+        i = bisect_right(self.opens, ns - 1) - 1
+        chunks = []
+        remaining = n
+        while remaining > 0 and i >= 0:
+            stop = min(ns, self.closes[i])
+            count = min(remaining, max(0, (stop - self.opens[i]) // MINUTE_NS))
+            if count:
+                chunks.append(stop - MINUTE_NS * np.arange(count, 0, -1, dtype=np.int64))
+                remaining -= count
+            i -= 1
+        if not chunks:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(chunks[::-1])
+
+    def sessions_between(self, start: DateLike, end: DateLike) -> np.ndarray:
+        lo = bisect_left(self.days, to_ordinal(start))
+        hi = bisect_right(self.days, to_ordinal(end))
+        return np.arange(lo, hi)
+
+
+def build_session_index(name: str = "NYSE", start: date = DEFAULT_RANGE[0], end: date = DEFAULT_RANGE[1]) -> SessionIndex:
+    import pandas_market_calendars as mcal
+
+    schedule = mcal.get_calendar(name).schedule(start_date=start, end_date=end)
+    days = np.array([day.toordinal() for day in schedule.index.date], dtype=np.int32)
+    opens = schedule["market_open"].dt.as_unit("ns").astype("int64").to_numpy()
+    closes = schedule["market_close"].dt.as_unit("ns").astype("int64").to_numpy()
+    return SessionIndex(days, opens, closes)
+
+
+def load_session_index(name: str = "NYSE", cache_dir: str = DEFAULT_CACHE_DIR, start: date = DEFAULT_RANGE[0], end: date = DEFAULT_RANGE[1]) -> SessionIndex:
+    path = os.path.join(cache_dir, f"{name.lower()}_sessions.npz")
+    if os.path.exists(path):
+        cached = np.load(path)
+        if int(cached["start"]) <= start.toordinal() and int(cached["end"]) >= end.toordinal():
+            return SessionIndex(cached["days"], cached["opens"], cached["closes"])
+    index = build_session_index(name, start, end)
+    os.makedirs(cache_dir, exist_ok=True)
+    np.savez(path, days=index.days_array, opens=index.opens_array, closes=index.closes_array, start=start.toordinal(), end=end.toordinal())
+    return index
+
+
+_indexes = {}
+
+
+def get_session_index(name: str = "NYSE") -> SessionIndex:
+    # Loaded on first use and kept for the life of the process
+    if name not in _indexes:
+        _indexes[name] = load_session_index(name)
+    return _indexes[name]
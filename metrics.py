@@ -0,0 +1,257 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional
+
+"""
+Opt-in timing spans and counters for the hot paths.
+
+    with metrics.span("fetch_bars"): ...
+    @metrics.timed("api.fetch_stock_tickers")
+    metrics.count("bars_written", n)
+
+Off unless BOT_METRICS=1 is in the environment (or metrics.enable() is
+called); entry points that load a .env file call enable_from_env() after it.
+While off, span() hands back one shared no-op context manager and
+timed()/count() return after a single global check, so the instrumented
+functions cost a few hundred nanoseconds more per call.
+
+While on, every span feeds a histogram, and metrics.end_cycle() (called once
+per bot cycle) appends that cycle's span totals and counter deltas to
+output/metrics/cycles.jsonl. With BOT_METRICS_PORT set, the histograms and
+counters are also served in the Prometheus text format at /metrics.
+"""
+
+DEFAULT_METRICS_PATH = "output/metrics/cycles.jsonl"
+# Histogram bucket upper bounds, seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_enabled = False
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)  # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Registry:
+    def __init__(self, path: Optional[str] = DEFAULT_METRICS_PATH) -> None:
+        self.path = path
+        self.lock = threading.Lock()
+        self.histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        # Since the last end_cycle(): name -> [count, total seconds, max seconds]
+        self.cycle_spans: Dict[str, List[float]] = {}
+        self.cycle_counters: Dict[str, float] = {}
+        self.cycles = 0
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+            totals = self.cycle_spans.get(name)
+            if totals is None:
+                self.cycle_spans[name] = [1, seconds, seconds]
+            else:
+                totals[0] += 1
+                totals[1] += seconds
+                totals[2] = max(totals[2], seconds)
+
+    def count(self, name: str, value: float = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+            self.cycle_counters[name] = self.cycle_counters.get(name, 0) + value
+
+    def end_cycle(self) -> dict:
+        with self.lock:
+            self.cycles += 1
+            record = {
+                "cycle": self.cycles,
+                "time": datetime.now(timezone.utc).isoformat(),
+                "spans": {
+                    name: {"count": int(count), "total_ms": total * 1000, "max_ms": longest * 1000}
+                    for name, (count, total, longest) in sorted(self.cycle_spans.items())
+                },
+                "counters": dict(sorted(self.cycle_counters.items())),
+            }
+            self.cycle_spans = {}
+            self.cycle_counters = {}
+        if self.path:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        return record
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self.lock:
+            for name, histogram in sorted(self.histograms.items()):
+                metric = "bot_span_seconds"
+                label = name.replace('"', "'")
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.buckets):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{metric}_bucket{{span="{label}",le="{le}"}} {cumulative}')
+                lines.append(f'{metric}_sum{{span="{label}"}} {histogram.sum}')
+                lines.append(f'{metric}_count{{span="{label}"}} {histogram.count}')
+            for name, value in sorted(self.counters.items()):
+                metric = f"bot_{prometheus_name(name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+            lines.append("# TYPE bot_cycles_total counter")
+            lines.append(f"bot_cycles_total {self.cycles}")
+        header = ["# TYPE bot_span_seconds histogram"] if self.histograms else []
+        return "\n".join(header + lines) + "\n"
+
+
+def prometheus_name(name: str) -> str:
+    return "".join(c if c.isalnum() else "_" for c in name)
+
+
+registry = Registry()
+
+
+# -- the instrumentation API ------------------------------------------------
+
+class Span:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> "Span":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        registry.observe(self.name, time.perf_counter() - self.start)
+
+
+class NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+def span(name: str):
+    return Span(name) if _enabled else NULL_SPAN
+
+
+def timed(name: Optional[str] = None) -> Callable:
+    def decorate(fn: Callable) -> Callable:
+        label = name or fn.__qualname__
+
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await fn(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    registry.observe(label, time.perf_counter() - start)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                registry.observe(label, time.perf_counter() - start)
+
+        return wrapper
+
+    return decorate
+
+
+def count(name: str, value: float = 1) -> None:
+    if _enabled:
+        registry.count(name, value)
+
+
+def observe(name: str, seconds: float) -> None:
+    # For durations measured anyway (e.g. order latency)
+    if _enabled:
+        registry.observe(name, seconds)
+
+
+def end_cycle() -> Optional[dict]:
+    return registry.end_cycle() if _enabled else None
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def enable(path: Optional[str] = DEFAULT_METRICS_PATH, port: Optional[int] = None) -> None:
+    global _enabled
+    registry.path = path
+    _enabled = True
+    if port is not None:
+        serve_prometheus(port)
+
+
+def enable_from_env() -> None:
+    # BOT_METRICS, BOT_METRICS_PORT and BOT_METRICS_PATH; a no-op once enabled
+    if not _enabled and os.getenv("BOT_METRICS", "").lower() in ("1", "true", "yes"):
+        port = os.getenv("BOT_METRICS_PORT")
+        enable(os.getenv("BOT_METRICS_PATH", DEFAULT_METRICS_PATH), int(port) if port else None)
+
+
+def disable() -> None:
+    global _enabled
+    _enabled = False
+
+
+def serve_prometheus(port: int, host: str = "127.0.0.1"):
+    # http.server is only loaded when the endpoint is turned on
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render_prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args) -> None:
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+enable_from_env()
@@ -0,0 +1,395 @@
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Set, Tuple
+
+import metrics
+from bar_store import to_epoch_ns
+from bcolors import bcolors
+
+"""
+Order state kept from trade updates instead of polling.
+
+OrderBook tracks every order the bot submits, keyed by client_order_id, and
+indexes the open ones by (symbol, side), so decision code can ask
+has_open("AAPL", "buy") without a network call. State changes only come from
+submit responses and trade-update events (TradingStream in raw mode, or
+replay.FakeTradeStream offline); an update older than what the book already
+has (redelivered after a reconnect, or out of order) is ignored.
+
+Resubmits are deduplicated by client_order_id. submit() assigns one when the
+request has none (derived from `key` when given, so a retried decision maps
+to the same order), returns the tracked order instead of calling the API
+when that id is already known, and takes the API's "client_order_id must be
+unique" rejection to mean an earlier attempt got through.
+
+OrderJournal appends one compact JSON line per state change, the
+pending_new line before the order goes out. Loading replays it, the last
+line of an order wins; compact() rewrites it with just the current state.
+After a restart, reconcile() asks the API once per order the journal left
+open.
+"""
+
+DEFAULT_JOURNAL_PATH = "output/orders/journal.jsonl"
+
+TERMINAL_STATUSES = frozenset({"filled", "canceled", "expired", "rejected", "replaced"})
+# Trade update event -> order status, for updates whose order has no status
+EVENT_STATUSES = {"fill": "filled", "partial_fill": "partially_filled"}
+DUPLICATE_MESSAGE = "client_order_id must be unique"
+
+
+def _value(value) -> Optional[str]:
+    # Enums (side, status) as their plain value
+    value = getattr(value, "value", value)
+    return None if value is None else str(value)
+
+
+def _float(value) -> Optional[float]:
+    return None if value is None or value == "" else float(value)
+
+
+def _field(obj, name: str):
+    return obj.get(name) if isinstance(obj, dict) else getattr(obj, name, None)
+
+
+def time_ns(value) -> int:
+    # API timestamps: datetimes from the SDK models, RFC 3339 strings (with up
+    # to nanosecond fractions) from raw payloads
+    if value is None:
+        return 0
+    if not isinstance(value, str):
+        return to_epoch_ns(value)
+    nanos = 0
+    fraction = re.search(r"\.(\d+)", value)
+    if fraction:
+        digits = fraction.group(1)
+        nanos = int(digits[6:9].ljust(3, "0"))
+        value = value[:fraction.start()] + "." + digits[:6].ljust(6, "0") + value[fraction.end():]
+    return to_epoch_ns(datetime.fromisoformat(value.replace("Z", "+00:00"))) + nanos
+
+
+def new_client_order_id(key: Optional[str] = None) -> str:
+    # Same key, same id; no key, a random one
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, key) if key is not None else uuid.uuid4())
+
+
+class TrackedOrder:
+    __slots__ = ("client_order_id", "id", "symbol", "side", "qty", "limit_price", "filled_qty", "filled_avg_price", "status", "updated_at")
+
+    def __init__(self, client_order_id: str, id: Optional[str], symbol: str, side: str, qty: float, limit_price: Optional[float], filled_qty: float, filled_avg_price: Optional[float], status: str, updated_at: int) -> None:
+        self.client_order_id = client_order_id
+        self.id = id
+        self.symbol = symbol
+        self.side = side
+        self.qty = qty
+        self.limit_price = limit_price
+        self.filled_qty = filled_qty
+        self.filled_avg_price = filled_avg_price
+        self.status = status
+        self.updated_at = updated_at  # epoch ns
+
+    @property
+    def is_open(self) -> bool:
+        return self.status not in TERMINAL_STATUSES
+
+    @property
+    def remaining(self) -> float:
+        return max(0.0, self.qty - self.filled_qty) if self.is_open else 0.0
+
+
+# Journal lines: one short key per TrackedOrder slot
+JOURNAL_KEYS = dict(zip(TrackedOrder.__slots__, "cisdqlfptu"))
+
+
+class OrderJournal:
+    """Append-only JSON lines, one per order state change."""
+
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH, fsync: bool = False) -> None:
+        self.path = path
+        self.fsync = fsync
+        self.file = None
+        self.lines = 0
+
+    def load(self) -> List[TrackedOrder]:
+        latest: Dict[str, TrackedOrder] = {}
+        self.lines = 0
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # A line cut short by a crash
+                    continue
+                order = TrackedOrder(*(row.get(key) for key in JOURNAL_KEYS.values()))
+                latest[order.client_order_id] = order
+                self.lines += 1
+        return list(latest.values())
+
+    def append(self, order: TrackedOrder) -> None:
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "a")
+        row = {key: getattr(order, name) for name, key in JOURNAL_KEYS.items() if getattr(order, name) is not None}
+        self.file.write(json.dumps(row, separators=(",", ":")) + "\n")
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.lines += 1
+
+    def compact(self, orders: Iterable[TrackedOrder]) -> None:
+        # Rewrites the journal with one line per order, swapped in atomically
+        self.close()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for order in orders:
+                row = {key: getattr(order, name) for name, key in JOURNAL_KEYS.items() if getattr(order, name) is not None}
+                f.write(json.dumps(row, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, self.path)
+        self.lines = 0
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class OrderBook:
+    def __init__(self, journal: Optional[OrderJournal] = None, retain_closed: float = 86_400.0, max_executions: int = 10_000) -> None:
+        self.journal = journal
+        self.orders: Dict[str, TrackedOrder] = {}
+        self.by_order_id: Dict[str, str] = {}
+        # (symbol, side) -> client_order_ids of its open orders
+        self.open_index: Dict[Tuple[str, str], Set[str]] = {}
+        # The most recent max_executions execution ids, to drop redelivered
+        # events; anything older is caught by the updated_at comparison
+        self.executions: Set[str] = set()
+        self.execution_order: Deque[str] = deque()
+        self.max_executions = max_executions
+        self.listeners: List[Callable[[TrackedOrder, str], None]] = []
+        self.lock = threading.RLock()
+        self.updates = 0
+        self.stale = 0
+        self.duplicates = 0
+        if journal is not None:
+            loaded = journal.load()
+            # Closed orders older than retain_closed seconds are dropped on load
+            cutoff = time.time_ns() - int(retain_closed * 1e9)
+            for order in loaded:
+                if order.is_open or order.updated_at >= cutoff:
+                    self._index(order)
+            if journal.lines > 2 * len(self.orders) + 1000:
+                journal.compact(self.orders.values())
+
+    # -- lookups (no network) ------------------------------------------------
+
+    def get(self, client_order_id: str) -> Optional[TrackedOrder]:
+        with self.lock:
+            return self.orders.get(client_order_id)
+
+    def by_id(self, order_id: str) -> Optional[TrackedOrder]:
+        with self.lock:
+            client_order_id = self.by_order_id.get(str(order_id))
+            return None if client_order_id is None else self.orders.get(client_order_id)
+
+    def has_open(self, symbol: str, side: Optional[str] = None) -> bool:
+        sides = ("buy", "sell") if side is None else (side,)
+        with self.lock:
+            return any(self.open_index.get((symbol, side)) for side in sides)
+
+    def open_orders(self, symbol: Optional[str] = None) -> List[TrackedOrder]:
+        with self.lock:
+            return [
+                self.orders[client_order_id]
+                for (order_symbol, _), ids in self.open_index.items()
+                if symbol is None or order_symbol == symbol
+                for client_order_id in ids
+            ]
+
+    def open_symbols(self, side: Optional[str] = None) -> Set[str]:
+        with self.lock:
+            return {symbol for (symbol, order_side), ids in self.open_index.items() if ids and (side is None or order_side == side)}
+
+    def subscribe(self, listener: Callable[[TrackedOrder, str], None]) -> None:
+        # listener(order, event) after every change the book accepts
+        self.listeners.append(listener)
+
+    # -- state changes --------------------------------------------------------
+
+    def _index(self, order: TrackedOrder) -> None:
+        self.orders[order.client_order_id] = order
+        if order.id:
+            self.by_order_id[order.id] = order.client_order_id
+        ids = self.open_index.setdefault((order.symbol, order.side), set())
+        if order.is_open:
+            ids.add(order.client_order_id)
+        else:
+            ids.discard(order.client_order_id)
+            if not ids:
+                del self.open_index[(order.symbol, order.side)]
+
+    def _commit(self, order: TrackedOrder, event: str) -> TrackedOrder:
+        self._index(order)
+        if self.journal is not None:
+            self.journal.append(order)
+        self.updates += 1
+        for listener in self.listeners:
+            listener(order, event)
+        return order
+
+    def apply_order(self, payload, event: Optional[str] = None) -> Optional[TrackedOrder]:
+        # An order as the API returns it (raw dict, SDK model or namespace)
+        client_order_id = _value(_field(payload, "client_order_id"))
+        if client_order_id is None:
+            return None
+        status = _value(_field(payload, "status")) or EVENT_STATUSES.get(event, event)
+        updated_at = time_ns(_field(payload, "updated_at")) or time.time_ns()
+        with self.lock:
+            current = self.orders.get(client_order_id)
+            # Only the broker's own timestamps are compared; a state set here
+            # (pending_new, a refused submit) gives way to any broker update
+            if current is not None and current.id is not None and updated_at < current.updated_at:
+                self.stale += 1
+                metrics.count("orders.stale_updates")
+                return current
+            filled_qty = _float(_field(payload, "filled_qty")) or 0.0
+            if current is not None and updated_at == current.updated_at and status == current.status and filled_qty == current.filled_qty:
+                # Already have it (the submit response and the update it raised)
+                return current
+            order = TrackedOrder(
+                client_order_id,
+                _value(_field(payload, "id")) or (current.id if current else None),
+                _value(_field(payload, "symbol")),
+                _value(_field(payload, "side")),
+                _float(_field(payload, "qty")) or (current.qty if current else 0.0),
+                _float(_field(payload, "limit_price")),
+                filled_qty,
+                _float(_field(payload, "filled_avg_price")),
+                status,
+                updated_at,
+            )
+            return self._commit(order, event or status)
+
+    def apply(self, update) -> Optional[TrackedOrder]:
+        # A trade update: the raw stream message ({"stream", "data"}), its
+        # data, or the SDK's TradeUpdate model
+        if isinstance(update, dict) and "data" in update:
+            update = update["data"]
+        event = _value(_field(update, "event"))
+        execution_id = _value(_field(update, "execution_id"))
+        with self.lock:
+            if execution_id is not None:
+                if execution_id in self.executions:
+                    self.stale += 1
+                    return self.orders.get(_value(_field(_field(update, "order"), "client_order_id")))
+                self.executions.add(execution_id)
+                self.execution_order.append(execution_id)
+                if len(self.execution_order) > self.max_executions:
+                    self.executions.discard(self.execution_order.popleft())
+            metrics.count(f"orders.events.{event}")
+            return self.apply_order(_field(update, "order"), event)
+
+    def submit(self, client, request, key: Optional[str] = None) -> TrackedOrder:
+        # Submits through `client` unless this client_order_id is known already
+        client_order_id = getattr(request, "client_order_id", None) or new_client_order_id(key)
+        with self.lock:
+            existing = self.orders.get(client_order_id)
+            if existing is not None:
+                self.duplicates += 1
+                metrics.count("orders.duplicates")
+                return existing
+            order = TrackedOrder(
+                client_order_id, None, request.symbol, _value(request.side), float(request.qty),
+                _float(getattr(request, "limit_price", None)), 0.0, None, "pending_new", time.time_ns(),
+            )
+            self._commit(order, "pending_new")
+        request.client_order_id = client_order_id
+        try:
+            response = client.submit_order(request)
+        except Exception as e:
+            if DUPLICATE_MESSAGE in str(e):
+                # An earlier attempt got through; its updates will follow
+                self.duplicates += 1
+                metrics.count("orders.duplicates")
+                return order
+            if getattr(e, "status_code", None) is not None and 400 <= e.status_code < 500:
+                # Refused outright, so there is nothing open at the broker
+                with self.lock:
+                    rejected = TrackedOrder(*(getattr(order, name) for name in TrackedOrder.__slots__))
+                    rejected.status, rejected.updated_at = "rejected", time.time_ns()
+                    self._commit(rejected, "rejected")
+            # Anything else (timeouts, 5xx) stays pending_new until an update or reconcile()
+            raise
+        return self.apply_order(response, "new") or order
+
+    def reconcile(self, client) -> int:
+        # After a restart: the current state of every order the journal left open
+        refreshed = 0
+        for order in self.open_orders():
+            try:
+                payload = client.get_order_by_client_id(order.client_order_id)
+            except Exception as e:
+                if getattr(e, "status_code", None) == 404:
+                    # Never reached the broker
+                    with self.lock:
+                        self._commit(TrackedOrder(
+                            order.client_order_id, order.id, order.symbol, order.side, order.qty, order.limit_price,
+                            order.filled_qty, order.filled_avg_price, "rejected", time.time_ns()), "rejected")
+                else:
+                    print(f"{bcolors.WARNING}Could not reconcile order {order.client_order_id}: {e}{bcolors.ENDC}")
+                continue
+            self.apply_order(payload)
+            refreshed += 1
+        return refreshed
+
+    def close(self) -> None:
+        if self.journal is not None:
+            self.journal.close()
+
+
+def open_order_book(path: Optional[str] = DEFAULT_JOURNAL_PATH) -> OrderBook:
+    # Journal-backed unless path is None
+    return OrderBook(OrderJournal(path) if path is not None else None)
+
+
+class TradeUpdateListener:
+    """
+    Feeds a trade-updates stream into an OrderBook. The stream (alpaca's
+    TradingStream in raw mode, or replay.FakeTradeStream) runs its own event
+    loop in a background thread.
+    """
+
+    def __init__(self, stream, book: OrderBook) -> None:
+        self.stream = stream
+        self.book = book
+        self.thread: Optional[threading.Thread] = None
+        stream.subscribe_trade_updates(self.handle_update)
+
+    async def handle_update(self, msg) -> None:
+        self.book.apply(msg)
+
+    def start(self) -> "TradeUpdateListener":
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.stream.run, name="trade-updates", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.stream.stop()
+            self.thread.join(timeout=5)
+            self.thread = None
+
+
+def trading_stream(api_key: str, secret_key: str, paper: bool = True, url_override: Optional[str] = None):
+    from alpaca.trading.stream import TradingStream
+
+    # Raw mode: the JSON message as is, no TradeUpdate model per event
+    return TradingStream(api_key, secret_key, paper=paper, raw_data=True, url_override=url_override)
@@ -1,117 +1,230 @@
-import json
 from math import floor
 import os
 import shutil
-from datetime import datetime, timedelta
-from typing import List, Optional
-from alpaca.data.historical.stock import StockHistoricalDataClient
-from alpaca.trading.client import TradingClient
-from alpaca.trading.enums import OrderSide, TimeInForce
-from alpaca.trading.requests import MarketOrderRequest, LimitOrderRequest
+import sys
+from datetime import date, datetime, timedelta, timezone
+from typing import TYPE_CHECKING, List, Optional
 from dotenv import load_dotenv
 
 import api_utils
+import bar_store
+import metrics
+import portfolio
+from bcolors import bcolors
+from lite_client import OrderSpec
+from orders import new_client_order_id
+
+if TYPE_CHECKING:
+    # The SDK (and pandas with it) is only imported by main(); see lite_client.py
+    from alpaca.data.historical.stock import StockHistoricalDataClient
+    from alpaca.trading.client import TradingClient
+
+    from orders import OrderBook
 
 # Load the .env file
 load_dotenv()
+metrics.enable_from_env()
 
 # Define global variables for the API keys and secrets
 ALPACA_PAPER_TOKEN = os.getenv("ALPACA_PAPER_TOKEN")
 ALPACA_PAPER_SECRET = os.getenv("ALPACA_PAPER_SECRET")
+# Points both Alpaca clients somewhere else, e.g. fake_server.py
+ALPACA_URL_OVERRIDE = os.getenv("ALPACA_URL_OVERRIDE")
 ALPACA_LIVE_TOKEN = os.getenv("ALPACA_LIVE_TOKEN")
 ALPACA_LIVE_SECRET = os.getenv("ALPACA_LIVE_SECRET")
 
 
-def place_market_orders(client: TradingClient, tickers: List[str]) -> None:
-    market_reqs = [
-        MarketOrderRequest(
-            symbol=ticker, qty=1, side=OrderSide.BUY, time_in_force=TimeInForce.GTC
-        )
-        for ticker in tickers
+def skip_open_buys(tickers: List[str], book: Optional["OrderBook"]):
+    # Tickers with a buy still open at the broker aren't bought again
+    if book is None:
+        return tickers, []
+    skipped = [
+        api_utils.OrderResult(symbol=ticker, qty=0, limit_price=None, status="skipped", error="buy order already open")
+        for ticker in tickers if book.has_open(ticker, "buy")
     ]
-    for req in market_reqs:
-        client.submit_order(req)
-        print("Order placed")
+    return [ticker for ticker in tickers if not book.has_open(ticker, "buy")], skipped
+
+
+def trading_day(now: Optional[datetime] = None) -> date:
+    # The session an order placed now trades in: today's while the market is
+    # open, else the next one
+    from market_calendar import get_session_index
 
+    now = now or datetime.now(timezone.utc)
+    index = get_session_index()
+    if index.is_open(now):
+        return index.session_on_or_before(now)
+    next_open = index.next_open(now)
+    return next_open.date() if next_open is not None else now.date()
 
-def place_dollar_share_orders(client: TradingClient, shdc_client: StockHistoricalDataClient, tickers: List[str], dollars_per_ticker: float) -> None:
+
+def buy_order_id(ticker: str, day: date) -> str:
+    # One buy per ticker per session: a rerun resends the same id, and the
+    # broker (or the book) refuses it as a duplicate
+    return new_client_order_id(f"{ticker}:buy:{day.isoformat()}")
+
+
+def place_market_orders(client: "TradingClient", tickers: List[str], book: Optional["OrderBook"] = None, day: Optional[date] = None) -> List[api_utils.OrderResult]:
+    tickers, skipped = skip_open_buys(tickers, book)
+    day = day or trading_day()
+    market_reqs = []
+    for ticker in tickers:
+        request = OrderSpec.market(ticker, 1, "buy", time_in_force="gtc")
+        request.client_order_id = buy_order_id(ticker, day)
+        market_reqs.append(request)
+    results = api_utils.submit_orders(client, market_reqs, book=book) + skipped
+    print_order_results(results)
+    return results
+
+
+@metrics.timed("paper_bot.place_dollar_share_orders")
+def place_dollar_share_orders(client: "TradingClient", shdc_client: "StockHistoricalDataClient", tickers: List[str], dollars_per_ticker: float, store: Optional[bar_store.BarStore] = None, max_workers: int = 8, book: Optional["OrderBook"] = None, day: Optional[date] = None) -> List[api_utils.OrderResult]:
+    tickers, skipped = skip_open_buys(tickers, book)
+    day = day or trading_day()
+    # Get the current price of every stock in one request (or from the store)
+    prices = api_utils.get_latest_prices(shdc_client, tickers, store)
+    order_reqs = []
     for ticker in tickers:
-        # Get the current price of the stock
-        price = api_utils.get_current_price(shdc_client, ticker)
         # convert price to 2 decimal places
-        price = round(price, 2)
+        price = round(prices.get(ticker, 0.0), 2)
         # Calculate the number of shares to buy
-        shares = dollars_per_ticker // price
-        # Place the order
-        client.submit_order(
-            LimitOrderRequest(
-                symbol=ticker, qty=floor(shares), side=OrderSide.BUY, time_in_force=TimeInForce.DAY, limit_price=price, extended_hours=True
-            )
-        )
-        print(f"Order placed for {shares} shares of {ticker} at {price}")
-
-
-def print_account_summary(client: TradingClient, pause: Optional[bool] = True) -> None:
-    # Let's GET our account summary
-    account = client.get_account()
+        shares = floor(dollars_per_ticker // price) if price > 0 else 0
+        if shares < 1:
+            skipped.append(api_utils.OrderResult(
+                symbol=ticker, qty=shares, limit_price=price, status="skipped",
+                error="no price" if price <= 0 else "price above dollars_per_ticker"))
+            continue
+        request = OrderSpec.limit(ticker, shares, "buy", price)
+        request.client_order_id = buy_order_id(ticker, day)
+        order_reqs.append(request)
+    # Place the orders concurrently
+    results = api_utils.submit_orders(client, order_reqs, max_workers, book) + skipped
+    print_order_results(results)
+    return results
+
+
+def print_order_results(results: List[api_utils.OrderResult]) -> None:
+    for result in results:
+        if result.error is None:
+            print(f"Order placed for {result.qty} shares of {result.symbol} at {result.limit_price} ({result.status})")
+        else:
+            print(f"{bcolors.FAIL}Order for {result.symbol} {result.status}: {result.error}{bcolors.ENDC}")
+
+
+def print_account_summary(client: "TradingClient", pause: Optional[bool] = True) -> None:
+    # One account + positions fetch, parsed once (see portfolio.py)
+    snapshot = portfolio.PortfolioSnapshot.fetch(client)
     # Account summary consists of:
     # Portfolio's Value
     # Buying Power
     # Cash
-    # List of Positions as JSON/dict
-
-    portfolio_value = account.portfolio_value
-    buying_power = account.buying_power
-    cash = account.cash
-    positions = client.get_all_positions()
-    print("\n\n\n\n\n\n")
-    for i in range(len(positions)):
-        print(f"Portfolio Value:\t{api_utils.format_money(portfolio_value)}")
-        print(f"Buying Power:\t\t{api_utils.format_money(buying_power)}")
-        print(f"Cash:\t\t\t{api_utils.format_money(cash)}")
-        print("\n\n")
-        api_utils.print_position(positions[i])
+    # List of Positions
+    sys.stdout.write("\n" * 6 + portfolio.format_account(snapshot.account) + "\n\n")
+    for position in snapshot.positions:
+        sys.stdout.write(portfolio.format_position(position) + "\n\n\n")
+        sys.stdout.flush()
         if pause:
             input("Press Enter to continue...")
-        print("\n\n\n")
 
 
-def main(place_orders: Optional[bool] = False, empty_output_dir: Optional[bool] = False, screen_stocks: Optional[bool] = False) -> None:
+def monitor_positions(client: "TradingClient", interval: float = 1.0) -> None:
+    # Live position board, redrawing only the rows that changed
+    portfolio.monitor(client, interval)
+
+
+@metrics.timed("paper_bot.main")
+def main(place_orders: Optional[bool] = False, empty_output_dir: Optional[bool] = False, screen_stocks: Optional[bool] = False, bar_store_kind: Optional[str] = "columnar", incremental: Optional[bool] = True, rollups: Optional[bool] = False, shards: Optional[int] = None) -> None:
+    if shards and bar_store_kind != "columnar":
+        # The shard workers write to and read from the columnar store only
+        raise ValueError(f"shards={shards} needs bar_store_kind=\"columnar\", got {bar_store_kind!r}")
+
     if empty_output_dir:
         # rm -rf output
         shutil.rmtree("output", ignore_errors=True)
 
-    trading_client = TradingClient(
-        ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, paper=True)
-    shdc_client = StockHistoricalDataClient(
-        ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET)
+    import http_pool
+
+    # Both clients (and the screener) on one pooled keep-alive session;
+    # the data client in raw mode, decoded straight into columns (records.py)
+    clients = http_pool.ClientFactory(
+        ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, paper=True, url_override=ALPACA_URL_OVERRIDE)
+    trading_client = clients.trading_client()
+    shdc_client = clients.data_client()
 
+    sharded = False
     # Get the stock tickers
     if screen_stocks:
-        tickers_response = api_utils.get_stock_tickers()
-        tickers = api_utils.parse_response_into_tickers(
-            tickers_response, "volume")
-        tickers = api_utils.filter_tickers(tickers)
+        with metrics.span("paper_bot.screen"):
+            from universe import UniverseSpec, select_universe
+
+            # One table over the payload: filtered and ranked in one pass
+            tickers = select_universe(
+                api_utils.get_stock_tickers(None), UniverseSpec(excluded_chars="-.", rank_by=("volume",)))
 
         end = datetime.now()
         start = end - timedelta(minutes=100)
         start, end = api_utils.adjust_for_market_days(start, end)
 
-        stocks_bars = api_utils.get_stock_bars(
-            shdc_client, tickers, start, end)
-
-        tickers = api_utils.save_stock_bars_to_json(stocks_bars, tickers)
+        if shards:
+            # Fetch, store and signals per shard in worker processes; the
+            # buy orders come from the coordinator, within one budget
+            import orders
+            import sharding
+
+            book = orders.open_order_book() if place_orders else None
+            if book is not None:
+                book.reconcile(trading_client)
+            sharding.run_sharded(
+                tickers, start, end, sharding.ShardConfig(shards=shards),
+                ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, ALPACA_URL_OVERRIDE,
+                trading_client=trading_client if place_orders else None, book=book)
+            if book is not None:
+                book.close()
+            sharded = True
+            if rollups:
+                import resample
+
+                resample.update_rollups(bar_store.open_bar_store(), tickers)
+        elif incremental:
+            # Only fetch the bars missing since the last run
+            store = bar_store.open_bar_store(bar_store_kind)
+            tickers = api_utils.sync_stock_bars(shdc_client, store, tickers, start, end)
+            if rollups:
+                # 5Min/15Min/1Hour/1Day from the new minutes, no extra API calls
+                import resample
+
+                resample.update_rollups(store, tickers)
+        else:
+            stocks_bars = api_utils.get_stock_bars(
+                shdc_client, tickers, start, end)
+
+            if bar_store_kind == "json":
+                tickers = api_utils.save_stock_bars_to_json(stocks_bars, tickers)
+            else:
+                tickers = api_utils.save_stock_bars(
+                    stocks_bars, tickers, bar_store.open_bar_store(bar_store_kind))
         # print("Valid tickers after filtering and checking:", tickers)
     else:
         if not os.path.exists("output/tickers.json"):
             print("No output/tickers.json file found. Exiting.")
-            with open("output/tickers.json", "r") as f:
-                tickers = api_utils.parse_response_into_tickers(json.load(f))
+            from screener_cache import read_screener_file
+
+            tickers = api_utils.parse_response_into_tickers(read_screener_file()[0])
+
+    if sharded:
+        pass  # placed by the coordinator
+    elif place_orders:
+        import orders
 
-    if place_orders:
-        place_market_orders(trading_client, tickers)
+        # Open orders from earlier runs, brought up to date, so they aren't placed twice
+        book = orders.open_order_book()
+        book.reconcile(trading_client)
+        place_market_orders(trading_client, tickers, book)
+        book.close()
     else:
         print("Order placement skipped.")
+    http_pool.print_stats()
+    metrics.end_cycle()
 
     # print_account_summary(trading_client, pause=False)
 
@@ -119,8 +232,12 @@ def main(place_orders: Optional[bool] = False, empty_output_dir: Optional[bool]
 if __name__ == "__main__":
     place_orders = False  # Set this to True if you want to place orders
     empty_output_dir = (
-        True  # Set this to True if you want to clear the output directory
+        False  # Set this to True if you want to clear the output directory
     )
     screen_stocks = True  # Set this to True if you want to screen stocks
+    bar_store_kind = "columnar"  # "columnar" (output/bars) or "json" (legacy output/tickers)
+    incremental = True  # Set this to False to re-fetch the whole window every run
+    rollups = True  # Set this to False to skip updating output/bars/rollups (needs incremental)
+    shards = None  # Worker processes for fetch/signals/orders (see sharding.py, columnar store only); None runs in this process
 
-    main(place_orders, empty_output_dir, screen_stocks)
+    main(place_orders, empty_output_dir, screen_stocks, bar_store_kind, incremental, rollups, shards)
@@ -0,0 +1,256 @@
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, TextIO
+
+from bcolors import bcolors
+
+"""
+Typed snapshots of the account and its positions, and a live position board.
+
+Alpaca returns every number as a string; a snapshot parses one
+get_account() + get_all_positions() fetch into floats once, and
+SnapshotCache hands the same snapshot to every caller until it is older than
+its TTL. PositionBoard renders one row per position and, on each refresh,
+rewrites only the rows whose text changed, in one write to the terminal.
+"""
+
+
+def format_money(amount: float) -> str:
+    # -5 prints as "-$5.00" (the api_utils original printed "-$-5.00"), and
+    # format_percent likewise as "-5.00%" rather than "--5.00%"
+    amount = float(amount)
+    return "-${0:,.2f}".format(-amount) if amount < 0 else "${0:,.2f}".format(amount)
+
+
+def format_percent(decimal: float) -> str:
+    decimal = float(decimal) * 100
+    return "-{0:.2f}%".format(-decimal) if decimal < 0 else "{0:.2f}%".format(decimal)
+
+
+def _float(value) -> float:
+    return float(value) if value is not None else 0.0
+
+
+def _text(value) -> str:
+    # Enums (exchange, side, asset class) as their plain value
+    return str(getattr(value, "value", value) or "")
+
+
+class PositionSnapshot:
+    __slots__ = (
+        "symbol", "exchange", "asset_class", "asset_marginable", "side",
+        "qty", "qty_available", "avg_entry_price", "market_value", "cost_basis",
+        "unrealized_pl", "unrealized_plpc", "unrealized_intraday_pl", "unrealized_intraday_plpc",
+        "current_price", "lastday_price", "change_today",
+    )
+
+    def __init__(self, **values) -> None:
+        for name in self.__slots__:
+            setattr(self, name, values[name])
+
+    @classmethod
+    def from_position(cls, position) -> "PositionSnapshot":
+        get = position.get if isinstance(position, dict) else lambda name: getattr(position, name, None)
+        return cls(
+            symbol=_text(get("symbol")),
+            exchange=_text(get("exchange")),
+            asset_class=_text(get("asset_class")),
+            asset_marginable=bool(get("asset_marginable")),
+            side=_text(get("side")) or "long",
+            qty=_float(get("qty")),
+            qty_available=_float(get("qty_available")),
+            avg_entry_price=_float(get("avg_entry_price")),
+            market_value=_float(get("market_value")),
+            cost_basis=_float(get("cost_basis")),
+            unrealized_pl=_float(get("unrealized_pl")),
+            unrealized_plpc=_float(get("unrealized_plpc")),
+            unrealized_intraday_pl=_float(get("unrealized_intraday_pl")),
+            unrealized_intraday_plpc=_float(get("unrealized_intraday_plpc")),
+            current_price=_float(get("current_price")),
+            lastday_price=_float(get("lastday_price")),
+            change_today=_float(get("change_today")),
+        )
+
+
+class AccountSnapshot:
+    __slots__ = ("portfolio_value", "buying_power", "cash", "equity")
+
+    def __init__(self, portfolio_value: float, buying_power: float, cash: float, equity: float) -> None:
+        self.portfolio_value = portfolio_value
+        self.buying_power = buying_power
+        self.cash = cash
+        self.equity = equity
+
+    @classmethod
+    def from_account(cls, account) -> "AccountSnapshot":
+        portfolio_value = _float(getattr(account, "portfolio_value", None))
+        return cls(
+            portfolio_value=portfolio_value,
+            buying_power=_float(getattr(account, "buying_power", None)),
+            cash=_float(getattr(account, "cash", None)),
+            equity=_float(getattr(account, "equity", None) or portfolio_value),
+        )
+
+
+class PortfolioSnapshot:
+    def __init__(self, account: AccountSnapshot, positions: List[PositionSnapshot], fetched_at: float) -> None:
+        self.account = account
+        self.positions = positions
+        self.by_symbol: Dict[str, PositionSnapshot] = {position.symbol: position for position in positions}
+        self.fetched_at = fetched_at
+
+    @classmethod
+    def fetch(cls, client) -> "PortfolioSnapshot":
+        account = AccountSnapshot.from_account(client.get_account())
+        positions = [PositionSnapshot.from_position(position) for position in client.get_all_positions()]
+        return cls(account, positions, time.monotonic())
+
+
+class SnapshotCache:
+    """One account + positions fetch shared by every caller within `ttl` seconds."""
+
+    def __init__(self, client, ttl: float = 1.0) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.snapshot: Optional[PortfolioSnapshot] = None
+        self.lock = threading.Lock()
+        self.fetches = 0
+
+    def get(self) -> PortfolioSnapshot:
+        with self.lock:
+            if self.snapshot is None or time.monotonic() - self.snapshot.fetched_at >= self.ttl:
+                self.snapshot = PortfolioSnapshot.fetch(self.client)
+                self.fetches += 1
+            return self.snapshot
+
+    def invalidate(self) -> None:
+        # After placing orders, so the next get() sees the new positions
+        with self.lock:
+            self.snapshot = None
+
+
+# -- full position block (print_position) -----------------------------------
+
+EXCHANGE_COLORS = {
+    "NYSE": bcolors.BRIGHT_YELLOW_FG,
+    "NASDAQ": bcolors.BRIGHT_CYAN_FG,
+    "AMEX": bcolors.BRIGHT_BLUE_FG,
+}
+
+
+def _signed(value: float, formatter) -> str:
+    if value >= 0:
+        return bcolors.GREEN_FG + "+" + formatter(abs(value))
+    return bcolors.RED_FG + "-" + formatter(abs(value))
+
+
+def format_position(position: PositionSnapshot) -> str:
+    label = bcolors.BRIGHT_WHITE_FG
+    end = bcolors.ENDC
+    side_color = bcolors.BRIGHT_GREEN_FG if position.side == "long" else bcolors.BRIGHT_RED_FG
+    lines = [
+        f"{bcolors.BOLD}{label}Position{end}",
+        f"{label}Symbol: {bcolors.MAGENTA_FG}{position.symbol}{end}",
+        f"{label}Exchange: {EXCHANGE_COLORS.get(position.exchange, bcolors.BRIGHT_RED_FG)}{position.exchange}{end}",
+        f"{label}Asset Class: {bcolors.WHITE_FG}{position.asset_class}{end}",
+        f"{label}Asset Marginable: {bcolors.WHITE_FG}{position.asset_marginable}{end}",
+        f"{label}Average Entry Price: {bcolors.WHITE_FG}{format_money(position.avg_entry_price)}{end}",
+        f"{label}Quantity: {bcolors.WHITE_FG}{position.qty:g}{end}",
+        f"{label}Side: {side_color}{position.side}{end}",
+        f"{label}Market Value: {bcolors.WHITE_FG}{format_money(position.market_value)}{end}",
+        f"{label}Cost Basis: {bcolors.WHITE_FG}{format_money(position.cost_basis)}{end}",
+        f"{label}Unrealized P/L: {_signed(position.unrealized_pl, format_money)}{end}",
+        f"{label}Unrealized P/L Percentage: {_signed(position.unrealized_plpc, format_percent)}{end}",
+        f"{label}Unrealized Intraday P/L: {_signed(position.unrealized_intraday_pl, format_money)}{end}",
+        f"{label}Unrealized Intraday P/L Percentage: {_signed(position.unrealized_intraday_plpc, format_percent)}{end}",
+        f"{label}Current Price: {bcolors.WHITE_FG}{format_money(position.current_price)}{end}",
+        f"{label}Last Day Price: {bcolors.WHITE_FG}{format_money(position.lastday_price)}{end}",
+        f"{label}Change Today: {bcolors.GREEN_FG if position.change_today >= 0 else bcolors.RED_FG}{format_money(position.change_today)}{end}",
+        f"{label}Quantity Available: {bcolors.WHITE_FG}{position.qty_available:g}{end}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def format_account(account: AccountSnapshot) -> str:
+    return (
+        f"Portfolio Value:\t{format_money(account.portfolio_value)}\n"
+        f"Buying Power:\t\t{format_money(account.buying_power)}\n"
+        f"Cash:\t\t\t{format_money(account.cash)}\n"
+    )
+
+
+# -- live board -------------------------------------------------------------
+
+BOARD_HEADER = f"{'Symbol':<8}{'Qty':>10}{'Avg Entry':>14}{'Price':>12}{'Market Value':>16}{'P/L':>14}{'P/L %':>10}{'Today':>10}"
+
+
+def format_row(position: PositionSnapshot) -> str:
+    pl_color = bcolors.GREEN_FG if position.unrealized_pl >= 0 else bcolors.RED_FG
+    today_color = bcolors.GREEN_FG if position.change_today >= 0 else bcolors.RED_FG
+    return (
+        f"{position.symbol:<8}{position.qty:>10g}{format_money(position.avg_entry_price):>14}"
+        f"{format_money(position.current_price):>12}{format_money(position.market_value):>16}"
+        f"{pl_color}{format_money(position.unrealized_pl):>14}{format_percent(position.unrealized_plpc):>10}{bcolors.ENDC}"
+        f"{today_color}{format_percent(position.change_today):>10}{bcolors.ENDC}"
+    )
+
+
+class PositionBoard:
+    """
+    Terminal table of positions. Each refresh diffs the new row texts against
+    what is on screen and repositions the cursor to rewrite only the changed
+    lines, all collected into one buffered write.
+    """
+
+    def __init__(self, stream: TextIO = sys.stdout) -> None:
+        self.stream = stream
+        self.lines: List[str] = []
+        self.refreshes = 0
+        self.lines_written = 0
+
+    def render(self, snapshot: PortfolioSnapshot) -> List[str]:
+        account = snapshot.account
+        lines = [
+            f"{bcolors.BOLD}Portfolio {format_money(account.portfolio_value)}  Buying Power {format_money(account.buying_power)}  "
+            f"Cash {format_money(account.cash)}  Positions {len(snapshot.positions)}{bcolors.ENDC}",
+            f"{bcolors.BRIGHT_WHITE_FG}{BOARD_HEADER}{bcolors.ENDC}",
+        ]
+        lines.extend(format_row(position) for position in sorted(snapshot.positions, key=lambda p: p.symbol))
+        return lines
+
+    def refresh(self, snapshot: PortfolioSnapshot) -> int:
+        lines = self.render(snapshot)
+        parts = []
+        if not self.lines:
+            parts.append("\033[2J")  # first frame: clear the screen
+        changed = 0
+        for i, line in enumerate(lines):
+            if i >= len(self.lines) or self.lines[i] != line:
+                # Rows are 1-based; \033[K clears what was left of a longer line
+                parts.append(f"\033[{i + 1};1H{line}\033[K")
+                changed += 1
+        for i in range(len(lines), len(self.lines)):
+            parts.append(f"\033[{i + 1};1H\033[K")
+        parts.append(f"\033[{len(lines) + 1};1H{datetime.now():%H:%M:%S}\033[K")
+        self.stream.write("".join(parts))
+        self.stream.flush()
+        self.lines = lines
+        self.refreshes += 1
+        self.lines_written += changed
+        return changed
+
+
+def monitor(client, interval: float = 1.0, refreshes: Optional[int] = None, stream: TextIO = sys.stdout) -> PositionBoard:
+    # Live view: one account + positions fetch per interval, only changed rows redrawn
+    cache = SnapshotCache(client, ttl=interval)
+    board = PositionBoard(stream)
+    try:
+        while refreshes is None or board.refreshes < refreshes:
+            started = time.monotonic()
+            board.refresh(cache.get())
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
+    except KeyboardInterrupt:
+        pass
+    return board
@@ -0,0 +1,200 @@
+import json
+from datetime import datetime, timedelta, timezone
+from operator import itemgetter
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+import numpy as np
+
+from bar_store import PRICE_FIELDS, RAW_BAR_KEYS, Columns, empty_columns
+
+"""
+Lightweight in-memory records for bars and screener rows.
+
+BarColumns holds one symbol's bars as numpy columns (the bar store layout),
+decoded straight from the raw API dicts ({"t", "o", "h", ...}) without
+building an alpaca Bar model per bar; indexing or iterating it hands out
+slotted BarRecords, so code written against Bar (bar.close, bar.timestamp)
+keeps working.
+
+TickerRecord keeps the screener fields the bot filters and ranks on in
+slots and the rest (companyName, industry, ...) as one compact JSON string,
+decoded only when one of them is asked for. It answers row["symbol"] and
+row.get("price") like the payload dicts it replaces.
+"""
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class BarRecord:
+    __slots__ = ("symbol", "timestamp_ns") + PRICE_FIELDS
+
+    def __init__(self, symbol: str, timestamp_ns: int, open: float, high: float, low: float, close: float, volume: float, trade_count: float, vwap: float) -> None:
+        self.symbol = symbol
+        self.timestamp_ns = timestamp_ns
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.trade_count = trade_count
+        self.vwap = vwap
+
+    @property
+    def timestamp(self) -> datetime:
+        return EPOCH + timedelta(microseconds=self.timestamp_ns // 1000)
+
+
+class BarColumns:
+    """Struct of arrays for one symbol's bars, oldest first."""
+
+    __slots__ = ("symbol", "columns")
+
+    def __init__(self, symbol: str, columns: Optional[Columns] = None) -> None:
+        self.symbol = symbol
+        self.columns = columns if columns is not None else empty_columns()
+
+    @classmethod
+    def from_raw(cls, symbol: str, bars: List[dict]) -> "BarColumns":
+        import pandas as pd
+
+        columns = empty_columns(len(bars))
+        if bars:
+            # The same few hundred minutes repeat across symbols: parse each once
+            stamps: Dict[str, int] = {}
+            codes = np.fromiter((stamps.setdefault(bar["t"], len(stamps)) for bar in bars), dtype=np.int64, count=len(bars))
+            parsed = pd.to_datetime(list(stamps), utc=True, format="ISO8601").as_unit("ns").asi8
+            columns["timestamp"][:] = parsed[codes]
+            for field, key in RAW_BAR_KEYS.items():
+                try:
+                    columns[field][:] = np.fromiter(map(itemgetter(key), bars), dtype=np.float64, count=len(bars))
+                except (KeyError, TypeError):
+                    # Missing values (absent or None) become NaN
+                    columns[field][:] = np.array([bar.get(key) for bar in bars], dtype=np.float64)
+        return cls(symbol, columns)
+
+    @classmethod
+    def from_models(cls, symbol: str, bars: list) -> "BarColumns":
+        import pandas as pd
+
+        columns = empty_columns(len(bars))
+        if bars:
+            columns["timestamp"][:] = pd.to_datetime([bar.timestamp for bar in bars], utc=True).as_unit("ns").asi8
+            for field in PRICE_FIELDS:
+                columns[field][:] = [getattr(bar, field) for bar in bars]
+        return cls(symbol, columns)
+
+    @classmethod
+    def concat(cls, symbol: str, parts: List["BarColumns"]) -> "BarColumns":
+        if len(parts) == 1:
+            return parts[0]
+        return cls(symbol, {name: np.concatenate([part.columns[name] for part in parts]) for name in parts[0].columns})
+
+    def __len__(self) -> int:
+        return len(self.columns["timestamp"])
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[BarRecord, "BarColumns"]:
+        if isinstance(index, slice):
+            return BarColumns(self.symbol, {name: values[index] for name, values in self.columns.items()})
+        columns = self.columns
+        return BarRecord(
+            self.symbol, int(columns["timestamp"][index]),
+            *(float(columns[field][index]) for field in PRICE_FIELDS),
+        )
+
+    def __iter__(self) -> Iterator[BarRecord]:
+        columns = self.columns
+        timestamps = columns["timestamp"].tolist()
+        values = [columns[field].tolist() for field in PRICE_FIELDS]
+        for i, timestamp in enumerate(timestamps):
+            yield BarRecord(self.symbol, timestamp, *(column[i] for column in values))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(values.nbytes for values in self.columns.values())
+
+
+def decode_bars(data: Dict[str, list]) -> Dict[str, BarColumns]:
+    # A raw ({symbol: [dict]}) or BarSet.data ({symbol: [Bar]}) response.
+    # Raw bars of all symbols are decoded together, one pass per field, then
+    # split into per-symbol views of the same arrays
+    raw = {symbol: bars for symbol, bars in data.items() if bars and isinstance(bars[0], dict)}
+    decoded = {
+        symbol: BarColumns.from_models(symbol, bars)
+        for symbol, bars in data.items() if symbol not in raw
+    }
+    if raw:
+        merged = BarColumns.from_raw("", [bar for bars in raw.values() for bar in bars])
+        offset = 0
+        for symbol, bars in raw.items():
+            decoded[symbol] = BarColumns(symbol, {name: values[offset: offset + len(bars)] for name, values in merged.columns.items()})
+            offset += len(bars)
+    return decoded
+
+
+# -- screener rows ----------------------------------------------------------
+
+TICKER_FIELDS = (
+    "symbol", "price", "volume", "marketCap", "beta", "lastAnnualDividend",
+    "exchangeShortName", "sector", "country", "isEtf", "isFund", "isActivelyTrading",
+)
+TICKER_FIELD_BITS = {field: 1 << i for i, field in enumerate(TICKER_FIELDS)}
+
+
+class TickerRecord:
+    # present: bit i is set when the row had TICKER_FIELDS[i] (even as null)
+    __slots__ = TICKER_FIELDS + ("extra", "present")
+
+    def __init__(self, row: dict) -> None:
+        present = 0
+        for i, field in enumerate(TICKER_FIELDS):
+            if field in row:
+                present |= 1 << i
+            setattr(self, field, row.get(field))
+        self.present = present
+        rest = {key: value for key, value in row.items() if key not in TICKER_FIELDS}
+        self.extra = json.dumps(rest, separators=(",", ":")) if rest else None
+
+    def __getattr__(self, name: str):
+        # Only reached for fields that are not slots
+        extra = object.__getattribute__(self, "extra")
+        if extra is not None:
+            rest = json.loads(extra)
+            if name in rest:
+                return rest[name]
+        raise AttributeError(name)
+
+    def get(self, key: str, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __getitem__(self, key: str):
+        if key in TICKER_FIELD_BITS and not self.present & TICKER_FIELD_BITS[key]:
+            raise KeyError(key)
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __contains__(self, key: str) -> bool:
+        if key in TICKER_FIELD_BITS:
+            return bool(self.present & TICKER_FIELD_BITS[key])
+        return self.extra is not None and key in json.loads(self.extra)
+
+    def to_dict(self) -> dict:
+        row = {field: getattr(self, field) for field in TICKER_FIELDS if self.present & TICKER_FIELD_BITS[field]}
+        if self.extra is not None:
+            row.update(json.loads(self.extra))
+        return row
+
+
+def decode_tickers(payload: Iterable[Union[dict, TickerRecord]]) -> List[TickerRecord]:
+    return [row if isinstance(row, TickerRecord) else TickerRecord(row) for row in payload]
+
+
+def record_to_json(value):
+    # json.dump(..., default=record_to_json) for payloads holding TickerRecords
+    if isinstance(value, TickerRecord):
+        return value.to_dict()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
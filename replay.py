@@ -0,0 +1,324 @@
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from bar_store import BarStore, to_epoch_ns
+
+"""
+Offline stand-ins for the Alpaca clients, replaying bars from a bar store.
+
+ReplayDataClient answers get_stock_bars like StockHistoricalDataClient (raw
+mode), FakeTradingClient keeps positions/cash in memory and fills orders at
+their limit price, and ReplayClock lets the bot's minute loop run against
+recorded data without waiting on the wall clock. FakeTradeStream plays the
+part of TradingStream, delivering the fake account's trade updates.
+"""
+
+
+class WallClock:
+    def now(self) -> datetime:
+        return datetime.now(timezone.utc)
+
+    async def sleep_until(self, when: datetime) -> None:
+        delay = (when - self.now()).total_seconds()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def running(self) -> bool:
+        return True
+
+
+class ReplayClock:
+    """
+    Simulated time between start and end. Sleeping jumps straight to the
+    target; time spent working in between still counts (scaled by speed), so
+    a slow cycle can overrun its minute just like it would live.
+    """
+
+    def __init__(self, start: datetime, end: datetime, speed: float = 1.0) -> None:
+        self.sim_time = start
+        self.end = end
+        self.speed = speed
+        self.wall_mark = time.perf_counter()
+
+    def now(self) -> datetime:
+        return self.sim_time + timedelta(seconds=(time.perf_counter() - self.wall_mark) * self.speed)
+
+    async def sleep_until(self, when: datetime) -> None:
+        self.sim_time = max(self.now(), when)
+        self.wall_mark = time.perf_counter()
+        await asyncio.sleep(0)
+
+    def running(self) -> bool:
+        return self.now() <= self.end
+
+
+class ReplayDataClient:
+    """Serves get_stock_bars from a bar store, never past the clock's current time."""
+
+    def __init__(self, store: BarStore, clock: Optional[ReplayClock] = None) -> None:
+        self.store = store
+        self.clock = clock
+        self.requests = 0
+
+    def get_stock_bars(self, request) -> Dict[str, List[dict]]:
+        self.requests += 1
+        symbols = request.symbol_or_symbols
+        symbols = [symbols] if isinstance(symbols, str) else symbols
+        end = request.end
+        if self.clock is not None:
+            end = min(pd.Timestamp(end, tz="UTC") if end.tzinfo is None else pd.Timestamp(end), pd.Timestamp(self.clock.now()))
+        start_ns, end_ns = to_epoch_ns(request.start), to_epoch_ns(end)
+        data = {}
+        for symbol in symbols:
+            columns = self.store.read(symbol, start_ns, end_ns)
+            if len(columns["timestamp"]) == 0:
+                continue
+            timestamps = pd.to_datetime(columns["timestamp"], unit="ns", utc=True)
+            data[symbol] = [
+                {
+                    "t": timestamp.isoformat(),
+                    "o": float(columns["open"][i]),
+                    "h": float(columns["high"][i]),
+                    "l": float(columns["low"][i]),
+                    "c": float(columns["close"][i]),
+                    "v": float(columns["volume"][i]),
+                    "n": float(columns["trade_count"][i]),
+                    "vw": float(columns["vwap"][i]),
+                }
+                for i, timestamp in enumerate(timestamps)
+            ]
+        return data
+
+
+class FakePosition:
+    # Mirrors the alpaca Position fields the bot reads (string-typed like the API)
+    def __init__(self, symbol: str, qty: float, avg_entry_price: float) -> None:
+        self.symbol = symbol
+        self.qty = qty
+        self.avg_entry_price = avg_entry_price
+        self.current_price = avg_entry_price
+
+    @property
+    def qty_available(self) -> str:
+        return str(self.qty)
+
+    @property
+    def market_value(self) -> str:
+        return str(self.qty * self.current_price)
+
+    @property
+    def cost_basis(self) -> str:
+        return str(self.qty * self.avg_entry_price)
+
+    @property
+    def unrealized_pl(self) -> str:
+        return str(self.qty * (self.current_price - self.avg_entry_price))
+
+    @property
+    def unrealized_plpc(self) -> str:
+        return str(self.current_price / self.avg_entry_price - 1 if self.avg_entry_price else 0.0)
+
+
+class FakeAPIError(ValueError):
+    # Like alpaca's APIError: the HTTP status plus the API's message
+    def __init__(self, status_code: int, message: str) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class FakeOrder:
+    def __init__(self, request, status: str) -> None:
+        self.id = uuid.uuid4()
+        self.client_order_id = getattr(request, "client_order_id", None) or str(self.id)
+        self.symbol = request.symbol
+        self.qty = request.qty
+        self.side = request.side
+        self.limit_price = getattr(request, "limit_price", None)
+        self.status = status
+        self.filled_qty = 0.0
+        self.filled_avg_price: Optional[float] = None
+        self.updated_at = datetime.now(timezone.utc)
+
+    def to_dict(self) -> dict:
+        # The order as a trade update carries it (string-typed like the API)
+        return {
+            "id": str(self.id),
+            "client_order_id": self.client_order_id,
+            "symbol": self.symbol,
+            "side": getattr(self.side, "value", self.side),
+            "qty": str(self.qty),
+            "limit_price": None if self.limit_price is None else str(self.limit_price),
+            "filled_qty": str(self.filled_qty),
+            "filled_avg_price": None if self.filled_avg_price is None else str(self.filled_avg_price),
+            "status": self.status,
+            "updated_at": self.updated_at.isoformat(),
+        }
+
+
+class FakeTradeStream:
+    """
+    Stand-in for TradingStream in raw mode: publish() queues a trade update
+    and run() delivers the queue to the subscribed handler until stop(), so
+    updates arrive on the stream's thread after submit_order has returned,
+    as they would live.
+    """
+
+    def __init__(self) -> None:
+        self.handler: Optional[Callable] = None
+        self.queue: List[dict] = []
+        self.ready = threading.Condition()
+        self.stopped = False
+        self.delivered = 0
+
+    def subscribe_trade_updates(self, handler: Callable) -> None:
+        self.handler = handler
+
+    def publish(self, event: str, order: dict, **fields) -> None:
+        # order: FakeOrder.to_dict() as of the event
+        data = {"event": event, "execution_id": str(uuid.uuid4()), "order": order, "timestamp": order["updated_at"]}
+        data.update(fields)
+        with self.ready:
+            self.queue.append({"stream": "trade_updates", "data": data})
+            self.ready.notify()
+
+    def drain(self) -> int:
+        # Delivers whatever is queued, on the calling thread
+        from streaming import _run_handler
+
+        with self.ready:
+            messages, self.queue = self.queue, []
+        if self.handler is not None:
+            for msg in messages:
+                _run_handler(self.handler, msg)
+        self.delivered += len(messages)
+        return len(messages)
+
+    def run(self) -> None:
+        while True:
+            with self.ready:
+                while not self.queue and not self.stopped:
+                    self.ready.wait()
+                if self.stopped and not self.queue:
+                    return
+            self.drain()
+
+    def stop(self) -> None:
+        with self.ready:
+            self.stopped = True
+            self.ready.notify()
+
+
+class FakeAccount:
+    def __init__(self, cash: float, portfolio_value: float) -> None:
+        self.cash = str(cash)
+        self.buying_power = str(cash)
+        self.portfolio_value = str(portfolio_value)
+
+
+class FakeTradingClient:
+    """
+    In-memory account: orders fill immediately at their limit (or the latest)
+    price. With match_limits, a limit order the latest price doesn't reach
+    rests as "new" instead.
+    """
+
+    def __init__(self, cash: float = 100_000.0, price: Optional[Callable[[str], float]] = None, latency: float = 0.0, trade_stream: Optional[FakeTradeStream] = None, match_limits: bool = False) -> None:
+        self.cash = cash
+        self.price = price
+        self.match_limits = match_limits
+        self.latency = latency
+        self.trade_stream = trade_stream
+        self.positions: Dict[str, FakePosition] = {}
+        self.orders: List[FakeOrder] = []
+        self.client_orders: Dict[str, FakeOrder] = {}
+        self.lock = threading.Lock()
+
+    def _wait(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _mark(self) -> None:
+        if self.price is not None:
+            for position in self.positions.values():
+                position.current_price = self.price(position.symbol) or position.current_price
+
+    def get_all_positions(self) -> List[FakePosition]:
+        self._wait()
+        self._mark()
+        return list(self.positions.values())
+
+    def get_account(self) -> FakeAccount:
+        self._wait()
+        self._mark()
+        value = self.cash + sum(p.qty * p.current_price for p in self.positions.values())
+        return FakeAccount(self.cash, value)
+
+    def submit_order(self, request) -> FakeOrder:
+        self._wait()
+        with self.lock:
+            if getattr(request, "client_order_id", None) in self.client_orders:
+                raise FakeAPIError(422, "client_order_id must be unique")
+            return self._fill(request)
+
+    def get_order_by_client_id(self, client_id: str) -> FakeOrder:
+        self._wait()
+        with self.lock:
+            if client_id not in self.client_orders:
+                raise FakeAPIError(404, "order not found")
+            return self.client_orders[client_id]
+
+    def _fill(self, request) -> FakeOrder:
+        price = getattr(request, "limit_price", None)
+        side = getattr(request.side, "value", request.side)
+        latest = self.price(request.symbol) if self.price is not None else None
+        if price is None:
+            price = latest
+        elif self.match_limits and latest is not None and (latest > price if side == "buy" else latest < price):
+            order = self._record(FakeOrder(request, "new"))
+            if self.trade_stream is not None:
+                self.trade_stream.publish("new", order.to_dict())
+            return order
+        qty = float(request.qty)
+        position = self.positions.get(request.symbol)
+        if side == "buy":
+            if price is None or qty * price > self.cash:
+                return self._record(FakeOrder(request, "rejected"))
+            self.cash -= qty * price
+            if position is None:
+                self.positions[request.symbol] = FakePosition(request.symbol, qty, price)
+            else:
+                total = position.qty + qty
+                position.avg_entry_price = (position.avg_entry_price * position.qty + price * qty) / total
+                position.qty = total
+        else:
+            if position is None or position.qty < qty or price is None:
+                return self._record(FakeOrder(request, "rejected"))
+            self.cash += qty * price
+            position.qty -= qty
+            if position.qty == 0:
+                del self.positions[request.symbol]
+        order = FakeOrder(request, "new")
+        accepted_at = order.updated_at
+        order.status, order.filled_qty, order.filled_avg_price = "filled", qty, price
+        order.updated_at = datetime.now(timezone.utc)
+        self._record(order)
+        if self.trade_stream is not None:
+            # The "new" update carries the order as it was when accepted
+            accepted = order.to_dict()
+            accepted.update(status="new", filled_qty="0", filled_avg_price=None, updated_at=accepted_at.isoformat())
+            self.trade_stream.publish("new", accepted)
+            self.trade_stream.publish("fill", order.to_dict(), price=str(price), qty=str(qty), position_qty=str(self.positions[request.symbol].qty if request.symbol in self.positions else 0))
+        return order
+
+    def _record(self, order: FakeOrder) -> FakeOrder:
+        self.orders.append(order)
+        self.client_orders[order.client_order_id] = order
+        if order.status == "rejected" and self.trade_stream is not None:
+            self.trade_stream.publish("rejected", order.to_dict())
+        return order
@@ -0,0 +1,236 @@
+import os
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy as np
+
+import metrics
+from bar_store import PRICE_FIELDS, BarStore, ColumnarBarStore, Columns, TimeLike, empty_columns, to_epoch_ns
+from bcolors import bcolors
+from market_calendar import MINUTE_NS, SessionIndex, get_session_index
+
+"""
+Higher timeframes (5Min, 15Min, 1Hour, 1Day) built from the stored minute bars.
+
+resample() turns the minute rows of any number of symbols into one bar per
+(symbol, bucket) in a single vectorized pass: rows are bucketed, sorted by
+(symbol, bucket) and reduced with ufunc.reduceat -- first open, max high,
+min low, last close, summed volume and trade_count, volume-weighted vwap.
+
+Buckets follow the market calendar: they are anchored at each session's
+open (9:30, 9:35, ... or 9:30, 10:30, ...) and cut at its close, early closes
+included, so no bar spans two sessions; 1Day is one bar per regular session.
+Minutes outside the session are dropped unless the timeframe is `extended`,
+in which case they get buckets of their own on the clock grid.
+
+Resampler keeps each timeframe as a columnar store next to the raw bars
+(output/bars/rollups/<name>/), holding complete buckets only; its sync
+watermark per symbol is the end of the last stored bucket. update() reads
+just the minutes after that, and a bucket is stored once the raw store
+covers its end. read() adds the buckets still in progress on the fly.
+Rollup stores are ordinary BarStores, so indicators.load_panel() and the
+backtester work on them unchanged.
+"""
+
+ROLLUPS_DIR = "rollups"
+
+
+@dataclass(frozen=True)
+class Timeframe:
+    name: str
+    minutes: Optional[int]  # None: one bar per regular session
+    extended: bool = False  # also bucket pre-market and after-hours minutes
+
+    @property
+    def width_ns(self) -> Optional[int]:
+        return None if self.minutes is None else self.minutes * MINUTE_NS
+
+
+TIMEFRAMES: Dict[str, Timeframe] = {
+    timeframe.name: timeframe
+    for timeframe in (Timeframe("5Min", 5), Timeframe("15Min", 15), Timeframe("1Hour", 60), Timeframe("1Day", None))
+}
+
+TimeframeLike = Union[str, Timeframe]
+
+
+def get_timeframe(timeframe: TimeframeLike) -> Timeframe:
+    if isinstance(timeframe, Timeframe):
+        return timeframe
+    if timeframe not in TIMEFRAMES:
+        raise ValueError(f"Unknown timeframe {timeframe!r}, expected one of {list(TIMEFRAMES)}")
+    return TIMEFRAMES[timeframe]
+
+
+def bucket_bounds(timestamps: np.ndarray, timeframe: Timeframe, calendar: SessionIndex) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # (bucket start, bucket end, keep) per minute timestamp
+    opens, closes = calendar.opens_array, calendar.closes_array
+    i = np.searchsorted(opens, timestamps, side="right") - 1
+    known = i >= 0
+    session_open = opens[np.clip(i, 0, None)]
+    session_close = closes[np.clip(i, 0, None)]
+    regular = known & (timestamps < session_close)
+    width = timeframe.width_ns
+    if width is None:
+        return session_open, session_close, regular
+    start = session_open + (timestamps - session_open) // width * width
+    end = np.minimum(start + width, session_close)
+    if not timeframe.extended:
+        return start, end, regular
+    # Outside the session: clock-grid buckets, cut at the last close and the next open
+    grid = timestamps // width * width
+    next_open = np.append(opens, np.iinfo(np.int64).max)[i + 1]
+    outside_start = np.where(known, np.maximum(grid, session_close), grid)
+    outside_end = np.minimum(grid + width, next_open)
+    return np.where(regular, start, outside_start), np.where(regular, end, outside_end), np.ones(len(timestamps), dtype=bool)
+
+
+def resample(symbol_ids: np.ndarray, columns: Columns, timeframe: TimeframeLike, calendar: Optional[SessionIndex] = None) -> Tuple[np.ndarray, Columns, np.ndarray]:
+    # Minute rows of several symbols (each symbol's rows in time order) ->
+    # (symbol id per bar, bar columns timestamped at the bucket start, bucket
+    # end per bar), ordered by symbol then time
+    timeframe = get_timeframe(timeframe)
+    calendar = calendar or get_session_index()
+    start, end, keep = bucket_bounds(np.asarray(columns["timestamp"]), timeframe, calendar)
+    if not keep.all():
+        symbol_ids, start, end = symbol_ids[keep], start[keep], end[keep]
+        columns = {name: np.asarray(values)[keep] for name, values in columns.items()}
+    if len(start) == 0:
+        return np.empty(0, dtype=np.int64), empty_columns(), np.empty(0, dtype=np.int64)
+    # Stable, so rows of a bucket stay in time order
+    order = np.lexsort((start, symbol_ids))
+    symbol_ids, start, end = symbol_ids[order], start[order], end[order]
+    rows = {name: np.asarray(columns[name])[order] for name in PRICE_FIELDS}
+    new_bucket = (symbol_ids[1:] != symbol_ids[:-1]) | (start[1:] != start[:-1])
+    first = np.concatenate(([0], np.flatnonzero(new_bucket) + 1))
+    last = np.append(first[1:] - 1, len(start) - 1)
+    volume = np.nan_to_num(rows["volume"])
+    bars = {
+        "timestamp": start[first],
+        "open": rows["open"][first],
+        "high": np.fmax.reduceat(rows["high"], first),
+        "low": np.fmin.reduceat(rows["low"], first),
+        "close": rows["close"][last],
+        "volume": np.add.reduceat(volume, first),
+        "trade_count": np.add.reduceat(np.nan_to_num(rows["trade_count"]), first),
+    }
+    traded = np.add.reduceat(np.nan_to_num(rows["vwap"]) * volume, first)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        bars["vwap"] = np.where(bars["volume"] > 0, traded / bars["volume"], bars["close"])
+    return symbol_ids[first], bars, end[first]
+
+
+def resample_symbol(columns: Columns, timeframe: TimeframeLike, calendar: Optional[SessionIndex] = None) -> Columns:
+    # One symbol's minute bars (a store read, a ring buffer) -> its bars in `timeframe`
+    _, bars, _ = resample(np.zeros(len(columns["timestamp"]), dtype=np.int64), columns, timeframe, calendar)
+    return bars
+
+
+class Resampler:
+    """Rollups of a minute bar store, cached on disk and updated incrementally."""
+
+    def __init__(self, store: BarStore, timeframes: Iterable[TimeframeLike] = tuple(TIMEFRAMES), calendar: Optional[SessionIndex] = None, root: Optional[str] = None) -> None:
+        self.store = store
+        self.timeframes = {timeframe.name: timeframe for timeframe in map(get_timeframe, timeframes)}
+        self._calendar = calendar
+        self.root = root or os.path.join(store.root, ROLLUPS_DIR)
+        self.rollups: Dict[str, ColumnarBarStore] = {}
+
+    @property
+    def calendar(self) -> SessionIndex:
+        if self._calendar is None:
+            self._calendar = get_session_index()
+        return self._calendar
+
+    def rollup(self, timeframe: TimeframeLike) -> ColumnarBarStore:
+        name = get_timeframe(timeframe).name
+        if name not in self.rollups:
+            self.rollups[name] = ColumnarBarStore(os.path.join(self.root, name))
+        return self.rollups[name]
+
+    def covered(self, symbols: List[str]) -> np.ndarray:
+        # Per symbol, the end of the minutes the raw store has: past its last
+        # bar, or up to the last fetch's watermark if that is later
+        last = self.store.last_timestamps(symbols)
+        watermarks = self.store.watermarks()
+        covered = np.zeros(len(symbols), dtype=np.int64)
+        for k, symbol in enumerate(symbols):
+            candidates = [ns + MINUTE_NS for ns in (last[symbol],) if ns is not None]
+            if symbol.upper() in watermarks:
+                candidates.append(watermarks[symbol.upper()])
+            covered[k] = max(candidates) if candidates else 0
+        return covered
+
+    def gather(self, symbols: List[str], starts: List[Optional[int]]) -> Tuple[np.ndarray, Columns]:
+        # Minute rows of every symbol from its start on, as one set of columns
+        reads = [self.store.read(symbol, start) for symbol, start in zip(symbols, starts)]
+        lengths = [len(read["timestamp"]) for read in reads]
+        symbol_ids = np.repeat(np.arange(len(symbols)), lengths)
+        if not symbol_ids.size:
+            return symbol_ids, empty_columns()
+        return symbol_ids, {name: np.concatenate([read[name] for read in reads]) for name in reads[0]}
+
+    @metrics.timed("resample.update")
+    def update(self, symbols: Optional[Iterable[str]] = None, until: TimeLike = None) -> Dict[str, int]:
+        # Stores every bucket the raw store now covers; returns bars written per timeframe
+        symbols = [symbol.upper() for symbol in (self.store.symbols() if symbols is None else symbols)]
+        if not symbols:
+            return {name: 0 for name in self.timeframes}
+        covered = self.covered(symbols)
+        if until is not None:
+            covered = np.minimum(covered, to_epoch_ns(until))
+        resume = {}
+        for name in self.timeframes:
+            watermarks = self.rollup(name).watermarks()
+            resume[name] = np.array([watermarks.get(symbol, 0) for symbol in symbols], dtype=np.int64)
+        # One read of the raw minutes, from the earliest point any timeframe needs
+        earliest = np.min(list(resume.values()), axis=0)
+        symbol_ids, minutes = self.gather(symbols, [int(ns) or None for ns in earliest])
+        written = {}
+        for name, timeframe in self.timeframes.items():
+            rollup = self.rollup(name)
+            needed = minutes["timestamp"] >= resume[name][symbol_ids]
+            bar_ids, bars, ends = resample(symbol_ids[needed], {key: values[needed] for key, values in minutes.items()}, timeframe, self.calendar)
+            complete = ends <= covered[bar_ids]
+            bar_ids, ends = bar_ids[complete], ends[complete]
+            bars = {key: values[complete] for key, values in bars.items()}
+            # Bars come grouped by symbol: one segment per symbol
+            bounds = np.flatnonzero(np.diff(bar_ids)) + 1
+            firsts = np.concatenate(([0], bounds)).tolist() if len(bar_ids) else []
+            lasts = np.append(bounds, len(bar_ids)).tolist() if len(bar_ids) else []
+            segments = [(symbols[bar_ids[lo]], lo, hi) for lo, hi in zip(firsts, lasts)]
+            written[name] = rollup.append_many(segments, bars)
+            for symbol, _, hi in segments:
+                rollup.mark_synced([symbol], int(ends[hi - 1]))
+            rollup.flush()
+            metrics.count(f"resample.{name}.bars", written[name])
+        return written
+
+    def read(self, symbol: str, timeframe: TimeframeLike, start: TimeLike = None, end: TimeLike = None, partial: bool = True) -> Columns:
+        # Stored bars, plus (with partial) the buckets not complete yet, built from the raw minutes
+        timeframe = get_timeframe(timeframe)
+        rollup = self.rollup(timeframe)
+        stored = rollup.read(symbol, start, end)
+        if not partial:
+            return stored
+        live = resample_symbol(self.store.read(symbol, rollup.watermarks().get(symbol.upper())), timeframe, self.calendar)
+        start_ns, end_ns = to_epoch_ns(start), to_epoch_ns(end)
+        keep = np.ones(len(live["timestamp"]), dtype=bool)
+        if start_ns is not None:
+            keep &= live["timestamp"] >= start_ns
+        if end_ns is not None:
+            keep &= live["timestamp"] <= end_ns
+        if not keep.any():
+            return stored
+        return {name: np.concatenate([stored[name], live[name][keep]]) for name in stored}
+
+    def read_frame(self, symbol: str, timeframe: TimeframeLike, start: TimeLike = None, end: TimeLike = None, partial: bool = True):
+        from bar_store import columns_to_frame
+
+        return columns_to_frame(self.read(symbol, timeframe, start, end, partial))
+
+
+def update_rollups(store: BarStore, symbols: Optional[Iterable[str]] = None, timeframes: Iterable[TimeframeLike] = tuple(TIMEFRAMES)) -> Dict[str, int]:
+    written = Resampler(store, timeframes).update(symbols)
+    print(f"{bcolors.OKCYAN}Rollups: " + ", ".join(f"{name} +{count}" for name, count in written.items()) + bcolors.ENDC)
+    return written
@@ -1,7 +1,6 @@
 from paper_bot import place_dollar_share_orders
-import json
-from alpaca.trading.client import TradingClient
-from alpaca.data.historical.stock import StockHistoricalDataClient
+from screener_cache import read_screener_file
+from http_pool import ClientFactory
 from dotenv import load_dotenv
 import os
 # Load the .env file
@@ -10,17 +9,17 @@ load_dotenv()
 # Define global variables for the API keys and secrets
 ALPACA_PAPER_TOKEN = os.getenv("ALPACA_PAPER_TOKEN")
 ALPACA_PAPER_SECRET = os.getenv("ALPACA_PAPER_SECRET")
+# Points both Alpaca clients somewhere else, e.g. fake_server.py
+ALPACA_URL_OVERRIDE = os.getenv("ALPACA_URL_OVERRIDE")
 ALPACA_LIVE_TOKEN = os.getenv("ALPACA_LIVE_TOKEN")
 ALPACA_LIVE_SECRET = os.getenv("ALPACA_LIVE_SECRET")
 
-trading_client = TradingClient(
-    ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, paper=True)
+clients = ClientFactory(
+    ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET, paper=True, url_override=ALPACA_URL_OVERRIDE)
+trading_client = clients.trading_client()
+shdc_client = clients.data_client()
 
-shdc_client = StockHistoricalDataClient(
-    ALPACA_PAPER_TOKEN, ALPACA_PAPER_SECRET)
-
-with open("output/tickers.json", "r") as f:
-    tickers = json.load(f)
+tickers, _ = read_screener_file()
 tickers = tickers[:5]
 tickers = [ticker["symbol"] for ticker in tickers]
 print(tickers)
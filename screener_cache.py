@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from typing import TYPE_CHECKING, Callable, List, Optional, Tuple, Union
+
+from bcolors import bcolors
+
+if TYPE_CHECKING:
+    # records (and numpy with it) loads with the first payload
+    from records import TickerRecord
+
+"""
+TTL cache for the stock screener payload.
+
+The cache file is output/tickers.json itself, written compact as
+{"fetched_at": <epoch seconds>, "tickers": [...]}; read_screener_file()
+reads it for the other scripts (and still takes the bare list older runs
+wrote, as fetched at an unknown time). Rows are held as records.TickerRecord.
+
+The network is only hit once the payload is older than the TTL. A stale
+payload is still served while a background thread downloads the new one,
+unless it is older than max_stale: then get() waits for the refresh, so a
+one-shot run never trades on a universe from an old file.
+"""
+
+DEFAULT_SCREENER_PATH = "output/tickers.json"
+DEFAULT_SCREENER_TTL = timedelta(minutes=15)
+DEFAULT_SCREENER_MAX_STALE = timedelta(hours=1)
+
+
+def read_screener_file(path: str = DEFAULT_SCREENER_PATH) -> Tuple[List[dict], Optional[float]]:
+    # (payload, fetch time); the time is None for the bare lists older runs wrote
+    with open(path, "r") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        return data["tickers"], data.get("fetched_at")
+    return data, None
+
+
+class ScreenerCache:
+    def __init__(
+        self,
+        fetch: Callable[[], List[dict]],
+        path: str = DEFAULT_SCREENER_PATH,
+        ttl: timedelta = DEFAULT_SCREENER_TTL,
+        background: bool = True,
+        persist: bool = True,
+        max_stale: timedelta = DEFAULT_SCREENER_MAX_STALE,
+    ) -> None:
+        # persist=False reads path but never writes it (replays, backtests)
+        self.fetch = fetch
+        self.path = path
+        self.ttl = ttl
+        self.max_stale = max_stale
+        self.background = background
+        self.persist = persist
+        self.payload: Optional[List["TickerRecord"]] = None
+        self.fetched_at = 0.0
+        self.lock = threading.Lock()
+        self.refresher: Optional[threading.Thread] = None
+        self.fetches = 0
+
+    def age(self) -> float:
+        return time.time() - self.fetched_at
+
+    def is_stale(self) -> bool:
+        return self.payload is None or self.age() >= self.ttl.total_seconds()
+
+    def load(self) -> None:
+        if self.payload is not None or not os.path.exists(self.path):
+            return
+        from records import decode_tickers
+
+        payload, fetched_at = read_screener_file(self.path)
+        self.payload = decode_tickers(payload)
+        self.fetched_at = fetched_at or 0.0
+
+    def get(self) -> List["TickerRecord"]:
+        self.load()
+        if not self.is_stale():
+            return self.payload
+        if self.payload is not None and self.background and self.age() < self.max_stale.total_seconds():
+            # Keep serving the last good universe while the new one downloads
+            self.refresh_in_background()
+            return self.payload
+        return self.refresh()
+
+    def refresh(self) -> List["TickerRecord"]:
+        from records import decode_tickers
+
+        with self.lock:
+            # Another thread may have refreshed while we waited for the lock
+            if not self.is_stale() and self.payload is not None:
+                return self.payload
+            try:
+                payload = self.fetch()
+                self.fetches += 1
+            except Exception as e:
+                if self.payload is None:
+                    raise
+                print(f"{bcolors.WARNING}Screener refresh failed, keeping the cached universe: {e}{bcolors.ENDC}")
+                return self.payload
+            fetched_at = time.time()
+            self.save(payload, fetched_at)
+            self.payload = decode_tickers(payload)
+            self.fetched_at = fetched_at
+            return self.payload
+
+    def refresh_in_background(self) -> None:
+        if self.refresher is not None and self.refresher.is_alive():
+            return
+        self.refresher = threading.Thread(target=self.refresh, name="screener-refresh", daemon=True)
+        self.refresher.start()
+
+    def save(self, payload: List[Union[dict, "TickerRecord"]], fetched_at: float) -> None:
+        if not self.persist:
+            return
+        if not payload:
+            # The other scripts read this file: don't hand them an empty universe
+            print(f"{bcolors.WARNING}Empty screener payload, not writing {self.path}.{bcolors.ENDC}")
+            return
+        from records import record_to_json
+
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"fetched_at": fetched_at, "tickers": payload}, f, separators=(",", ":"), default=record_to_json)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,281 @@
+import bisect
+import hashlib
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from dataclasses import dataclass, field
+from datetime import datetime
+from math import floor
+from multiprocessing import get_context
+from typing import TYPE_CHECKING, Dict, List, Optional, Set
+
+import numpy as np
+
+import api_utils
+import metrics
+from bar_fetcher import ALPACA_REQUESTS_PER_MINUTE, TokenBucket, fetch_stock_bars
+from bar_store import DEFAULT_COLUMNAR_ROOT, BarBatchWriter, BarStore, ColumnarBarStore, Columns, TimeLike, drop_stored_overlap
+from bcolors import bcolors
+from indicators import IndicatorParams
+from lite_client import OrderSpec
+from records import BarColumns
+
+if TYPE_CHECKING:
+    from alpaca.trading.client import TradingClient
+
+    from orders import OrderBook
+
+"""
+Screen -> fetch -> store -> signal -> order, spread over worker processes.
+
+The screened tickers are split into shards by consistent hashing: every shard
+owns `replicas` points on a hash ring and a symbol goes to the owner of the
+first point after its own hash. A symbol's shard depends only on the symbol
+and the shard count, so the universe changing from one run to the next moves
+nothing, and going from N to N+1 shards moves about 1/(N+1) of the symbols.
+
+Each worker process fetches the missing minutes of its shard (own data
+client, own pooled session, an equal share of the API rate limit) and
+computes the buy signal over the stored bars plus the new ones. Workers only
+read the columnar store (opened read-only, memory-mapped); the coordinator is
+its single writer, storing each shard's bars as soon as that shard is done.
+
+The coordinator waits up to `shard_timeout` for the shards' candidates, then
+applies the global budget (dollars_per_ticker x max_orders) to them in
+screener order and submits the orders. A shard that is still running doesn't
+hold the orders up: its bars are stored when it finishes, and its symbols are
+picked up by the next run.
+"""
+
+
+def stable_hash(key: str) -> int:
+    # The same in every process and run, unlike the salted built-in hash()
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hashing of symbols onto shards 0..shards-1."""
+
+    def __init__(self, shards: int, replicas: int = 160) -> None:
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        points = sorted((stable_hash(f"shard-{shard}#{replica}"), shard) for shard in range(shards) for replica in range(replicas))
+        self.shards = shards
+        self.hashes = [point for point, _ in points]
+        self.owners = [shard for _, shard in points]
+
+    def shard_of(self, symbol: str) -> int:
+        i = bisect.bisect(self.hashes, stable_hash(symbol.upper()))
+        return self.owners[i % len(self.hashes)]
+
+    def partition(self, symbols: List[str]) -> List[List[str]]:
+        # Keeps the symbols' order within each shard
+        shards: List[List[str]] = [[] for _ in range(self.shards)]
+        for symbol in symbols:
+            shards[self.shard_of(symbol)].append(symbol)
+        return shards
+
+
+@dataclass
+class ShardConfig:
+    shards: int = os.cpu_count() or 1
+    replicas: int = 160
+    dollars_per_ticker: float = 100
+    max_orders: int = 20
+    rsi_overbought: float = 70
+    params: IndicatorParams = IndicatorParams()
+    lookback_bars: int = 100
+    # Seconds the coordinator waits for candidates before placing the orders
+    shard_timeout: float = 120.0
+    # Split evenly between the workers
+    requests_per_minute: float = ALPACA_REQUESTS_PER_MINUTE
+
+
+@dataclass
+class Candidate:
+    symbol: str
+    price: float
+
+
+@dataclass
+class ShardResult:
+    shard: int
+    symbols: List[str]
+    bars: Dict[str, BarColumns]
+    failed: Dict[str, str]
+    candidates: List[Candidate]
+    synced_until: datetime
+    seconds: float
+
+
+@dataclass
+class ShardedRun:
+    results: List[ShardResult] = field(default_factory=list)
+    late: List[int] = field(default_factory=list)  # shards that missed the order deadline
+    failed: Dict[int, str] = field(default_factory=dict)  # shards whose worker raised
+    orders: List[api_utils.OrderResult] = field(default_factory=list)
+    seconds: float = 0.0
+
+
+class StoreOverlay:
+    """The stored bars plus the ones fetched this run, readable like a BarStore."""
+
+    def __init__(self, store: BarStore, fetched: Dict[str, BarColumns]) -> None:
+        self.store = store
+        self.fetched = fetched
+
+    def read(self, symbol: str, start: TimeLike = None, end: TimeLike = None) -> Columns:
+        stored = self.store.read(symbol, start, end)
+        new = self.fetched.get(symbol)
+        if new is None or not len(new):
+            return stored
+        last = int(stored["timestamp"][-1]) if len(stored["timestamp"]) else None
+        new = drop_stored_overlap(new.columns, last)
+        return {name: np.concatenate([stored[name], new[name]]) for name in stored}
+
+
+def buy_candidates(source, symbols: List[str], config: ShardConfig) -> List[Candidate]:
+    # bot.decide_buy's rule on the latest bar: MACD histogram below zero but
+    # rising and accelerating, RSI not overbought
+    from indicators import compute_indicators, load_panel
+
+    if not symbols:
+        return []
+    panel = load_panel(source, symbols, config.lookback_bars)
+    if panel.shape[1] == 0:
+        return []
+    result = compute_indicators(panel, config.params)
+    hist, deriv, deriv2, rsi = (result[name][:, -1] for name in ("macdHist", "macdHistDeriv", "macdHistDeriv2", "rsi"))
+    close = panel["close"][:, -1]
+    with np.errstate(invalid="ignore"):
+        turning_up = (hist < 0) & (deriv > 0) & (deriv2 > 0) & (rsi < config.rsi_overbought) & (close > 0)
+    return [Candidate(symbols[i], float(close[i])) for i in np.flatnonzero(turning_up)]
+
+
+# Worker side: one data client, store and rate limiter per process
+_worker = {}
+
+
+def _init_worker(api_key: Optional[str], secret_key: Optional[str], url_override: Optional[str], store_root: str, requests_per_minute: float) -> None:
+    import http_pool
+
+    clients = http_pool.ClientFactory(api_key, secret_key, paper=True, url_override=url_override)
+    _worker.update(
+        client=clients.data_client(),
+        store_root=store_root,
+        bucket=TokenBucket(requests_per_minute),
+    )
+
+
+def _run_shard(shard: int, symbols: List[str], start: datetime, end: datetime, config: ShardConfig) -> ShardResult:
+    started = time.perf_counter()
+    # Reopened per shard: meta.json as of now, including what the coordinator stored since
+    store = ColumnarBarStore(_worker["store_root"], readonly=True)
+    end, windows = api_utils.plan_sync_windows(store, symbols, start, end)
+    fetched: Dict[str, BarColumns] = {}
+    failed: Dict[str, str] = {}
+    for window_start, window_symbols in windows.items():
+        if window_start >= end:
+            continue
+        result = fetch_stock_bars(_worker["client"], window_symbols, window_start, end, bucket=_worker["bucket"])
+        fetched.update(result.data)
+        failed.update(result.failed)
+    candidates = buy_candidates(StoreOverlay(store, fetched), [symbol for symbol in symbols if symbol not in failed], config)
+    return ShardResult(shard, symbols, fetched, failed, candidates, end, time.perf_counter() - started)
+
+
+# Coordinator side
+
+def store_shard(store: BarStore, result: ShardResult) -> int:
+    with BarBatchWriter(store) as writer:
+        writer.write_many(result.bars)
+    store.mark_synced([symbol for symbol in result.symbols if symbol not in result.failed], result.synced_until)
+    store.flush()
+    return writer.written
+
+
+def select_orders(candidates: List[Candidate], ranks: Dict[str, int], config: ShardConfig, book: Optional["OrderBook"] = None) -> List[OrderSpec]:
+    # Best-ranked candidates first (screener order), within the global budget
+    budget = config.dollars_per_ticker * config.max_orders
+    orders = []
+    for candidate in sorted(candidates, key=lambda candidate: ranks[candidate.symbol]):
+        if len(orders) == config.max_orders:
+            break
+        if book is not None and book.has_open(candidate.symbol, "buy"):
+            continue
+        price = round(candidate.price, 2)
+        shares = floor(config.dollars_per_ticker // price) if price > 0 else 0
+        if shares < 1 or shares * price > budget:
+            continue
+        budget -= shares * price
+        orders.append(OrderSpec.limit(candidate.symbol, shares, "buy", price))
+    return orders
+
+
+@metrics.timed("sharding.run")
+def run_sharded(
+    tickers: List[str],
+    start: datetime,
+    end: datetime,
+    config: Optional[ShardConfig] = None,
+    api_key: Optional[str] = None,
+    secret_key: Optional[str] = None,
+    url_override: Optional[str] = None,
+    store_root: str = DEFAULT_COLUMNAR_ROOT,
+    trading_client: Optional["TradingClient"] = None,
+    book: Optional["OrderBook"] = None,
+) -> ShardedRun:
+    # Without a trading client the candidates are only reported, no orders go out
+    started = time.perf_counter()
+    config = config if config is not None else ShardConfig()
+    run = ShardedRun()
+    ranks = {ticker: rank for rank, ticker in enumerate(tickers)}
+    parts = HashRing(config.shards, config.replicas).partition(tickers)
+    store = ColumnarBarStore(store_root)
+    print(f"{bcolors.OKCYAN}{len(tickers)} tickers over {config.shards} shards: {[len(part) for part in parts]}{bcolors.ENDC}")
+
+    def collect(futures: Dict[Future, int], done: Set[Future]) -> None:
+        for future in done:
+            shard = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                run.failed[shard] = str(e)
+                print(f"{bcolors.FAIL}Shard {shard} failed: {e}{bcolors.ENDC}")
+                continue
+            written = store_shard(store, result)
+            run.results.append(result)
+            metrics.observe("sharding.shard", result.seconds)
+            print(
+                f"Shard {shard}: {len(result.symbols)} tickers, {written} bars, "
+                f"{len(result.candidates)} candidates in {result.seconds:.2f}s"
+            )
+
+    with ProcessPoolExecutor(
+        max_workers=config.shards,
+        mp_context=get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(api_key, secret_key, url_override, store_root, config.requests_per_minute / config.shards),
+    ) as pool:
+        futures = {pool.submit(_run_shard, shard, part, start, end, config): shard for shard, part in enumerate(parts) if part}
+        deadline = time.monotonic() + config.shard_timeout
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            collect(futures, done)
+
+        run.late = sorted(futures[future] for future in pending)
+        if run.late:
+            print(f"{bcolors.WARNING}Shards {run.late} missed the deadline, ordering without them.{bcolors.ENDC}")
+        candidates = [candidate for result in run.results for candidate in result.candidates]
+        orders = select_orders(candidates, ranks, config, book)
+        print(f"{bcolors.OKCYAN}{len(candidates)} candidates, {len(orders)} orders within the budget.{bcolors.ENDC}")
+        if trading_client is not None and orders:
+            run.orders = api_utils.submit_orders(trading_client, orders, book=book)
+        # The late shards' bars are still worth keeping
+        if pending:
+            collect(futures, set(wait(pending).done))
+    run.seconds = time.perf_counter() - started
+    return run
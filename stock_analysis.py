@@ -1,26 +1,15 @@
-import json
-import matplotlib.pyplot as plt
-import pandas as pd
-import numpy as np
-import talib as ta
-from datetime import datetime
-from matplotlib.dates import date2num
-from mpl_finance import _candlestick
+from bar_store import load_bars_frame
+from indicators import IndicatorParams, compute_indicators, panel_from_frame
 
-# Load the JSON data
-ticker = "AAPL"
-data = json.load(
-    open(f"./output/tickers/{ticker.lower()}/{ticker.lower()}_bars.json"))
+"""
+MACD charts for one ticker from the bar store, shown in a window.
 
-# Extract data into a DataFrame
-df = pd.DataFrame(data)
-df['timestamp'] = pd.to_datetime(df['timestamp'])
-df.set_index('timestamp', inplace=True)
+Only the analysis runs at import; matplotlib loads when a chart is drawn,
+so screening code can use analyse() without it. charts.py renders the same
+indicators for many tickers to PNG files, without a display.
+"""
 
-# Prepare data for candlestick chart
-df_ochl = df[['open', 'close', 'high', 'low']].copy()
-df_ochl['date_num'] = date2num(df_ochl.index.to_pydatetime())
-df_ochl = df_ochl[['date_num', 'open', 'close', 'high', 'low']]
+ticker = "AAPL"
 
 # Technical Analysis Parameters
 SMA_FAST = 50
@@ -34,52 +23,62 @@ STOCH_K = 14
 STOCH_D = 3
 Y_AXIS_SIZE = 12
 
-# Technical Analysis Calculations
-analysis = pd.DataFrame(index=df.index)
-analysis['sma_f'] = df['close'].rolling(window=SMA_FAST).mean()
-analysis['sma_s'] = df['close'].rolling(window=SMA_SLOW).mean()
-analysis['rsi'] = ta.RSI(df['close'].values, timeperiod=RSI_PERIOD)
-analysis['sma_r'] = analysis['rsi'].rolling(window=RSI_AVG_PERIOD).mean()
-analysis['macd'], analysis['macdSignal'], analysis['macdHist'] = ta.MACD(
-    df['close'].values, fastperiod=MACD_FAST, slowperiod=MACD_SLOW, signalperiod=MACD_SIGNAL)
-analysis['stoch_k'], analysis['stoch_d'] = ta.STOCH(
-    df['high'].values, df['low'].values, df['close'].values, slowk_period=STOCH_K, slowd_period=STOCH_D)
+params = IndicatorParams(
+    sma_fast=SMA_FAST, sma_slow=SMA_SLOW, rsi_period=RSI_PERIOD, rsi_avg_period=RSI_AVG_PERIOD,
+    macd_fast=MACD_FAST, macd_slow=MACD_SLOW, macd_signal=MACD_SIGNAL, stoch_k=STOCH_K, stoch_d=STOCH_D)
+
+
+def analyse(ticker: str, params: IndicatorParams = params):
+    # Load the bars (columnar store, falling back to the legacy JSON files)
+    df = load_bars_frame(ticker)
+    # Technical Analysis Calculations (see indicators.py, the same code screens the whole universe)
+    return df, compute_indicators(panel_from_frame(ticker, df), params).frame(ticker)
+
+
+def candlestick_data(df):
+    # Prepare data for candlestick chart
+    from matplotlib.dates import date2num
+
+    df_ochl = df[['open', 'close', 'high', 'low']].copy()
+    df_ochl['date_num'] = date2num(df_ochl.index.to_pydatetime())
+    return df_ochl[['date_num', 'open', 'close', 'high', 'low']]
+
 
-# Calculate the derivative of the MACD Histogram
-analysis['macdHistDeriv'] = np.gradient(analysis['macdHist'])
-# Calculate the second derivative of the MACD Histogram
-analysis['macdHistDeriv2'] = np.gradient(analysis['macdHistDeriv'])
+def plot(analysis, show: bool = True):
+    import matplotlib.pyplot as plt
 
-# if macdHistDeriv > 0 -> 1, macdHistDeriv < 0 -> -1, else 0
-analysis['macdHistDeriv'] = np.sign(analysis['macdHistDeriv'])
+    # Plot the macd on 2 charts (macd and signal ; macd histogram), also, find the derivative of the macdHist
+    fig, ax = plt.subplots(4, figsize=(15, 10))
+    ax[0].plot(analysis.index, analysis['macd'], label='MACD')
+    ax[0].plot(analysis.index, analysis['macdSignal'], label='Signal Line')
+    ax[0].set_title('MACD and Signal Line')
+    ax[0].set_ylabel('MACD')
+    ax[0].legend(loc='upper left')
+    ax[0].grid()
+    ax[1].plot(analysis.index, analysis['macdHist'], label='MACD Histogram')
+    ax[1].set_title('MACD Histogram')
+    ax[1].set_ylabel('MACD Hist')
+    ax[1].legend(loc='upper left')
+    ax[1].grid()
+    ax[2].plot(analysis.index, analysis['macdHistDeriv'],
+               label='MACD Histogram Derivative')
+    ax[2].set_title('MACD Histogram Derivative')
+    ax[2].set_ylabel('MACD Hist Deriv')
+    ax[2].legend(loc='upper left')
+    ax[2].grid()
+    ax[3].plot(analysis.index, analysis['macdHistDeriv2'],
+               label='MACD Histogram Second Derivative')
+    ax[3].set_title('MACD Histogram Second Derivative')
+    ax[3].set_ylabel('MACD Hist Deriv2')
+    ax[3].legend(loc='upper left')
+    ax[3].grid()
+    plt.tight_layout()
+    if show:
+        plt.show()
+    return fig
 
-# if macdHistDeriv2 > 0 -> 1, macdHistDeriv2 < 0 -> -1, else 0
-analysis['macdHistDeriv2'] = np.sign(analysis['macdHistDeriv2'])
 
-# Plot the macd on 2 charts (macd and signal ; macd histogram), also, find the derivative of the macdHist
-fig, ax = plt.subplots(4, figsize=(15, 10))
-ax[0].plot(analysis.index, analysis['macd'], label='MACD')
-ax[0].plot(analysis.index, analysis['macdSignal'], label='Signal Line')
-ax[0].set_title('MACD and Signal Line')
-ax[0].set_ylabel('MACD')
-ax[0].legend(loc='upper left')
-ax[0].grid()
-ax[1].plot(analysis.index, analysis['macdHist'], label='MACD Histogram')
-ax[1].set_title('MACD Histogram')
-ax[1].set_ylabel('MACD Hist')
-ax[1].legend(loc='upper left')
-ax[1].grid()
-ax[2].plot(analysis.index, analysis['macdHistDeriv'],
-           label='MACD Histogram Derivative')
-ax[2].set_title('MACD Histogram Derivative')
-ax[2].set_ylabel('MACD Hist Deriv')
-ax[2].legend(loc='upper left')
-ax[2].grid()
-ax[3].plot(analysis.index, analysis['macdHistDeriv2'],
-           label='MACD Histogram Second Derivative')
-ax[3].set_title('MACD Histogram Second Derivative')
-ax[3].set_ylabel('MACD Hist Deriv2')
-ax[3].legend(loc='upper left')
-ax[3].grid()
-plt.tight_layout()
-plt.show()
+if __name__ == "__main__":
+    df, analysis = analyse(ticker)
+    df_ochl = candlestick_data(df)
+    plot(analysis)
@@ -0,0 +1,320 @@
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+import msgpack
+import numpy as np
+
+import metrics
+from bar_store import PRICE_FIELDS, BarStore, Columns, empty_columns, to_epoch_ns
+
+"""
+Live minute bars and quotes kept in memory.
+
+StreamIngestor subscribes a data stream (alpaca's StockDataStream in raw mode,
+or ReplayStream offline) to the symbols of the current universe and writes
+every bar into a fixed-size ring buffer per symbol and every quote into the
+latest-quote table of a MarketData. The bot and get_latest_prices then read
+prices and recent bars from there instead of asking the REST API.
+
+Messages are the stream's raw dicts: bars {"S", "t", "o", "h", "l", "c", "v",
+"n", "vw"}, quotes {"S", "t", "bp", "bs", "ap", "as"}, with "t" a
+msgpack.Timestamp.
+"""
+
+DEFAULT_RING_SIZE = 100
+# Raw bar message key -> bar store column
+BAR_KEYS = {"open": "o", "high": "h", "low": "l", "close": "c", "volume": "v", "trade_count": "n", "vwap": "vw"}
+MINUTE_NS = 60 * 10**9
+
+
+class BarRing:
+    """The last `capacity` bars of one symbol, in bar store columns."""
+
+    def __init__(self, capacity: int = DEFAULT_RING_SIZE) -> None:
+        self.capacity = capacity
+        self.columns = empty_columns(capacity)
+        self.count = 0  # bars ever appended; the next one goes to count % capacity
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    def last_timestamp(self) -> Optional[int]:
+        return int(self.columns["timestamp"][(self.count - 1) % self.capacity]) if self.count else None
+
+    def append(self, timestamp: int, values: Dict[str, float]) -> bool:
+        last = self.last_timestamp()
+        if last is not None and timestamp < last:
+            return False
+        if last is not None and timestamp == last:
+            # A corrected bar for the same minute replaces the previous one
+            i = (self.count - 1) % self.capacity
+        else:
+            i = self.count % self.capacity
+            self.count += 1
+        self.columns["timestamp"][i] = timestamp
+        for field in PRICE_FIELDS:
+            self.columns[field][i] = values[field]
+        return True
+
+    def read(self, start_ns: Optional[int] = None) -> Columns:
+        # Oldest first, copied out so the ring can keep moving
+        size = len(self)
+        order = np.arange(self.count - size, self.count) % self.capacity
+        if start_ns is not None:
+            order = order[self.columns["timestamp"][order] >= start_ns]
+        return {name: column[order] for name, column in self.columns.items()}
+
+
+class Quote:
+    __slots__ = ("timestamp", "bid_price", "bid_size", "ask_price", "ask_size")
+
+    def __init__(self, timestamp: int, bid_price: float, bid_size: float, ask_price: float, ask_size: float) -> None:
+        self.timestamp = timestamp
+        self.bid_price = bid_price
+        self.bid_size = bid_size
+        self.ask_price = ask_price
+        self.ask_size = ask_size
+
+    @property
+    def mid(self) -> float:
+        if self.bid_price > 0 and self.ask_price > 0:
+            return (self.bid_price + self.ask_price) / 2
+        return self.bid_price or self.ask_price
+
+
+class MarketData:
+    """Ring buffers and latest quotes, written by the stream thread and read by anyone."""
+
+    def __init__(self, ring_size: int = DEFAULT_RING_SIZE) -> None:
+        self.ring_size = ring_size
+        self.rings: Dict[str, BarRing] = {}
+        self.quotes: Dict[str, Quote] = {}
+        self.lock = threading.Lock()
+        self.bars_received = 0
+        self.quotes_received = 0
+
+    def on_bar(self, symbol: str, timestamp: int, values: Dict[str, float]) -> None:
+        with self.lock:
+            ring = self.rings.get(symbol)
+            if ring is None:
+                ring = self.rings[symbol] = BarRing(self.ring_size)
+            ring.append(timestamp, values)
+            self.bars_received += 1
+
+    def on_quote(self, symbol: str, quote: Quote) -> None:
+        with self.lock:
+            current = self.quotes.get(symbol)
+            if current is None or quote.timestamp >= current.timestamp:
+                self.quotes[symbol] = quote
+            self.quotes_received += 1
+
+    def read(self, symbol: str, start_ns: Optional[int] = None) -> Columns:
+        with self.lock:
+            ring = self.rings.get(symbol)
+            return empty_columns() if ring is None else ring.read(start_ns)
+
+    def price(self, symbol: str) -> Optional[float]:
+        # The quote mid when it is newer than the end of the last bar, else that bar's close
+        with self.lock:
+            ring = self.rings.get(symbol)
+            quote = self.quotes.get(symbol)
+            close, bar_end = None, None
+            if ring is not None and ring.count:
+                i = (ring.count - 1) % ring.capacity
+                close = float(ring.columns["close"][i])
+                bar_end = int(ring.columns["timestamp"][i]) + MINUTE_NS
+        if quote is not None and quote.mid > 0 and (bar_end is None or quote.timestamp >= bar_end):
+            return quote.mid
+        return close
+
+    def prices(self, symbols: Iterable[str]) -> Dict[str, float]:
+        prices = {}
+        for symbol in symbols:
+            price = self.price(symbol)
+            if price is not None:
+                prices[symbol] = price
+        return prices
+
+    def drop(self, symbols: Iterable[str]) -> None:
+        with self.lock:
+            for symbol in symbols:
+                self.rings.pop(symbol, None)
+                self.quotes.pop(symbol, None)
+
+
+def parse_bar(msg: dict) -> Dict[str, float]:
+    return {field: float(msg.get(key) or 0.0) for field, key in BAR_KEYS.items()}
+
+
+def parse_quote(msg: dict) -> Quote:
+    return Quote(
+        msg["t"].to_unix_nano(),
+        float(msg.get("bp") or 0.0), float(msg.get("bs") or 0.0),
+        float(msg.get("ap") or 0.0), float(msg.get("as") or 0.0),
+    )
+
+
+class StreamIngestor:
+    """
+    Keeps a data stream subscribed to exactly the wanted symbols and feeds what
+    it delivers into a MarketData. The stream runs its own event loop in a
+    background thread; set_universe() blocks while the (un)subscribe messages
+    go out, so call it from a worker thread, not from that loop.
+    """
+
+    def __init__(self, stream, market: Optional[MarketData] = None, quotes: bool = True, keep_dropped: bool = False) -> None:
+        self.stream = stream
+        self.market = market or MarketData()
+        self.quotes = quotes
+        self.keep_dropped = keep_dropped
+        self.symbols: Set[str] = set()
+        self.lock = threading.Lock()
+        self.thread: Optional[threading.Thread] = None
+
+    async def handle_bar(self, msg: dict) -> None:
+        self.market.on_bar(msg["S"], msg["t"].to_unix_nano(), parse_bar(msg))
+        metrics.count("stream.bars")
+
+    async def handle_quote(self, msg: dict) -> None:
+        self.market.on_quote(msg["S"], parse_quote(msg))
+        metrics.count("stream.quotes")
+
+    def set_universe(self, symbols: Iterable[str]) -> None:
+        with self.lock:
+            wanted = set(symbols)
+            added = sorted(wanted - self.symbols)
+            removed = sorted(self.symbols - wanted)
+            if removed:
+                self.stream.unsubscribe_bars(*removed)
+                if self.quotes:
+                    self.stream.unsubscribe_quotes(*removed)
+                if not self.keep_dropped:
+                    self.market.drop(removed)
+            if added:
+                self.stream.subscribe_bars(self.handle_bar, *added)
+                if self.quotes:
+                    self.stream.subscribe_quotes(self.handle_quote, *added)
+            self.symbols = wanted
+        if added or removed:
+            print(f"Stream: +{len(added)} -{len(removed)} symbols, {len(wanted)} subscribed.")
+
+    def start(self) -> "StreamIngestor":
+        if self.thread is None:
+            self.thread = threading.Thread(target=self.stream.run, name="market-stream", daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self.thread is not None:
+            self.stream.stop()
+            self.thread.join(timeout=5)
+            self.thread = None
+
+    def sync(self, until_ns: int) -> None:
+        # Replay streams deliver on demand; the live stream pushes on its own
+        pump = getattr(self.stream, "pump", None)
+        if pump is not None:
+            pump(until_ns)
+
+
+class ReplayStream:
+    """
+    Stand-in for StockDataStream that delivers recorded bars from a bar store
+    as raw stream messages. A bar is delivered once its minute has ended, and
+    with quotes subscribed it is followed by a quote at its close (the store
+    has no quotes of its own). pump(until) delivers everything due by then;
+    with a clock, run() keeps pumping up to clock.now() until stop().
+    """
+
+    def __init__(self, store: BarStore, clock=None, poll: float = 0.05) -> None:
+        self.store = store
+        self.clock = clock
+        self.poll = poll
+        self.bar_handlers: Dict[str, Callable] = {}
+        self.quote_handlers: Dict[str, Callable] = {}
+        # Per symbol, the first bar timestamp not delivered yet
+        self.cursor: Dict[str, int] = {}
+        self.lock = threading.Lock()
+        self.pump_lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.delivered = 0
+
+    def subscribe_bars(self, handler: Callable, *symbols: str) -> None:
+        with self.lock:
+            for symbol in symbols:
+                self.bar_handlers[symbol] = handler
+
+    def subscribe_quotes(self, handler: Callable, *symbols: str) -> None:
+        with self.lock:
+            for symbol in symbols:
+                self.quote_handlers[symbol] = handler
+
+    def unsubscribe_bars(self, *symbols: str) -> None:
+        with self.lock:
+            for symbol in symbols:
+                self.bar_handlers.pop(symbol, None)
+
+    def unsubscribe_quotes(self, *symbols: str) -> None:
+        with self.lock:
+            for symbol in symbols:
+                self.quote_handlers.pop(symbol, None)
+
+    def messages(self, symbol: str, until_ns: int, with_quotes: bool = False) -> List[dict]:
+        # Bars that ended by until_ns; a new subscriber starts at the current minute
+        start = self.cursor.get(symbol, until_ns - MINUTE_NS)
+        columns = self.store.read(symbol, start, until_ns - MINUTE_NS)
+        messages = []
+        for i in range(len(columns["timestamp"])):
+            timestamp = int(columns["timestamp"][i])
+            bar = {"T": "b", "S": symbol, "t": msgpack.Timestamp.from_unix_nano(timestamp)}
+            for field, key in BAR_KEYS.items():
+                bar[key] = float(columns[field][i])
+            messages.append(bar)
+            if with_quotes:
+                close = bar["c"]
+                end = msgpack.Timestamp.from_unix_nano(timestamp + MINUTE_NS)
+                messages.append({"T": "q", "S": symbol, "t": end, "bp": close, "bs": 0.0, "ap": close, "as": 0.0})
+        self.cursor[symbol] = until_ns - MINUTE_NS + 1
+        return messages
+
+    def pump(self, until_ns: int) -> int:
+        with self.pump_lock:
+            with self.lock:
+                bar_handlers = dict(self.bar_handlers)
+                quote_handlers = dict(self.quote_handlers)
+            for symbol in set(self.cursor) - set(bar_handlers):
+                del self.cursor[symbol]
+            delivered = 0
+            for symbol, handler in bar_handlers.items():
+                for msg in self.messages(symbol, until_ns, symbol in quote_handlers):
+                    target = handler if msg["T"] == "b" else quote_handlers[symbol]
+                    # Handlers are coroutines like the SDK's; these never await
+                    _run_handler(target, msg)
+                    delivered += 1
+            self.delivered += delivered
+            return delivered
+
+    def run(self) -> None:
+        while not self.stopped.wait(self.poll):
+            if self.clock is not None:
+                self.pump(to_epoch_ns(self.clock.now()))
+
+    def stop(self) -> None:
+        self.stopped.set()
+
+
+def _run_handler(handler: Callable, msg: dict) -> None:
+    coroutine = handler(msg)
+    try:
+        coroutine.send(None)
+    except StopIteration:
+        return
+    coroutine.close()
+    raise RuntimeError("stream handlers must not await")
+
+
+def live_stream(api_key: str, secret_key: str, url_override: Optional[str] = None):
+    from alpaca.data.live.stock import StockDataStream
+
+    # Raw mode: dicts straight from msgpack, no model per message
+    return StockDataStream(api_key, secret_key, raw_data=True, url_override=url_override)
@@ -0,0 +1,260 @@
+import math
+from collections import deque
+from itertools import repeat
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+
+from bar_store import BarStore, open_bar_store
+from indicators import INDICATOR_COLUMNS, IndicatorParams
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+"""
+Incremental versions of the indicators in indicators.py.
+
+Each object takes one new value per bar in O(1) and reports the value the batch
+computation gives for that bar, NaN until it has enough history (talib's
+lookback). Seed them by replaying stored bars, then feed live bars one at a time.
+
+The MACD histogram derivatives are np.gradient evaluated at the newest bar:
+a one-sided difference, since the next bar isn't known yet. That is the value
+indicators.compute_indicators reports in the last column.
+"""
+
+NAN = float("nan")
+
+
+class SMA:
+    """Simple moving average over a ring buffer, like pandas rolling(period).mean()."""
+
+    def __init__(self, period: int) -> None:
+        self.period = period
+        self.window = deque(maxlen=period)
+        self.total = 0.0
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        if math.isnan(x):
+            # pandas needs a full window of valid values
+            self.window.clear()
+            self.total = 0.0
+            self.value = NAN
+            return self.value
+        if len(self.window) == self.period:
+            self.total -= self.window[0]
+        self.window.append(x)
+        self.total += x
+        self.value = self.total / self.period if len(self.window) == self.period else NAN
+        return self.value
+
+
+class EMA:
+    """
+    talib EMA: seeded with the SMA of the `period` values ending at bar
+    `warmup` (period by default), then x * k + prev * (1 - k).
+    """
+
+    def __init__(self, period: int, warmup: Optional[int] = None) -> None:
+        self.period = period
+        self.warmup = warmup or period
+        self.k = 2.0 / (period + 1)
+        self.seed = deque(maxlen=period)
+        self.count = 0
+        self.value = NAN
+
+    def update(self, x: float) -> float:
+        if math.isnan(x) and self.count == 0:
+            return self.value
+        self.count += 1
+        if self.count < self.warmup:
+            self.seed.append(x)
+        elif self.count == self.warmup:
+            self.seed.append(x)
+            self.value = sum(self.seed) / self.period
+            self.seed.clear()
+        else:
+            self.value += self.k * (x - self.value)
+        return self.value
+
+
+class RSI:
+    """talib RSI with Wilder smoothing."""
+
+    def __init__(self, period: int) -> None:
+        self.period = period
+        self.prev = NAN
+        self.count = 0
+        self.avg_gain = 0.0
+        self.avg_loss = 0.0
+        self.value = NAN
+
+    def update(self, close: float) -> float:
+        if math.isnan(self.prev):
+            self.prev = close
+            return self.value
+        delta = close - self.prev
+        self.prev = close
+        gain = delta if delta > 0 else 0.0
+        loss = -delta if delta < 0 else 0.0
+        self.count += 1
+        if self.count < self.period:
+            self.avg_gain += gain
+            self.avg_loss += loss
+            return self.value
+        if self.count == self.period:
+            self.avg_gain = (self.avg_gain + gain) / self.period
+            self.avg_loss = (self.avg_loss + loss) / self.period
+        else:
+            self.avg_gain = (self.avg_gain * (self.period - 1) + gain) / self.period
+            self.avg_loss = (self.avg_loss * (self.period - 1) + loss) / self.period
+        total = self.avg_gain + self.avg_loss
+        self.value = 100.0 * self.avg_gain / total if total != 0 else 0.0
+        return self.value
+
+
+class MACD:
+    """talib MACD: the fast EMA starts with the slow one, output starts once the signal is seeded."""
+
+    def __init__(self, fast: int, slow: int, signal: int) -> None:
+        self.fast = EMA(fast, warmup=slow)
+        self.slow = EMA(slow)
+        self.signal = EMA(signal)
+        self.macd = self.macd_signal = self.hist = NAN
+
+    def update(self, close: float):
+        line = self.fast.update(close) - self.slow.update(close)
+        if math.isnan(line):
+            return self.macd, self.macd_signal, self.hist
+        signal = self.signal.update(line)
+        if not math.isnan(signal):
+            self.macd, self.macd_signal, self.hist = line, signal, line - signal
+        return self.macd, self.macd_signal, self.hist
+
+
+class Stochastic:
+    """talib STOCH with SMA smoothing of %K and %D."""
+
+    def __init__(self, fastk: int, slowk: int, slowd: int) -> None:
+        self.highs = deque(maxlen=fastk)
+        self.lows = deque(maxlen=fastk)
+        self.slow_k = SMA(slowk)
+        self.slow_d = SMA(slowd)
+        self.k = self.d = NAN
+
+    def update(self, high: float, low: float, close: float):
+        self.highs.append(high)
+        self.lows.append(low)
+        if len(self.highs) < self.highs.maxlen:
+            return self.k, self.d
+        highest, lowest = max(self.highs), min(self.lows)
+        spread = highest - lowest
+        fast_k = (close - lowest) / spread * 100.0 if spread != 0 else 0.0
+        slow_k = self.slow_k.update(fast_k)
+        slow_d = self.slow_d.update(slow_k)
+        if not math.isnan(slow_d):
+            self.k, self.d = slow_k, slow_d
+        return self.k, self.d
+
+
+class Gradient:
+    """First and second np.gradient of a series, evaluated at its newest value."""
+
+    def __init__(self) -> None:
+        self.values = deque([NAN, NAN, NAN], maxlen=3)
+        self.count = 0
+
+    def update(self, x: float):
+        self.values.append(x)
+        self.count += 1
+        h2, h1, h0 = self.values
+        if self.count < 2:
+            return NAN, NAN
+        deriv = h0 - h1
+        if self.count < 3:
+            # np.gradient of two points is the same difference at both ends
+            return deriv, 0.0 * deriv
+        # gradient of the gradient: newest one-sided minus the previous central difference
+        return deriv, deriv - (h0 - h2) / 2.0
+
+
+def sign(x: float) -> float:
+    if math.isnan(x):
+        return NAN
+    return float((x > 0) - (x < 0))
+
+
+class IndicatorState:
+    """All of stock_analysis.py's indicators for one symbol, updated one bar at a time."""
+
+    def __init__(self, params: IndicatorParams = IndicatorParams()) -> None:
+        self.params = params
+        self.sma_f = SMA(params.sma_fast)
+        self.sma_s = SMA(params.sma_slow)
+        self.rsi = RSI(params.rsi_period)
+        self.sma_r = SMA(params.rsi_avg_period)
+        self.macd = MACD(params.macd_fast, params.macd_slow, params.macd_signal)
+        self.stoch = Stochastic(params.stoch_fastk, params.stoch_k, params.stoch_d)
+        self.gradient = Gradient()
+        self.timestamp: Optional[int] = None
+        self.values: Dict[str, float] = dict.fromkeys(INDICATOR_COLUMNS, NAN)
+
+    def update(self, high: float, low: float, close: float, timestamp: Optional[int] = None) -> Dict[str, float]:
+        values = self.values
+        values["sma_f"] = self.sma_f.update(close)
+        values["sma_s"] = self.sma_s.update(close)
+        values["rsi"] = self.rsi.update(close)
+        values["sma_r"] = self.sma_r.update(values["rsi"])
+        values["macd"], values["macdSignal"], values["macdHist"] = self.macd.update(close)
+        values["stoch_k"], values["stoch_d"] = self.stoch.update(high, low, close)
+        deriv, deriv2 = self.gradient.update(values["macdHist"])
+        values["macdHistDeriv"] = sign(deriv)
+        values["macdHistDeriv2"] = sign(deriv2)
+        self.timestamp = timestamp
+        return values
+
+    def seed(self, highs: Iterable[float], lows: Iterable[float], closes: Iterable[float], timestamps: Optional[Iterable[int]] = None) -> Dict[str, float]:
+        timestamps = timestamps if timestamps is not None else repeat(None)
+        for high, low, close, timestamp in zip(highs, lows, closes, timestamps):
+            self.update(float(high), float(low), float(close), None if timestamp is None else int(timestamp))
+        return self.values
+
+
+class IndicatorStates:
+    """IndicatorState per symbol, seeded from the bar store."""
+
+    def __init__(self, params: IndicatorParams = IndicatorParams()) -> None:
+        self.params = params
+        self.states: Dict[str, IndicatorState] = {}
+
+    def seed_from_store(self, store: Optional[BarStore] = None, symbols: Optional[List[str]] = None) -> None:
+        store = store or open_bar_store()
+        for symbol in store.symbols() if symbols is None else symbols:
+            columns = store.read(symbol)
+            state = self.states[symbol] = IndicatorState(self.params)
+            state.seed(columns["high"], columns["low"], columns["close"], columns["timestamp"])
+
+    def update(self, symbol: str, high: float, low: float, close: float, timestamp: Optional[int] = None) -> Dict[str, float]:
+        state = self.states.get(symbol)
+        if state is None:
+            state = self.states[symbol] = IndicatorState(self.params)
+        elif timestamp is not None and state.timestamp is not None and timestamp <= state.timestamp:
+            # Already seen (e.g. replayed from the store), don't count it twice
+            return state.values
+        return state.update(high, low, close, timestamp)
+
+    def __getitem__(self, symbol: str) -> Dict[str, float]:
+        return self.states[symbol].values
+
+    def __contains__(self, symbol: str) -> bool:
+        return symbol in self.states
+
+    def latest(self) -> "pd.DataFrame":
+        # Same layout as indicators.IndicatorResult.latest()
+        import pandas as pd
+
+        return pd.DataFrame.from_dict(
+            {symbol: dict(state.values) for symbol, state in self.states.items()},
+            orient="index",
+            columns=list(INDICATOR_COLUMNS),
+        ).rename_axis("symbol")
+
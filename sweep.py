@@ -0,0 +1,169 @@
+import hashlib
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, fields
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from backtest import Backtest, MacdStrategy, merge_bars
+from bar_store import DEFAULT_COLUMNAR_ROOT, Columns, TimeLike, open_bar_store
+from bcolors import bcolors
+from indicators import IndicatorParams
+
+"""
+Parallel parameter sweep over the indicator constants.
+
+Every cell of the grid is one backtest (see backtest.py) with its own
+IndicatorParams. Cells are spread over a process pool. The parent merges the
+bars into one time-ordered stream once and writes it next to the results as
+.npy files; every worker memory-maps those read-only, so the workers share
+one copy through the page cache instead of each merging (or being pickled)
+its own.
+
+Finished cells are appended to output/sweeps/results.jsonl, keyed by the
+params, the strategy settings, the time range and the store's data_version(),
+so re-running a sweep (or a larger grid around it) only runs the new cells,
+and adding bars to the store invalidates the old ones.
+"""
+
+DEFAULT_SWEEP_CACHE = "output/sweeps/results.jsonl"
+PARAM_NAMES = tuple(f.name for f in fields(IndicatorParams))
+
+
+def expand_grid(grid: Dict[str, Iterable]) -> List[IndicatorParams]:
+    # Keys are IndicatorParams fields, or stock_analysis.py's constant names (SMA_FAST, ...)
+    names = [name.lower() for name in grid]
+    unknown = [name for name in names if name not in PARAM_NAMES]
+    if unknown:
+        raise ValueError(f"Unknown parameters: {unknown}")
+    cells = []
+    for values in itertools.product(*grid.values()):
+        params = IndicatorParams(**dict(zip(names, values)))
+        # Skip cells where the fast average isn't faster than the slow one
+        if params.sma_fast >= params.sma_slow or params.macd_fast >= params.macd_slow:
+            continue
+        cells.append(params)
+    return cells
+
+
+def cell_key(params: IndicatorParams, strategy: dict, start: TimeLike, end: TimeLike, version: str) -> str:
+    spec = {"params": asdict(params), "strategy": strategy, "start": str(start), "end": str(end), "version": version}
+    return hashlib.sha1(json.dumps(spec, sort_keys=True).encode()).hexdigest()
+
+
+def load_results(path: str) -> Dict[str, dict]:
+    results = {}
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    results[record["key"]] = record
+    return results
+
+
+def save_columns(directory: str, columns: Columns) -> None:
+    for name, values in columns.items():
+        np.save(os.path.join(directory, f"{name}.npy"), values)
+
+
+def load_columns(directory: str) -> Columns:
+    # Read-only memory maps: every process mapping them shares the same pages
+    return {
+        name[: -len(".npy")]: np.load(os.path.join(directory, name), mmap_mode="r")
+        for name in os.listdir(directory)
+        if name.endswith(".npy")
+    }
+
+
+# Worker side: the store and a read-only map of the parent's merged bars
+_worker = {}
+
+
+def _init_worker(store_kind: str, store_root: str, strategy: dict, symbols: List[str], bars_dir: str) -> None:
+    _worker.update(store=open_bar_store(store_kind, store_root), strategy=strategy, symbols=symbols, bars=load_columns(bars_dir))
+
+
+def _run_cell(params: dict) -> dict:
+    backtest = Backtest(MacdStrategy(**_worker["strategy"]), _worker["store"], _worker["symbols"], params=IndicatorParams(**params))
+    result = backtest.run(bars=_worker["bars"])
+    return {
+        "total_return": result.total_return,
+        "realized_pl": result.realized_pl,
+        "unrealized_pl": result.unrealized_pl,
+        "max_drawdown": result.max_drawdown,
+        "fills": len(result.trades),
+        "seconds": result.seconds,
+    }
+
+
+def run_sweep(
+    grid: Dict[str, Iterable],
+    strategy: Optional[dict] = None,
+    start: TimeLike = None,
+    end: TimeLike = None,
+    store_kind: str = "columnar",
+    store_root: str = DEFAULT_COLUMNAR_ROOT,
+    cache_path: str = DEFAULT_SWEEP_CACHE,
+    max_workers: Optional[int] = None,
+) -> List[dict]:
+    strategy = strategy or {}
+    store = open_bar_store(store_kind, store_root)
+    version = store.data_version()
+    cells = expand_grid(grid)
+    cached = load_results(cache_path)
+    keys = [cell_key(params, strategy, start, end, version) for params in cells]
+    todo = [(key, params) for key, params in zip(keys, cells) if key not in cached]
+    print(f"{bcolors.OKCYAN}{len(cells)} cells, {len(cells) - len(todo)} cached, running {len(todo)}{bcolors.ENDC}")
+
+    started = time.perf_counter()
+    if todo:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        # Merged once here and mapped by every worker; the symbol ids index `symbols`
+        symbols = store.symbols()
+        bars_dir = tempfile.mkdtemp(prefix="bars-", dir=os.path.dirname(cache_path) or ".")
+        try:
+            save_columns(bars_dir, merge_bars(store, symbols, start, end))
+            with open(cache_path, "a") as out, ProcessPoolExecutor(
+                max_workers=max_workers or os.cpu_count(),
+                initializer=_init_worker,
+                initargs=(store_kind, store_root, strategy, symbols, bars_dir),
+            ) as pool:
+                futures = {pool.submit(_run_cell, asdict(params)): (key, params) for key, params in todo}
+                for done, future in enumerate(as_completed(futures), 1):
+                    key, params = futures[future]
+                    try:
+                        metrics = future.result()
+                    except Exception as e:
+                        print(f"{bcolors.FAIL}Cell {asdict(params)} failed: {e}{bcolors.ENDC}")
+                        continue
+                    record = {"key": key, "params": asdict(params), "version": version, **metrics}
+                    cached[key] = record
+                    # One line per finished cell, so an interrupted sweep keeps its progress
+                    out.write(json.dumps(record) + "\n")
+                    out.flush()
+                    print(f"[{done}/{len(todo)}] {record['total_return']:+.4%} {asdict(params)}")
+        finally:
+            shutil.rmtree(bars_dir, ignore_errors=True)
+        elapsed = time.perf_counter() - started
+        print(f"{bcolors.OKCYAN}Ran {len(todo)} cells in {elapsed:.1f}s ({elapsed / len(todo):.2f}s per cell){bcolors.ENDC}")
+
+    results = [cached[key] for key in keys if key in cached]
+    return sorted(results, key=lambda record: record["total_return"], reverse=True)
+
+
+if __name__ == "__main__":
+    results = run_sweep({
+        "MACD_FAST": [8, 12, 16],
+        "MACD_SLOW": [21, 26, 34],
+        "MACD_SIGNAL": [5, 9],
+        "RSI_PERIOD": [9, 14],
+    })
+    for record in results[:10]:
+        print(f"{record['total_return']:+.4%} drawdown {record['max_drawdown']:.2%} {record['params']}")
@@ -0,0 +1,170 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from indicators import INDICATOR_COLUMNS, IndicatorParams
+from streaming_indicators import MACD, RSI, SMA, IndicatorState, Stochastic
+
+"""
+The O(1) streaming indicators, bar by bar, against talib and pandas (what
+stock_analysis.py computed them with), including the warm-up NaNs.
+
+    python -m pytest -q test_streaming_indicators.py
+"""
+
+talib = pytest.importorskip("talib")
+
+TOLERANCE = 1e-8
+
+
+def random_bars(n: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 0.5, n))
+    spread = rng.random(n)
+    return close + spread, close - spread, close
+
+
+def stream(update, *series) -> np.ndarray:
+    # One update per bar, the value reported after each
+    return np.array([update(*(float(values[i]) for values in series)) for i in range(len(series[0]))], dtype=np.float64)
+
+
+def assert_same(actual: np.ndarray, expected: np.ndarray) -> None:
+    # Same warm-up (NaN where talib/pandas report NaN), same values after it
+    assert actual.shape == expected.shape
+    np.testing.assert_array_equal(np.isnan(actual), np.isnan(expected))
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=TOLERANCE, equal_nan=True)
+
+
+@pytest.mark.parametrize("period", [1, 5, 50, 200])
+def test_sma_matches_pandas_rolling_mean(period):
+    _, _, close = random_bars(500)
+    sma = SMA(period)
+    assert_same(stream(sma.update, close), pd.Series(close).rolling(period).mean().to_numpy())
+
+
+def test_sma_restarts_after_nan_like_pandas():
+    _, _, close = random_bars(120)
+    close[[30, 31, 70]] = np.nan
+    sma = SMA(10)
+    assert_same(stream(sma.update, close), pd.Series(close).rolling(10).mean().to_numpy())
+
+
+@pytest.mark.parametrize("period", [2, 14, 30])
+def test_rsi_matches_talib(period):
+    _, _, close = random_bars(400)
+    rsi = RSI(period)
+    assert_same(stream(rsi.update, close), talib.RSI(close, timeperiod=period))
+
+
+@pytest.mark.parametrize("fast, slow, signal", [(12, 26, 9), (5, 35, 5), (3, 10, 16)])
+def test_macd_matches_talib(fast, slow, signal):
+    _, _, close = random_bars(400)
+    macd = MACD(fast, slow, signal)
+    values = np.array([macd.update(float(x)) for x in close], dtype=np.float64)
+    for actual, expected in zip(values.T, talib.MACD(close, fastperiod=fast, slowperiod=slow, signalperiod=signal)):
+        assert_same(actual, expected)
+
+
+def test_macd_skips_leading_nans_like_talib():
+    _, _, close = random_bars(200)
+    close[:7] = np.nan
+    macd = MACD(12, 26, 9)
+    values = np.array([macd.update(float(x)) for x in close], dtype=np.float64)
+    for actual, expected in zip(values.T, talib.MACD(close, fastperiod=12, slowperiod=26, signalperiod=9)):
+        assert_same(actual, expected)
+
+
+@pytest.mark.parametrize("fastk, slowk, slowd", [(5, 14, 3), (5, 3, 3), (14, 3, 5)])
+def test_stochastic_matches_talib(fastk, slowk, slowd):
+    high, low, close = random_bars(400)
+    stoch = Stochastic(fastk, slowk, slowd)
+    values = np.array([stoch.update(float(h), float(lo), float(c)) for h, lo, c in zip(high, low, close)], dtype=np.float64)
+    expected = talib.STOCH(high, low, close, fastk_period=fastk, slowk_period=slowk, slowd_period=slowd)
+    for actual, wanted in zip(values.T, expected):
+        assert_same(actual, wanted)
+
+
+@pytest.mark.parametrize("n", [0, 1, 2, 14])
+def test_too_few_bars_stay_nan(n):
+    # Shorter than every lookback (the RSI's 14 + 1 is the shortest): nothing reported yet
+    high, low, close = random_bars(n)
+    state = IndicatorState()
+    state.seed(high, low, close)
+    for name in INDICATOR_COLUMNS:
+        assert math.isnan(state.values[name]), name
+
+
+def test_indicator_state_matches_stock_analysis():
+    # Every column the way stock_analysis.py computed it with talib and pandas
+    params = IndicatorParams()
+    high, low, close = random_bars(600, seed=3)
+    rsi = talib.RSI(close, timeperiod=params.rsi_period)
+    macd, signal, hist = talib.MACD(close, fastperiod=params.macd_fast, slowperiod=params.macd_slow, signalperiod=params.macd_signal)
+    stoch_k, stoch_d = talib.STOCH(high, low, close, fastk_period=params.stoch_fastk, slowk_period=params.stoch_k, slowd_period=params.stoch_d)
+    expected = {
+        "sma_f": pd.Series(close).rolling(params.sma_fast).mean().to_numpy(),
+        "sma_s": pd.Series(close).rolling(params.sma_slow).mean().to_numpy(),
+        "rsi": rsi,
+        "sma_r": pd.Series(rsi).rolling(params.rsi_avg_period).mean().to_numpy(),
+        "macd": macd,
+        "macdSignal": signal,
+        "macdHist": hist,
+        "stoch_k": stoch_k,
+        "stoch_d": stoch_d,
+    }
+    state = IndicatorState(params)
+    actual = {name: [] for name in expected}
+    derivs = []
+    for h, lo, c in zip(high, low, close):
+        values = state.update(float(h), float(lo), float(c))
+        for name in expected:
+            actual[name].append(values[name])
+        derivs.append((values["macdHistDeriv"], values["macdHistDeriv2"]))
+    for name, values in expected.items():
+        assert_same(np.array(actual[name]), values)
+
+    # The derivatives use only the bars seen so far: np.gradient of the
+    # histogram up to each bar, evaluated at its last point
+    for i in range(len(hist)):
+        seen = hist[: i + 1]
+        if len(seen) < 2:
+            expected_deriv = expected_deriv2 = math.nan
+        else:
+            gradient = np.gradient(seen)
+            expected_deriv, expected_deriv2 = np.sign(gradient[-1]), np.sign(np.gradient(gradient)[-1])
+        assert_same(np.array(derivs[i]), np.array([expected_deriv, expected_deriv2]))
+
+
+def test_indicator_state_matches_batch():
+    # indicators.compute_indicators over the same bars: every column per bar,
+    # the derivatives (np.gradient looks one bar ahead) at the newest bar only
+    from indicators import compute_indicators, panel_from_frame
+
+    high, low, close = random_bars(500, seed=5)
+    df = pd.DataFrame({"high": high, "low": low, "close": close, "open": close, "volume": 1.0},
+                      index=pd.date_range("2024-07-26 13:30", periods=len(close), freq="min", tz="UTC"))
+    result = compute_indicators(panel_from_frame("", df))
+    state = IndicatorState()
+    actual = {name: [] for name in INDICATOR_COLUMNS}
+    for h, lo, c in zip(high, low, close):
+        for name, value in state.update(float(h), float(lo), float(c)).items():
+            actual[name].append(value)
+    for name in INDICATOR_COLUMNS:
+        if name.startswith("macdHistDeriv"):
+            assert_same(np.array(actual[name][-1:]), result[name][0, -1:])
+        else:
+            assert_same(np.array(actual[name]), result[name][0])
+
+
+def test_flat_prices():
+    # No movement at all: talib's RSI and STOCH report 0 rather than NaN
+    close = np.full(100, 10.0)
+    rsi = RSI(14)
+    assert_same(stream(rsi.update, close), talib.RSI(close, timeperiod=14))
+    stoch = Stochastic(5, 14, 3)
+    values = np.array([stoch.update(10.0, 10.0, 10.0) for _ in close], dtype=np.float64)
+    for actual, expected in zip(values.T, talib.STOCH(close, close, close, fastk_period=5, slowk_period=14, slowd_period=3)):
+        assert_same(actual, expected)
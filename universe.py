@@ -0,0 +1,197 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+"""
+Columnar view of the stock screener payload, with vectorized filtering and ranking.
+
+The payload (a list of dicts from the FMP screener) is turned into one numpy
+array per field once; predicates are boolean masks over those arrays, combined
+with &, | and ~, and ranking is a single lexsort. Masks are cached per
+predicate and selections per UniverseSpec, so re-filtering the same payload
+every cycle is a dict lookup.
+"""
+
+NUMERIC_FIELDS = ("price", "volume", "marketCap", "beta", "lastAnnualDividend")
+TEXT_FIELDS = ("symbol", "exchangeShortName", "sector", "country")
+FLAG_FIELDS = ("isEtf", "isFund", "isActivelyTrading")
+
+
+class ScreenerTable:
+    def __init__(self, columns: Dict[str, np.ndarray], payload: Optional[List[dict]] = None) -> None:
+        # payload: the rows, for building columns of other fields on first use
+        self.columns = columns
+        self.payload = payload
+        self.masks: Dict[tuple, np.ndarray] = {}
+        self.selections: Dict["UniverseSpec", List[str]] = {}
+
+    @classmethod
+    def from_payload(cls, payload: List[dict]) -> "ScreenerTable":
+        columns = {}
+        for field in NUMERIC_FIELDS:
+            # Missing values (None) become NaN and rank last
+            columns[field] = np.array([row.get(field) for row in payload], dtype=np.float64)
+        for field in TEXT_FIELDS:
+            columns[field] = np.array([row.get(field) or "" for row in payload], dtype=str)
+        for field in FLAG_FIELDS:
+            columns[field] = np.array([bool(row.get(field)) for row in payload], dtype=bool)
+        return cls(columns, payload)
+
+    def __len__(self) -> int:
+        return len(self.columns["symbol"])
+
+    def __getitem__(self, field: str) -> np.ndarray:
+        values = self.columns.get(field)
+        if values is None:
+            values = self.columns[field] = self._extra_column(field)
+        return values
+
+    def _extra_column(self, field: str) -> np.ndarray:
+        # Any other screener field (companyName, industry, ...): numbers as
+        # float64 (NaN when missing), anything else compared as text
+        if self.payload is None or not any(field in row for row in self.payload):
+            raise ValueError(f"Unknown screener field {field!r}, known: {sorted(self.columns)}")
+        values = [row.get(field) for row in self.payload]
+        if all(value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values):
+            return np.array(values, dtype=np.float64)
+        return np.array(["" if value is None else str(value) for value in values], dtype=str)
+
+    def mask(self, predicate: "Predicate") -> np.ndarray:
+        mask = self.masks.get(predicate.key)
+        if mask is None:
+            mask = self.masks[predicate.key] = predicate.evaluate(self)
+        return mask
+
+    def rank(self, by: Tuple[str, ...] = ("volume",), ascending: Tuple[str, ...] = (), mask: Optional[np.ndarray] = None, top_k: Optional[int] = None) -> np.ndarray:
+        # Row indices ordered by the keys in `by` (descending unless listed in
+        # `ascending`); ties keep payload order, like sorted(..., reverse=True)
+        rows = np.arange(len(self)) if mask is None else np.flatnonzero(mask)
+        keys = []
+        for field in reversed(by):
+            values = self[field][rows]
+            if not np.issubdtype(values.dtype, np.number):
+                # Text and flags: rank by their sorted order
+                values = np.unique(values, return_inverse=True)[1]
+            keys.append(values if field in ascending else -values)
+        order = rows[np.lexsort(keys)] if keys else rows
+        return order if top_k is None else order[:top_k]
+
+    def symbols(self, rows: np.ndarray) -> List[str]:
+        return self.columns["symbol"][rows].tolist()
+
+    def select(self, spec: "UniverseSpec") -> List[str]:
+        symbols = self.selections.get(spec)
+        if symbols is None:
+            rows = self.rank(spec.rank_by, spec.ascending, self.mask(spec.predicate()), spec.top_k)
+            symbols = self.selections[spec] = self.symbols(rows)
+        return symbols
+
+
+class Predicate:
+    """A boolean mask over a ScreenerTable; `key` identifies it for caching."""
+
+    def __init__(self, key: tuple, evaluate: Callable[[ScreenerTable], np.ndarray]) -> None:
+        self.key = key
+        self.evaluate = evaluate
+
+    def __call__(self, table: ScreenerTable) -> np.ndarray:
+        return table.mask(self)
+
+    def __and__(self, other: "Predicate") -> "Predicate":
+        return Predicate(("and", self.key, other.key), lambda table: table.mask(self) & table.mask(other))
+
+    def __or__(self, other: "Predicate") -> "Predicate":
+        return Predicate(("or", self.key, other.key), lambda table: table.mask(self) | table.mask(other))
+
+    def __invert__(self) -> "Predicate":
+        return Predicate(("not", self.key), lambda table: ~table.mask(self))
+
+
+def everything() -> Predicate:
+    return Predicate(("all",), lambda table: np.ones(len(table), dtype=bool))
+
+
+def exchange_in(exchanges: Tuple[str, ...]) -> Predicate:
+    exchanges = tuple(sorted(exchanges))
+    return Predicate(("exchange_in", exchanges), lambda table: np.isin(table["exchangeShortName"], exchanges))
+
+
+def flag(field: str) -> Predicate:
+    return Predicate(("flag", field), lambda table: table[field])
+
+
+def between(field: str, low: Optional[float] = None, high: Optional[float] = None) -> Predicate:
+    def evaluate(table: ScreenerTable) -> np.ndarray:
+        values = table[field]
+        mask = ~np.isnan(values)
+        if low is not None:
+            mask &= values >= low
+        if high is not None:
+            mask &= values <= high
+        return mask
+
+    return Predicate(("between", field, low, high), evaluate)
+
+
+def symbol_excludes(chars: str) -> Predicate:
+    # Class shares etc. ("BRK-B", "BF.A") don't go through the data API as is
+    def evaluate(table: ScreenerTable) -> np.ndarray:
+        mask = np.ones(len(table), dtype=bool)
+        for char in chars:
+            mask &= np.char.find(table["symbol"], char) < 0
+        return mask
+
+    return Predicate(("symbol_excludes", chars), evaluate)
+
+
+def max_symbol_length(length: int) -> Predicate:
+    return Predicate(("max_symbol_length", length), lambda table: np.char.str_len(table["symbol"]) <= length)
+
+
+@dataclass(frozen=True)
+class UniverseSpec:
+    exchanges: Optional[Tuple[str, ...]] = None
+    exclude_etfs: bool = False
+    exclude_funds: bool = False
+    excluded_chars: str = "-."
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    min_volume: Optional[float] = None
+    rank_by: Tuple[str, ...] = ("volume",)
+    ascending: Tuple[str, ...] = ()
+    top_k: Optional[int] = None
+
+    def predicate(self) -> Predicate:
+        predicate = everything()
+        if self.exchanges is not None:
+            predicate &= exchange_in(self.exchanges)
+        if self.exclude_etfs:
+            predicate &= ~flag("isEtf")
+        if self.exclude_funds:
+            predicate &= ~flag("isFund")
+        if self.excluded_chars:
+            predicate &= symbol_excludes(self.excluded_chars)
+        if self.min_price is not None or self.max_price is not None:
+            predicate &= between("price", self.min_price, self.max_price)
+        if self.min_volume is not None:
+            predicate &= between("volume", self.min_volume)
+        return predicate
+
+
+_last_table: Tuple[Optional[List[dict]], Optional[ScreenerTable]] = (None, None)
+
+
+def table_for(payload: List[dict]) -> ScreenerTable:
+    # The screener cache hands back the same list until it refreshes, so one
+    # table (and its cached masks/selections) is kept for the latest payload
+    global _last_table
+    last_payload, table = _last_table
+    if payload is not last_payload or table is None:
+        table = ScreenerTable.from_payload(payload)
+        _last_table = (payload, table)
+    return table
+
+
+def select_universe(payload: List[dict], spec: UniverseSpec = UniverseSpec()) -> List[str]:
+    return table_for(payload).select(spec)